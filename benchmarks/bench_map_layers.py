@@ -0,0 +1,151 @@
+"""Benchmark of the map layers: markers against clustering, PolyLines against one GeoJSON line.
+
+Builds the same folium map from synthetic detections twice: once with one
+folium.Marker per row (the behaviour below the cluster threshold) and once
+with the FastMarkerCluster layers. The IRI track of a synthetic drive is
+drawn both as one folium.PolyLine per run of equal quality class (the
+previous implementation, kept here) and as the single GeoJSON layer. Each
+case reports build and render time and the size of the HTML sent to the
+browser.
+
+The viewport section loads datasets of growing size into ViewportLayers and
+times the feature group for one 1600 x 1000 pixel view at street zoom and at
+city zoom, with its size as st_folium sends it. That payload should stay
+about the same whatever the dataset size.
+
+    python benchmarks/bench_map_layers.py
+    python benchmarks/bench_map_layers.py --sizes 1000 5000 20000 --km 10 100
+    python benchmarks/bench_map_layers.py --viewport-sizes 10000 100000 1000000
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from streamlit_folium import _get_feature_group_string
+from utils.map_layers import IRI_BREAKS, IRI_COLORS, IRI_QUALITIES, add_iri_line, add_pothole_markers, add_vehicle_markers
+from utils.viewport import ViewportLayers, approximate_bounds
+
+
+# n_rows vehicles and n_rows potholes scattered over about 10 x 10 km around Manila
+def make_detections(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    vehicles = pd.DataFrame({
+        'latitude': 14.5995 + rng.uniform(-0.05, 0.05, n_rows),
+        'longitude': 120.9842 + rng.uniform(-0.05, 0.05, n_rows),
+        'vehicle_type': rng.choice(['car', 'truck', 'motorcycle'], n_rows)
+    })
+    potholes = pd.DataFrame({
+        'latitude': 14.5995 + rng.uniform(-0.05, 0.05, n_rows),
+        'longitude': 120.9842 + rng.uniform(-0.05, 0.05, n_rows),
+        'image_path': [f'frame_{i:06d}.jpg' for i in range(n_rows)],
+        'confidence_score': rng.uniform(0.3, 1.0, n_rows)
+    })
+    return vehicles, potholes
+
+
+# Sliding-window IRI profile points every `step` meters along a winding road of `km` kilometres
+def make_track(km, step=5.0, seed=0):
+    rng = np.random.default_rng(seed)
+    count = int(km * 1000 / step)
+    heading = np.cumsum(rng.normal(0, 0.02, count))
+    lats = 14.5995 + np.degrees(np.cumsum(step * np.cos(heading)) / 6371000)
+    lons = 120.9842 + np.degrees(np.cumsum(step * np.sin(heading)) / 6371000 / np.cos(np.radians(14.5995)))
+    iri = 4.5 + np.convolve(rng.normal(0, 8, count), np.ones(20) / 20, mode='same')
+    return lats, lons, np.clip(iri, 0.5, None)
+
+
+# Previous IRI layer: one folium.PolyLine with its own popup per run of equal quality class
+def add_polyline_runs(m, lats, lons, iri):
+    quality_class = np.digitize(iri, IRI_BREAKS, right=True)
+    run_starts = np.flatnonzero(np.diff(quality_class, prepend=-1))
+    run_ends = np.append(run_starts[1:], len(quality_class))
+    for start, end in zip(run_starts, run_ends):
+        stop = min(end + 1, len(lats))
+        if stop - start < 2:
+            continue
+        run_class = quality_class[start]
+        folium.PolyLine(
+            locations=np.column_stack([lats[start:stop], lons[start:stop]]).tolist(),
+            popup=f'IRI: {iri[start:end].min():.2f}-{iri[start:end].max():.2f}<br>Quality: {IRI_QUALITIES[run_class]}',
+            color=IRI_COLORS[run_class],
+            weight=6,
+            opacity=0.8
+        ).add_to(m)
+
+
+# (build seconds, render seconds, HTML bytes) of a map with the layers added by add_layers(m)
+def build_map(add_layers):
+    gc.collect()        # do not charge one map for collecting the previous one
+    start = time.perf_counter()
+    m = folium.Map(location=[14.5995, 120.9842], zoom_start=15)
+    add_layers(m)
+    built = time.perf_counter()
+    html = m.get_root().render()
+    rendered = time.perf_counter()
+    return built - start, rendered - built, len(html.encode())
+
+
+# (query + build seconds, render seconds, payload bytes, summary) of the feature group for one view
+def build_view(layers, zoom):
+    gc.collect()
+    start = time.perf_counter()
+    group, summary = layers.feature_group(approximate_bounds(14.5995, 120.9842, zoom), zoom)
+    built = time.perf_counter()
+    payload = _get_feature_group_string(group, folium.Map(location=[14.5995, 120.9842], zoom_start=zoom))
+    rendered = time.perf_counter()
+    return built - start, rendered - built, len(payload.encode()), summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--threshold', type=int, default=500, help="cluster threshold for the clustered run")
+    parser.add_argument('--km', type=float, nargs='+', default=[10, 100], help="lengths of the IRI tracks")
+    parser.add_argument('--viewport-sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="rows per layer (and IRI profile points) for the viewport section")
+    parser.add_argument('--zooms', type=int, nargs='+', default=[16, 12], help="zoom levels of the viewport section")
+    args = parser.parse_args()
+
+    print(f"{'rows/layer':>10} {'mode':>10} {'build (s)':>10} {'render (s)':>11} {'HTML (MB)':>10}")
+    with tempfile.TemporaryDirectory() as images_base_path:
+        for n_rows in args.sizes:
+            vehicles, potholes = make_detections(n_rows)
+            for mode, threshold in (('markers', float('inf')), ('clustered', args.threshold)):
+                build, render, size = build_map(lambda m: (
+                    add_vehicle_markers(m, vehicles, threshold),
+                    add_pothole_markers(m, potholes, images_base_path, cluster_threshold=threshold)))
+                print(f"{n_rows:>10} {mode:>10} {build:>10.2f} {render:>11.2f} {size / 1024 / 1024:>10.2f}")
+
+    print(f"\n{'IRI km':>10} {'mode':>10} {'build (s)':>10} {'render (s)':>11} {'HTML (MB)':>10}")
+    for km in args.km:
+        lats, lons, iri = make_track(km)
+        for mode, add_line in (('polylines', add_polyline_runs), ('geojson', add_iri_line)):
+            build, render, size = build_map(lambda m: add_line(m, lats, lons, iri))
+            print(f"{km:>10g} {mode:>10} {build:>10.2f} {render:>11.2f} {size / 1024 / 1024:>10.2f}")
+
+    print(f"\n{'rows/layer':>10} {'zoom':>5} {'index (s)':>10} {'view (s)':>9} {'render (s)':>11} {'payload (KB)':>13}  in view")
+    with tempfile.TemporaryDirectory() as images_base_path:
+        for n_rows in args.viewport_sizes:
+            vehicles, potholes = make_detections(n_rows)
+            track = make_track(n_rows * 5 / 1000)
+            start = time.perf_counter()
+            layers = ViewportLayers(track, vehicles, potholes, images_base_path)
+            index_seconds = time.perf_counter() - start
+            for zoom in args.zooms:
+                build, render, size, summary = build_view(layers, zoom)
+                in_view = ', '.join(f"{layer} {counts['in_view']}{'*' if counts['aggregated'] else ''}"
+                                    for layer, counts in summary.items())
+                print(f"{n_rows:>10} {zoom:>5} {index_seconds:>10.2f} {build:>9.2f} {render:>11.2f} {size / 1024:>13.0f}  {in_view}")
+    print("* aggregated into grid cells")
+
+
+if __name__ == '__main__':
+    main()
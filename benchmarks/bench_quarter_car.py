@@ -0,0 +1,96 @@
+"""Benchmark of the quarter-car (Golden Car) IRI against the RMS method, per km of road.
+
+Both methods start from the same preprocessed synthetic drive. The quarter-car
+simulation is also checked against the textbook per-sample loop
+(Z = ST @ Z + PR * slope), which is timed on a shorter stretch.
+
+    python benchmarks/bench_quarter_car.py
+    python benchmarks/bench_quarter_car.py --km 5 50 --loop-max-km 5
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import quarter_car
+from utils.iri_calculator import IRICalculator
+
+
+# Per-sample quarter-car loop from the ASTM E1926 / Sayers listing, kept here as the reference
+def loop_rectified_slope(slope, dx):
+    ST, PR = quarter_car.state_transition(dx)
+    PR = PR.ravel()
+    initial = np.mean(slope[:max(1, int(round(quarter_car.INITIAL_LENGTH / dx)))])
+    Z = np.array([initial, 0.0, initial, 0.0])
+    rectified = np.empty(len(slope))
+    for i, value in enumerate(slope):
+        Z = ST @ Z + PR * value
+        rectified[i] = abs(Z[0] - Z[2])
+    return rectified
+
+
+# Preprocessed synthetic 100 Hz drive of about `km` kilometres at 40-70 km/h
+def make_drive(km, seed=0):
+    rng = np.random.default_rng(seed)
+    n_rows = int(km * 1000 / 15.0 * 100)
+    time_s = np.arange(n_rows) / 100.0
+    speed = 15.0 + 4.0 * np.sin(2 * np.pi * time_s / 120)
+    az = rng.normal(0, 0.8, n_rows) + 0.5 * np.sin(2 * np.pi * 1.4 * time_s)
+    return pd.DataFrame({'time': time_s, 'ax': rng.normal(0, 0.3, n_rows), 'ay': rng.normal(0, 0.3, n_rows),
+                         'az': az, 'latitude': 14.5995, 'longitude': 120.9842, 'speed': speed})
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--km', type=float, nargs='+', default=[5, 50])
+    parser.add_argument('--segment-length', type=float, default=100)
+    parser.add_argument('--sample-interval', type=float, default=quarter_car.BASE_LENGTH)
+    parser.add_argument('--loop-max-km', type=float, default=5,
+                        help="time the per-sample loop on at most this many km")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    calc = IRICalculator()
+    dx = args.sample_interval
+    print(f"{'km':>6} {'RMS (ms/km)':>12} {'quarter-car (ms/km)':>20} {'loop (ms/km)':>13} "
+          f"{'loop speedup':>13} {'max rel diff':>13}")
+
+    for km in args.km:
+        df = make_drive(km)
+        rms_time, _ = best_time(lambda: calc.calculate_iri_rms_method(df, args.segment_length), args.repeat)
+        qc_time, _ = best_time(lambda: calc.calculate_iri_quarter_car_method(df, args.segment_length, dx),
+                               args.repeat)
+
+        # Simulation step alone: vectorized filter against the per-sample loop on the same slope
+        distance = np.cumsum(df['speed'].to_numpy()) / 100.0
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, slope = quarter_car.profile_slope(distance, df['az'].to_numpy() - df['az'].mean(),
+                                                 df['speed'].to_numpy(), dx)
+        slope = slope[:int(min(km, args.loop_max_km) * 1000 / dx)]
+        loop_km = len(slope) * dx / 1000
+        sim_time, fast = best_time(lambda: quarter_car.rectified_slope(slope, dx), args.repeat)
+        loop_time, reference = best_time(lambda: loop_rectified_slope(slope, dx), 1)
+        max_diff = np.max(np.abs(fast - reference)) / np.max(reference)
+
+        print(f"{km:>6g} {rms_time / km * 1000:>12.2f} {qc_time / km * 1000:>20.2f} "
+              f"{loop_time / loop_km * 1000:>13.1f} {loop_time / sim_time:>12.0f}x {max_diff:>13.1e}")
+
+
+if __name__ == '__main__':
+    main()
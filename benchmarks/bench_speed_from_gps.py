@@ -0,0 +1,72 @@
+"""Benchmark for IRICalculator.calculate_speed_from_gps.
+
+Compares the vectorized haversine path against the original row-by-row loop
+on synthetic GPS tracks and checks that both produce the same speeds.
+
+    python benchmarks/bench_speed_from_gps.py
+    python benchmarks/bench_speed_from_gps.py --sizes 10000 100000 --legacy-max-rows 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.iri_calculator import IRICalculator
+from reference import speed_from_gps as legacy_speed_from_gps
+
+
+# Synthetic 100 Hz drive with occasional repeated timestamps
+def make_track(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    time_s = np.arange(n_rows) / 100.0
+    repeated = np.flatnonzero(rng.random(n_rows) < 0.01)
+    repeated = repeated[repeated > 0]
+    time_s[repeated] = time_s[repeated - 1]          # duplicate timestamps -> zero dt
+    heading = np.cumsum(rng.normal(0, 0.001, n_rows))
+    step = 15.0 / 100.0                              # 15 m/s
+    north = np.cumsum(step * np.cos(heading))
+    east = np.cumsum(step * np.sin(heading))
+    lat = 14.5995 + np.degrees(north / 6371000)
+    lon = 120.9842 + np.degrees(east / (6371000 * np.cos(np.radians(14.5995))))
+    return pd.DataFrame({'time': time_s, 'latitude': lat, 'longitude': lon})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max-rows', type=int, default=None,
+                        help="skip the legacy loop above this many rows (it takes minutes at 1M)")
+    parser.add_argument('--repeat', type=int, default=3, help="repeats for the vectorized path")
+    args = parser.parse_args()
+
+    calc = IRICalculator()
+    print(f"{'rows':>10} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>10} {'max abs diff':>14}")
+
+    for n_rows in args.sizes:
+        df = make_track(n_rows)
+
+        fast_time = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fast = calc.calculate_speed_from_gps(df)
+            fast_time = min(fast_time, time.perf_counter() - start)
+
+        if args.legacy_max_rows is not None and n_rows > args.legacy_max_rows:
+            print(f"{n_rows:>10} {'skipped':>12} {fast_time:>15.4f} {'-':>10} {'-':>14}")
+            continue
+
+        start = time.perf_counter()
+        legacy = legacy_speed_from_gps(df)
+        legacy_time = time.perf_counter() - start
+
+        max_diff = np.nanmax(np.abs(fast - legacy))
+        print(f"{n_rows:>10} {legacy_time:>12.2f} {fast_time:>15.4f} "
+              f"{legacy_time / fast_time:>9.0f}x {max_diff:>14.2e}")
+
+
+if __name__ == '__main__':
+    main()
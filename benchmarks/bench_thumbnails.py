@@ -0,0 +1,107 @@
+"""Benchmark of the pothole thumbnails: page payload and pre-generation throughput.
+
+Writes synthetic camera frames (noisy 1920 x 1080 JPEGs of about the size of
+real detection frames) to a temporary folder. For one sidebar page of frames
+it compares what is sent to the browser before and after thumbnails: the map
+popups (full frame against a POPUP_SIZE thumbnail, both base64 in the popup
+HTML) plus the sidebar images (full frame against a SIDEBAR_SIZE thumbnail).
+Then it times ThumbnailCache.pregenerate for every frame on a cold cache with
+each worker count, and once more on the warm cache.
+
+    python benchmarks/bench_thumbnails.py
+    python benchmarks/bench_thumbnails.py --frames 200 --workers 1 2 4 8
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.map_layers import add_pothole_markers
+from utils.thumbnails import POPUP_SIZE, SIDEBAR_SIZE, ThumbnailCache
+
+
+# `count` JPEG frames of smooth shapes plus sensor noise; returns their file names
+def make_frames(folder, count, width=1920, height=1080, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    names = []
+    for i in range(count):
+        base = 128 + 60 * np.sin(x / rng.uniform(40, 200) + y / rng.uniform(40, 200))
+        frame = base[..., None] + rng.normal(0, 6, (height, width, 3))
+        name = f'frame_{i:06d}.jpg'
+        Image.fromarray(np.clip(frame, 0, 255).astype(np.uint8)).save(os.path.join(folder, name), quality=90)
+        names.append(name)
+    return names
+
+
+# Bytes of the map HTML with one pothole marker per frame, all on the current page
+def popup_bytes(names, images_base_path, thumbnails):
+    potholes = pd.DataFrame({
+        'latitude': 14.5995 + np.arange(len(names)) * 1e-4,
+        'longitude': np.full(len(names), 120.9842),
+        'image_path': names,
+        'confidence_score': np.full(len(names), 0.9)
+    })
+    m = folium.Map(location=[14.5995, 120.9842], zoom_start=15)
+    add_pothole_markers(m, potholes, images_base_path, page=0, page_size=len(names), thumbnails=thumbnails)
+    return len(m.get_root().render().encode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=40, help="frames to pre-generate thumbnails for")
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as images_dir, tempfile.TemporaryDirectory() as cache_dir:
+        print(f"Writing {args.frames} synthetic frames...")
+        names = make_frames(images_dir, args.frames)
+        paths = [os.path.join(images_dir, name) for name in names]
+        page = names[:args.page_size]
+        page_paths = paths[:args.page_size]
+        thumbnails = ThumbnailCache(cache_dir)
+
+        # Previous popups embedded the whole file; an encoder that only base64-encodes its input stands in
+        class FullFrames:
+            def base64(self, source, size):
+                with open(source, 'rb') as f:
+                    return base64.b64encode(f.read()).decode()
+
+        before_popups = popup_bytes(page, images_dir, FullFrames())
+        before_sidebar = sum(os.path.getsize(path) for path in page_paths)
+        after_popups = popup_bytes(page, images_dir, thumbnails)
+        after_sidebar = sum(len(thumbnails.bytes(path, SIDEBAR_SIZE)) for path in page_paths)
+        before = before_popups + before_sidebar
+        after = after_popups + after_sidebar
+
+        print(f"\nPage of {len(page)} frames, mean frame {before_sidebar / len(page) / 1024:.0f} KB "
+              f"(thumbnails {POPUP_SIZE} and {SIDEBAR_SIZE} px)")
+        print(f"{'':>12} {'popups (KB)':>12} {'sidebar (KB)':>13} {'total (KB)':>11}")
+        print(f"{'full frames':>12} {before_popups / 1024:>12.0f} {before_sidebar / 1024:>13.0f} {before / 1024:>11.0f}")
+        print(f"{'thumbnails':>12} {after_popups / 1024:>12.0f} {after_sidebar / 1024:>13.0f} {after / 1024:>11.0f}")
+        print(f"{before / after:.1f}x smaller")
+
+        print(f"\n{'workers':>8} {'cache':>6} {'seconds':>8} {'frames/s':>9}")
+        for workers in args.workers:
+            thumbnails.clear()
+            start = time.perf_counter()
+            thumbnails.pregenerate(paths, workers=workers)
+            seconds = time.perf_counter() - start
+            print(f"{workers:>8} {'cold':>6} {seconds:>8.2f} {len(paths) / seconds:>9.1f}")
+        start = time.perf_counter()
+        thumbnails.pregenerate(paths, workers=args.workers[-1])
+        seconds = time.perf_counter() - start
+        print(f"{args.workers[-1]:>8} {'warm':>6} {seconds:>8.2f} {len(paths) / seconds:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Reference implementations of the IRICalculator stages, as originally written.
+
+These are the straightforward per-row and per-segment versions that the
+vectorized code in utils/iri_calculator.py replaced. They are slow and are
+kept only so the benchmarks can check that optimized stages still produce
+the same numbers (``run_benchmarks.py --check``). Do not optimize them.
+"""
+from math import atan2, cos, radians, sin, sqrt
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+from scipy.integrate import cumulative_trapezoid
+
+# Largest difference allowed by the equivalence check, relative to the largest reference value.
+# Optimized stages may reorder floating point operations (the filter now runs as second-order
+# sections, for example), but should not move results by more than rounding.
+TOLERANCES = {
+    'preprocess': 1e-12,
+    'speed_from_gps': 1e-9,
+    'filter': 1e-9,
+    'orientation': 1e-9,
+    'segments': 1e-9,
+    'rms_method': 1e-9
+}
+
+
+def preprocess_data(df):
+    processed_df = pd.DataFrame()
+    processed_df['time'] = pd.to_datetime(df['time']).astype('int64')/1e9
+    processed_df['time'] = processed_df['time'] - processed_df['time'].iloc[0]
+
+    processed_df['ax'] = pd.to_numeric(df['ax'], errors='coerce')
+    processed_df['ay'] = pd.to_numeric(df['ay'], errors='coerce')
+    processed_df['az'] = pd.to_numeric(df['az'], errors='coerce')
+
+    if all(col in df.columns for col in ['latitude', 'longitude', 'speed']):
+        processed_df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
+        processed_df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
+        processed_df['speed'] = pd.to_numeric(df['speed'], errors='coerce')
+        processed_df['altitude'] = pd.to_numeric(df['altitude'], errors='coerce') if 'altitude' in df.columns else None
+
+    if all(col in df.columns for col in ['wx', 'wy','wz']):
+        processed_df['wx'] = pd.to_numeric(df['wx'], errors='coerce')
+        processed_df['wy'] = pd.to_numeric(df['wy'], errors='coerce')
+        processed_df['wz'] = pd.to_numeric(df['wz'], errors='coerce')
+
+    processed_df = processed_df.dropna(subset=['time', 'ax', 'ay', 'az'])
+    processed_df = processed_df.sort_values('time').reset_index(drop=True)
+    duration = processed_df['time'].iloc[-1] - processed_df['time'].iloc[0]
+    return processed_df, duration
+
+
+def speed_from_gps(df):
+    speeds = []
+    for i in range(len(df)):
+        if i == 0:
+            speeds.append(0)
+        else:
+            lat1, lon1 = radians(df.iloc[i-1]['latitude']), radians(df.iloc[i-1]['longitude'])
+            lat2, lon2 = radians(df.iloc[i]['latitude']), radians(df.iloc[i]['longitude'])
+            dlat = lat2 - lat1
+            dlon = lon2 - lon1
+            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+            c = 2*atan2(sqrt(a), sqrt(1-a))
+            distance = 6371000 * c
+            dt = df.iloc[i]['time'] - df.iloc[i-1]['time']
+            if dt > 0:
+                speeds.append(distance/dt)
+            else:
+                speeds.append(speeds[-1] if speeds else 0)
+    return np.array(speeds)
+
+
+def filter_accelerometer_data(df, cutoff_freq=10, sampling_rate=None):
+    if sampling_rate is None:
+        sampling_rate = 1.0/np.median(np.diff(df['time']))
+
+    nyquist = sampling_rate / 2
+    if cutoff_freq >= nyquist:
+        cutoff_freq = nyquist * 0.9
+    b, a = signal.butter(4, cutoff_freq / nyquist, btype = 'low')
+
+    df_filtered = df.copy()
+    df_filtered['ax_filtered'] = signal.filtfilt(b, a, df['ax'])
+    df_filtered['ay_filtered'] = signal.filtfilt(b, a, df['ay'])
+    df_filtered['az_filtered'] = signal.filtfilt(b, a, df['az'])
+    return df_filtered, sampling_rate
+
+
+def correct_orientation(df):
+    ax, ay , az = df['ax_filtered'].values, df['ay_filtered'].values, df['az_filtered'].values
+    wx, wy = df['wx'].values, df['wy'].values
+
+    dt = np.median(np.diff(df['time']))
+    angles_x = cumulative_trapezoid(wx, dx=dt, initial = 0)
+    angles_y = cumulative_trapezoid(wy, dx=dt, initial = 0)
+
+    return az * np.cos(angles_x) * np.cos(angles_y) + ay * np.sin(angles_x) - ax * np.sin(angles_y)
+
+
+# List of per-segment dicts, one argmin over the whole distance array per boundary
+def create_segments(distance, vertical_accel, speed, segment_length):
+    segments = []
+    for start_dist in np.arange(0, distance[-1] - segment_length, segment_length):
+        end_dist = start_dist + segment_length
+        start_idx = np.argmin(np.abs(distance - start_dist))
+        end_idx = np.argmin(np.abs(distance - end_dist))
+
+        if end_idx > start_idx:
+            segments.append({
+                'distance_start': start_dist,
+                'distance_end': end_dist,
+                'vertical_accel': vertical_accel[start_idx:end_idx],
+                'speed': speed[start_idx:end_idx],
+                'length': segment_length,
+                'center_index': start_idx + (end_idx - start_idx) // 2
+            })
+    return segments
+
+
+def segment_iri(segment):
+    mean_speed = np.mean(segment['speed'])
+    rms_accel = np.sqrt(np.mean(segment['vertical_accel']**2))
+    return 80.59 * rms_accel / mean_speed if mean_speed > 0 else 0
+
+
+def calculate_iri_rms_method(df, segment_length=100):
+    df_filtered, sampling_rate = filter_accelerometer_data(df)
+    if all(col in df_filtered.columns for col in ['wx', 'wy', 'wz']):
+        vertical_accel = correct_orientation(df_filtered)
+    else:
+        vertical_accel = df_filtered['az_filtered'].values
+
+    speed = df_filtered['speed'].values if 'speed' in df_filtered.columns else speed_from_gps(df_filtered)
+    vertical_accel_corrected = vertical_accel - np.mean(vertical_accel)
+    distance = cumulative_trapezoid(speed, df_filtered['time'].values, initial = 0)
+
+    segments = create_segments(distance, vertical_accel_corrected, speed, segment_length)
+    return np.array([segment_iri(segment) for segment in segments]), segments
@@ -0,0 +1,284 @@
+"""Benchmark suite for the IRICalculator stages, with a stored baseline and regression check.
+
+Times preprocess_data, calculate_speed_from_gps, filter_accelerometer_data,
+_correct_orientation, _create_segments and calculate_iri_rms_method on
+synthetic drives (utils/synthetic.py) of several sizes. For each stage and
+size it records the median wall time over at least --repeat runs (fast stages
+are repeated for half a second) with its spread (scaled median absolute
+deviation), the throughput in rows/s and the peak traced memory (one extra
+run under tracemalloc, see utils/instrumentation.py).
+
+The results are compared with a JSON baseline recorded on the same machine.
+A stage is slower when its median time exceeds the baseline median by more
+than --threshold, by more than --noise times the two spreads combined and by
+more than --min-seconds, so run-to-run jitter is not reported. Timings are
+advisory: slowdowns are printed but only fail with --strict. Peak memory is
+deterministic and fails when it grows by more than --memory-threshold (and
+--min-mb). With --check (the default), each stage is also run against the
+original implementations in benchmarks/reference.py on a short drive and its
+output must match within reference.TOLERANCES. The exit status is 1 if an
+output differs or memory regressed (or, with --strict, a stage is slower).
+
+    python benchmarks/run_benchmarks.py --save                # record benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py                       # compare against it
+    python benchmarks/run_benchmarks.py --strict --repeat 11  # also fail on slowdowns
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 --threshold 0.5 --no-check
+
+Timings depend on the machine and its load, so baseline.json is not committed:
+record one before changing code and compare against it afterwards, on the same
+machine.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import scipy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.iri_calculator import FILTERED_AXES, IRICalculator
+from utils.instrumentation import RunReport
+from utils.synthetic import CSV_COLUMNS, synthesize_run
+import reference
+
+STAGES = ['preprocess', 'speed_from_gps', 'filter', 'orientation', 'segments', 'rms_method']
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SAMPLING_RATE = 100.0
+SEGMENT_LENGTH = 100
+
+
+# Inputs of every stage for a synthetic drive of n_rows samples: the raw frame as load_data
+# returns it (datetime time column), and the outputs of the stages before each one
+def make_inputs(n_rows, seed=0):
+    run, _ = synthesize_run(duration=(n_rows - 1) / SAMPLING_RATE, sampling_rate=SAMPLING_RATE, seed=seed)
+    raw = pd.DataFrame({col: run[col] for col in CSV_COLUMNS})
+    raw['time'] = pd.to_datetime(run['start_time'] + run['time'], unit='s')
+
+    calc = IRICalculator()
+    with contextlib.redirect_stdout(io.StringIO()):
+        processed, _ = calc.preprocess_data(raw)
+        filtered, _ = calc.filter_accelerometer_data(processed)
+        vertical = calc._correct_orientation(filtered)
+    speed = np.asarray(processed['speed'], dtype=float)
+    distance = calc.calculate_distance(np.asarray(processed['time']), speed)
+    return {'raw': raw, 'processed': processed, 'filtered': filtered,
+            'vertical': vertical - np.mean(vertical), 'speed': speed, 'distance': distance}
+
+
+# Zero-argument callables per stage, for the current implementation and for the reference one
+def stage_calls(calc, inputs):
+    raw, processed, filtered = inputs['raw'], inputs['processed'], inputs['filtered']
+    distance, vertical, speed = inputs['distance'], inputs['vertical'], inputs['speed']
+    return {
+        'preprocess': (lambda: calc.preprocess_data(raw),
+                       lambda: reference.preprocess_data(raw)),
+        'speed_from_gps': (lambda: calc.calculate_speed_from_gps(processed),
+                           lambda: reference.speed_from_gps(processed)),
+        'filter': (lambda: calc.filter_accelerometer_data(processed),
+                   lambda: reference.filter_accelerometer_data(processed)),
+        'orientation': (lambda: calc._correct_orientation(filtered),
+                        lambda: reference.correct_orientation(filtered)),
+        'segments': (lambda: calc._create_segments(distance, vertical, speed, SEGMENT_LENGTH),
+                     lambda: reference.create_segments(distance, vertical, speed, SEGMENT_LENGTH)),
+        'rms_method': (lambda: calc.calculate_iri_rms_method(processed, SEGMENT_LENGTH),
+                       lambda: reference.calculate_iri_rms_method(processed, SEGMENT_LENGTH))
+    }
+
+
+# Named arrays to compare for each stage, from the current (columnar) or the reference (per-segment) output
+def comparable(stage, result, is_reference=False):
+    if stage == 'preprocess':
+        df = result[0]
+        return {col: np.asarray(df[col], dtype=float) for col in df.columns}
+    if stage == 'filter':
+        return {col: np.asarray(result[0][col], dtype=float) for col in FILTERED_AXES}
+    if stage == 'segments':
+        if is_reference:
+            return {'distance_start': [segment['distance_start'] for segment in result],
+                    'center_index': [segment['center_index'] for segment in result],
+                    'rms': [np.sqrt(np.mean(segment['vertical_accel']**2)) for segment in result],
+                    'mean_speed': [np.mean(segment['speed']) for segment in result]}
+        return {key: result[key] for key in ('distance_start', 'center_index', 'rms', 'mean_speed')}
+    if stage == 'rms_method':
+        return {'iri': result[0]}
+    return {stage: result}
+
+
+# Largest difference between two outputs relative to the largest reference value, per array
+def max_relative_difference(current, expected):
+    worst = 0.0
+    for name, values in expected.items():
+        values = np.asarray(values, dtype=float)
+        other = np.asarray(current.get(name, []), dtype=float)
+        if other.shape != values.shape:
+            return float('inf')
+        both_nan = np.isnan(values) & np.isnan(other)
+        diff = np.where(both_nan, 0.0, np.abs(other - values))
+        scale = np.nanmax(np.abs(values), initial=0.0) or 1.0
+        worst = max(worst, np.max(diff, initial=0.0) / scale)
+    return float(worst) if np.isfinite(worst) else float('inf')
+
+
+# (median, spread, runs) of the wall time over at least `repeat` calls, repeating fast stages until
+# `min_total` seconds have been spent. The spread is the median absolute deviation scaled to a
+# standard deviation (x 1.4826), so one scheduler hiccup moves neither number.
+def median_time(func, repeat, min_total=0.5):
+    times = []
+    while len(times) < repeat or sum(times) < min_total:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        times.append(time.perf_counter() - start)
+    median = float(np.median(times))
+    return median, 1.4826 * float(np.median(np.abs(np.array(times) - median))), len(times)
+
+
+# Peak traced allocations (MB) of one call
+def peak_memory(func, stage, rows):
+    report = RunReport(emit=False)
+    with contextlib.redirect_stdout(io.StringIO()), report.stage(stage, rows):
+        func()
+    return report.peak_mb
+
+
+def run_benchmarks(sizes, stages, repeat):
+    calc = IRICalculator()
+    results = {stage: {} for stage in stages}
+    for n_rows in sizes:
+        inputs = make_inputs(n_rows)
+        calls = stage_calls(calc, inputs)
+        for stage in stages:
+            func = calls[stage][0]
+            seconds, spread, runs = median_time(func, repeat)
+            results[stage][str(n_rows)] = {
+                'seconds': seconds,
+                'spread': spread,
+                'runs': runs,
+                'rows_per_sec': n_rows / seconds,
+                'peak_mb': peak_memory(func, stage, n_rows)
+            }
+            row = results[stage][str(n_rows)]
+            print(f"{stage:>15} {n_rows:>10} {seconds * 1000:>12.2f} {spread * 1000:>10.2f} {runs:>5} "
+                  f"{row['rows_per_sec']:>14,.0f} {row['peak_mb']:>10.1f}")
+    return results
+
+
+# Current stages against benchmarks/reference.py; returns the stages whose output differs
+def check_equivalence(n_rows, stages):
+    calc = IRICalculator()
+    calls = stage_calls(calc, make_inputs(n_rows, seed=1))
+    failed = []
+    print(f"\nEquivalence with benchmarks/reference.py on {n_rows} rows")
+    print(f"{'stage':>15} {'max rel diff':>14} {'tolerance':>10}")
+    for stage in stages:
+        current, expected = calls[stage]
+        with contextlib.redirect_stdout(io.StringIO()):
+            current, expected = current(), expected()
+        diff = max_relative_difference(comparable(stage, current), comparable(stage, expected, is_reference=True))
+        tolerance = reference.TOLERANCES[stage]
+        status = 'ok' if diff <= tolerance else 'DIFFERS'
+        print(f"{stage:>15} {diff:>14.2e} {tolerance:>10.0e}  {status}")
+        if status != 'ok':
+            failed.append(stage)
+    return failed
+
+
+# (slower, heavier): stages/sizes slower or heavier than the baseline beyond the thresholds,
+# as printable lines. Baselines without a spread (older files) count it as zero.
+def compare_with_baseline(results, baseline, args):
+    slowdowns = []
+    regressions = []
+    print(f"\nComparison with baseline ({baseline.get('created', 'unknown date')})")
+    print(f"{'stage':>15} {'rows':>10} {'time':>10} {'memory':>10}")
+    for stage, by_size in results.items():
+        for size, row in by_size.items():
+            base = baseline.get('results', {}).get(stage, {}).get(size)
+            if base is None:
+                print(f"{stage:>15} {size:>10} {'(no baseline)':>21}")
+                continue
+
+            time_change = row['seconds'] / base['seconds'] - 1
+            memory_change = row['peak_mb'] / base['peak_mb'] - 1 if base['peak_mb'] else 0.0
+            noise = args.noise * np.hypot(row['spread'], base.get('spread', 0.0))
+            slower = (time_change > args.threshold
+                      and row['seconds'] - base['seconds'] > max(args.min_seconds, noise))
+            heavier = (memory_change > args.memory_threshold
+                       and row['peak_mb'] - base['peak_mb'] > args.min_mb)
+            flag = '  REGRESSION' if heavier else '  SLOWER' if slower else ''
+            print(f"{stage:>15} {size:>10} {time_change:>+10.0%} {memory_change:>+10.0%}{flag}")
+            if slower:
+                slowdowns.append(f"{stage} @ {size} rows: median {row['seconds'] * 1000:.2f} ms "
+                                 f"vs {base['seconds'] * 1000:.2f} ms baseline ({time_change:+.0%}, "
+                                 f"noise {noise * 1000:.2f} ms)")
+            if heavier:
+                regressions.append(f"{stage} @ {size} rows: peak {row['peak_mb']:.1f} MB "
+                                   f"vs {base['peak_mb']:.1f} MB baseline ({memory_change:+.0%})")
+    return slowdowns, regressions
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+            'pandas': pd.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=7, help="minimum timed runs per stage and size")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="allowed slowdown as a fraction of the baseline median (default 0.25)")
+    parser.add_argument('--noise', type=float, default=3.0,
+                        help="ignore slowdowns within this many combined spreads (default 3)")
+    parser.add_argument('--strict', action='store_true', help="fail on slowdowns too, not only print them")
+    parser.add_argument('--memory-threshold', type=float, default=0.25,
+                        help="allowed growth of peak memory as a fraction of the baseline (default 0.25)")
+    parser.add_argument('--min-seconds', type=float, default=0.001,
+                        help="ignore slowdowns smaller than this many seconds")
+    parser.add_argument('--min-mb', type=float, default=1.0,
+                        help="ignore memory growth smaller than this many MB")
+    parser.add_argument('--check', action=argparse.BooleanOptionalAction, default=True,
+                        help="compare outputs with benchmarks/reference.py")
+    parser.add_argument('--check-rows', type=int, default=20_000)
+    args = parser.parse_args(argv)
+
+    print(f"{'stage':>15} {'rows':>10} {'median (ms)':>12} {'+/- (ms)':>10} {'runs':>5} {'rows/s':>14} "
+          f"{'peak (MB)':>10}")
+    results = run_benchmarks(args.sizes, args.stages, args.repeat)
+
+    failed = check_equivalence(args.check_rows, args.stages) if args.check else []
+
+    slowdowns, regressions = [], []
+    if args.save:
+        baseline = {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                    'environment': environment(), 'repeat': args.repeat, 'results': results}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            slowdowns, regressions = compare_with_baseline(results, json.load(f), args)
+    else:
+        print(f"\nNo baseline at {args.baseline}; record one with --save")
+
+    for line in slowdowns:
+        print(f"Slower: {line}" + ("" if args.strict else " (advisory; --strict to fail)"))
+    for line in regressions:
+        print(f"Regression: {line}")
+    for stage in failed:
+        print(f"Output differs from the reference: {stage}")
+    return 1 if regressions or failed or (args.strict and slowdowns) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,8 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.express as px
 from utils.iri_calculator import IRICalculator
+from utils.run_cache import RunCache
+from utils.stage_graph import build_iri_graph
 import io
 
 # Set page config
@@ -180,35 +182,18 @@ uploaded_file = st.file_uploader(
 # ----- Functions for Map Visualization -------
 
 def plot_iri_map(df, iri_values, segments):
-    latitudes = []
-    longitudes = []
-    qualities = []
-
-    for iri, seg in zip(iri_values, segments):
-        idx = seg['center_index']
-
-        if 0 <= idx < len(df):
-            lat = df.iloc[idx]['latitude']
-            lon = df.iloc[idx]['longitude']
-            latitudes.append(lat)
-            longitudes.append(lon)
-
-            if iri <= 3:
-                qualities.append("Good")
-            elif iri <= 5:
-                qualities.append("Fair")
-            elif iri <=7:
-                qualities.append("Poor")
-            else:
-                qualities.append("Bad")
-        else:
-            continue
-    
+    # Segment centre positions picked out in one indexing pass
+    center_index = np.asarray(segments['center_index'])
+    valid = (center_index >= 0) & (center_index < len(df))
+    iri = np.asarray(iri_values)[valid]
+
+    quality = np.select([iri <= 3, iri <= 5, iri <= 7], ["Good", "Fair", "Poor"], default="Bad")
+
     map_df = pd.DataFrame({
-        'Latitude': latitudes,
-        'Longitude': longitudes,
-        'IRI': iri_values[:len(latitudes)],
-        'Quality': qualities
+        'Latitude': np.asarray(df['latitude'])[center_index[valid]],
+        'Longitude': np.asarray(df['longitude'])[center_index[valid]],
+        'IRI': iri,
+        'Quality': quality
     })
 
     color_map = {
@@ -241,6 +226,36 @@ def plot_iri_map(df, iri_values, segments):
     
 
 
+# On-disk cache of preprocessed runs, shared by every session
+@st.cache_resource
+def get_run_cache():
+    return RunCache()
+
+
+# Bytes held by a run's channels, for a DataFrame or a CompactRun
+def run_nbytes(run):
+    if hasattr(run, 'memory_usage'):
+        return int(run.memory_usage(deep=True).sum())
+    return run.nbytes
+
+
+# Values derived from one segmentation of the run
+def summarize_segments(iri_values, segments, cumulative_run):
+    # Mean speed of the last segment (or of the whole run if nothing was segmented)
+    if len(iri_values) > 0:
+        speed = segments['mean_speed'][-1]
+    else:
+        speed = cumulative_run.speed_cumsum[-1] / max(len(cumulative_run), 1)
+
+    return {
+        'iri_values': iri_values,
+        'segments': segments,
+        'segment_centers': segments['distance_start'] + segments['length']/2,    # For Total Distance
+        'mean_iri': np.mean(iri_values),
+        'speed': speed
+    }
+
+
 # Variables Initialization
 if 'recalculate' not in st.session_state:
     st.session_state.recalculate = False 
@@ -250,6 +265,18 @@ if 'segment_length' not in st.session_state:
     st.session_state.segment_length = 150
 if 'threshold_value' not in st.session_state:
     st.session_state.threshold_value = 0.0
+if 'cutoff_freq' not in st.session_state:
+    st.session_state.cutoff_freq = 10.0
+if 'distance_source' not in st.session_state:
+    st.session_state.distance_source = 'speed'
+if 'compact_run' not in st.session_state:
+    st.session_state.compact_run = False
+if 'profile_step' not in st.session_state:
+    st.session_state.profile_step = 5.0
+
+# Memoized pipeline stages: only the stages downstream of a changed setting are recomputed
+if 'iri_graph' not in st.session_state:
+    st.session_state.iri_graph = build_iri_graph(IRICalculator(), get_run_cache())
 
 # Calculation Result Initialization
 if 'calculation_result' not in st.session_state:
@@ -282,49 +309,50 @@ if uploaded_file is not None:
     """)
     
     # Calculate Button and algorithm
-    if st.button("🧮 Caculate IRI", type="primary", use_container_width = True) or st.session_state.recalculate:
+    calculate_clicked = st.button("🧮 Caculate IRI", type="primary", use_container_width = True)
+
+    if calculate_clicked or st.session_state.recalculate:
+        graph = st.session_state.iri_graph
+
+        # For recomputation of segment length, threshold value and filter cutoff.
+        # The threshold is display-only, so changing it recomputes no stage at all.
+        params = {
+            'source': uploaded_file,
+            'cutoff_freq': st.session_state.cutoff_freq,
+            'segment_length': st.session_state.segment_length,
+            'distance_source': st.session_state.distance_source,
+            'compact': st.session_state.compact_run,
+            'profile_step': st.session_state.profile_step
+        }
+
         with st.spinner("Processing accelerometer data and calculating IRI..."):
-            import time
-            time.sleep(2) # Simulate processing time
-
-            # Include the Program for calculation
-            iri_calc = IRICalculator()
-            df = pd.read_csv(uploaded_file)
-            df_processed, duration = iri_calc.preprocess_data(df)
-            df_filtered, _ = iri_calc.filter_accelerometer_data(df_processed)
-            vertical_accel = iri_calc.extract_vertical_acceleration(df_filtered)
-
-            if df_processed is not None:
-                
-                # For recomputation of segment length and threshold value
-                segment_length = st.session_state.segment_length
-                threshold_value = st.session_state.threshold_value
-
-                # For IRI Calculation
-                iri_values, segments, sampling_rate, speed = iri_calc.calculate_iri_rms_method(df_processed, segment_length)
-
-                mean_iri = np.mean(iri_values)
-
-                # For Total Distance
-                segment_centers = [s['distance_start'] + s['length']/2 for s in segments]
-
-                st.session_state.calculation_result ={
-                    'iri_values': iri_values,
-                    'segments': segments,
-                    'segment_centers': segment_centers,
-                    'mean_iri': mean_iri,
-                    'sampling_rate': sampling_rate,
-                    'speed': speed,
-                    'duration': duration,
-                    'df': df,
-                    'df_filtered': df_filtered,
-                    'vertical_accel': vertical_accel,
-                    'df_processed': df_processed
-                }
-                st.session_state.recalculate = False
-            else:
+            try:
+                outputs = graph.run(['preprocess', 'gps', 'filter', 'vertical', 'cumulative', 'segmentation', 'iri', 'profile', 'spectral'],
+                                    **params)
+            except ValueError:
+                outputs = None
                 st.error("❌ Data preprocessing failed")
 
+        if outputs is not None:
+            df_processed, duration = outputs['preprocess']
+            df_filtered, sampling_rate = outputs['filter']
+
+            st.session_state.calculation_result ={
+                'cumulative_run': outputs['cumulative'],
+                'sampling_rate': sampling_rate,
+                'duration': duration,
+                'df_filtered': df_filtered,
+                'vertical_accel': outputs['vertical'],
+                'df_processed': df_processed,
+                'df_track': outputs['gps'],         # GPS positions on the sensor timeline when aligned
+                'spectral_features': outputs['spectral'],
+                'profile': outputs['profile'],     # sliding window of segment_length every profile_step meters
+                'stage_report': graph.report(),
+                'run_nbytes': run_nbytes(df_filtered) + outputs['vertical'].nbytes,
+                **summarize_segments(outputs['iri'], outputs['segmentation'], outputs['cumulative'])
+            }
+        st.session_state.recalculate = False
+
     if st.session_state.calculation_result:
         result = st.session_state.calculation_result
         iri_values = result['iri_values']
@@ -334,12 +362,11 @@ if uploaded_file is not None:
         sampling_rate =  result['sampling_rate']
         speed = result['speed']
         duration = result['duration']
-        df = result['df']
         df_filtered = result['df_filtered']
         vertical_accel = result['vertical_accel']
         df_processed = result['df_processed']
 
-        total_distance = segment_centers[-1] + (segments[-1]['length']/2)
+        total_distance = segment_centers[-1] + (segments['length']/2)
 
 
         # Formatted Results
@@ -460,9 +487,9 @@ if uploaded_file is not None:
         )
 
         # Plot Raw Accelerometer Data
-        fig.add_trace(go.Scattergl(x=df['time'], y=df['ax'], mode='lines', name='X-axis', line=dict(color='blue')), row=1, col=1)
-        fig.add_trace(go.Scattergl(x=df['time'], y=df['ay'], mode='lines', name='Y-axis', line=dict(color='orange')), row=1, col=1)
-        fig.add_trace(go.Scattergl(x=df['time'], y=df['az'], mode='lines', name='Z-axis', line=dict(color='green')), row=1, col=1)
+        fig.add_trace(go.Scattergl(x=df_processed['time'], y=df_processed['ax'], mode='lines', name='X-axis', line=dict(color='blue')), row=1, col=1)
+        fig.add_trace(go.Scattergl(x=df_processed['time'], y=df_processed['ay'], mode='lines', name='Y-axis', line=dict(color='orange')), row=1, col=1)
+        fig.add_trace(go.Scattergl(x=df_processed['time'], y=df_processed['az'], mode='lines', name='Z-axis', line=dict(color='green')), row=1, col=1)
 
         # Plot Filtered Vertical Acceleration
         fig.add_trace(go.Scattergl(x=df_filtered['time'], y=vertical_accel, mode='lines', name='Vertical Accel', line=dict(color = '#FFBF00')), row=2, col=1)
@@ -475,6 +502,13 @@ if uploaded_file is not None:
             marker = dict(color='red')
         ), row=3, col=1)
 
+        # Sliding-window profile: same window length, evaluated every few meters
+        profile = result['profile']
+        fig.add_trace(go.Scattergl(
+            x=profile['chainage'], y=profile['iri'],
+            mode = 'lines', name=f"Sliding IRI (every {profile['step']:g} m)", line=dict(color='#6f42c1', width=1)
+        ), row=3, col=1)
+
         fig.add_trace(go.Scattergl(
             x=segment_centers, y=[st.session_state.threshold_value]*len(segment_centers), mode ='lines',
             name='Threshold', line=dict(color='black', dash='dash')
@@ -528,12 +562,13 @@ if uploaded_file is not None:
 
 
         # Map Visualization 
-        plot_iri_map(df_processed, iri_values, segments)
+        plot_iri_map(result['df_track'], iri_values, segments)
 
         # Prepare DataFrame for download
         download_df = pd.DataFrame({
             "Distance": segment_centers,
-            "IRI": iri_values
+            "IRI": iri_values,
+            **result['spectral_features']      # band energies and dominant wavelength per segment
         })
 
         csv_buffer = io.StringIO()
@@ -548,6 +583,11 @@ if uploaded_file is not None:
         )
 
 
+        # Which pipeline stages were reused or recomputed for this result
+        with st.expander("⏱️ Pipeline Stages"):
+            st.dataframe(pd.DataFrame(result['stage_report']), use_container_width=True, hide_index=True)
+            st.caption(f"Run data in memory: {result['run_nbytes'] / 1024 / 1024:.1f} MB")
+
         # Addition of Advanced Settings
         st.markdown('<div class="section-header">⚙️ Advanced Settings</div>',
         unsafe_allow_html = True)
@@ -555,11 +595,24 @@ if uploaded_file is not None:
         # Getting the Inpput
         new_segment_length = st.number_input("Segment Length (m)", value=st.session_state.segment_length, step=10, min_value = 100)
         new_threshold_value = st.number_input("IRI Threshold (m/km)", value=st.session_state.threshold_value, step=0.1, min_value=0.0)
+        new_cutoff_freq = st.number_input("Filter Cutoff (Hz)", value=st.session_state.cutoff_freq, step=1.0, min_value=1.0)
+        new_profile_step = st.number_input("Profile Step (m)", value=st.session_state.profile_step, step=1.0, min_value=0.5,
+                                           help="Spacing of the sliding-window IRI profile")
+        distance_sources = ['speed', 'gps']
+        new_distance_source = st.selectbox("Distance Source", distance_sources,
+                                           index=distance_sources.index(st.session_state.distance_source),
+                                           help="Integrate the speed column, or use the geodesic distance between GPS fixes")
+        new_compact_run = st.checkbox("Compact Memory (float32)", value=st.session_state.compact_run,
+                                      help="Hold the run in float32 arrays, about half the memory; IRI changes by less than 1e-6")
 
         # Recalculation button
         if st.button("🔁 Recalculate with Advanced Settings",  type="primary", use_container_width = True):
             st.session_state.segment_length = new_segment_length
             st.session_state.threshold_value = new_threshold_value
+            st.session_state.cutoff_freq = new_cutoff_freq
+            st.session_state.distance_source = new_distance_source
+            st.session_state.compact_run = new_compact_run
+            st.session_state.profile_step = new_profile_step
             st.session_state.recalculate = True
             st.rerun()
 
@@ -6,12 +6,17 @@ from streamlit_folium import st_folium
 import geopandas as gpd
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
-from PIL import Image
+import json
 import os
-import base64
+import threading
+import time
 from io import BytesIO
-from folium import plugins
 from utils.iri_calculator import IRICalculator
+from utils.instrumentation import RunReport
+from utils.map_layers import add_iri_geojson, add_marker_layer, content_hash, iri_line_geojson, pothole_layer, vehicle_layer
+from utils.viewport import ViewportLayers, approximate_bounds, view_bounds
+from utils.run_cache import RunCache, load_filtered_run
+from utils.thumbnails import SIDEBAR_SIZE, default_cache as default_thumbnail_cache
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.express as px
@@ -40,6 +45,11 @@ st.set_page_config(
     initial_sidebar_state="auto",
 )
 
+# On-disk cache of preprocessed runs, shared by every session
+@st.cache_resource
+def get_run_cache():
+    return RunCache()
+
 # Custom Sidebar Toggle Function
 def create_custom_sidebar_toggle():
     """Create a custom sidebar toggle button that works on both local and cloud deployments"""
@@ -271,27 +281,39 @@ if iri_sensor_file is not None:
     # Check if this is a new file (to avoid recalculation on every rerun)
     if 'current_iri_file' not in st.session_state or st.session_state.current_iri_file != iri_sensor_file.name:
         try:
-            # Initialize IRI Calculator
-            iri_calc = IRICalculator()
+            # Initialize IRI Calculator; the report records time and memory per processing stage
+            run_report = RunReport()
+            iri_calc = IRICalculator(report=run_report)
             
-            # Load and process data
-            df = pd.read_csv(iri_sensor_file)
-            df_processed, duration = iri_calc.preprocess_data(df)
+            # Load, preprocess and filter - or reuse the on-disk cache if this content was seen before
+            loaded = load_filtered_run(iri_sensor_file, get_run_cache(), calculator=iri_calc)
             
-            if df_processed is not None:
-                # Calculate IRI with default segment length of 150
-                iri_values, segments, sampling_rate, speed = iri_calc.calculate_iri_rms_method(df_processed, 25)
+            if loaded is not None:
+                df_processed, duration, df_filtered, sampling_rate, cache_hit = loaded
+
+                # GPS is logged at about 1 Hz; interpolate positions onto every sample for the map
+                df_processed = iri_calc.align_gps(df_processed)
+
+                # One cumulative run serves the 25 m segments and the map line's dense profile
+                # (the same 25 m window every 5 m); orientation, speed and distance are computed once
+                vertical_accel = iri_calc.extract_vertical_acceleration(df_filtered)
+                cumulative_run = iri_calc.build_cumulative_run(df_filtered, sampling_rate, vertical_accel)
+                iri_values, segments = cumulative_run.iri(25)
+                segments.update(iri_calc.spectral_features(cumulative_run.distance,
+                                                           vertical_accel - np.mean(vertical_accel), segments))
+                speed = segments['mean_speed'][-1] if len(iri_values) > 0 else 0.0
+                profile = cumulative_run.profile(25, 5)
                 
                 # Check if calculation was successful
-                if not iri_values or len(iri_values) == 0:
+                if len(iri_values) == 0:
                     if st.session_state.sidebar_visible:
                         st.sidebar.error("❌ No IRI values calculated. Check your data format.")
                 else:
                     # Calculate statistics
                     mean_iri = np.mean(iri_values)
                     std_iri = np.std(iri_values)
-                    segment_centers = [s['distance_start'] + s['length']/2 for s in segments]
-                    total_distance = segment_centers[-1] + (segments[-1]['length']/2) if segment_centers else 0
+                    segment_centers = segments['distance_start'] + segments['length']/2
+                    total_distance = segment_centers[-1] + (segments['length']/2)
                     
                     # Store results in session state
                     st.session_state.iri_calculation_result = {
@@ -304,13 +326,16 @@ if iri_sensor_file is not None:
                         'speed': speed,
                         'duration': duration,
                         'total_distance': total_distance,
-                        'df_processed': df_processed
+                        'df_processed': df_processed,
+                        'profile': profile,
+                        'run_report': run_report.rows(),
+                        'run_report_summary': run_report.summary() + (" (cached run: load, preprocess and filter skipped)" if cache_hit else "")
                     }
                     
                     # Store current file name to avoid recalculation
                     st.session_state.current_iri_file = iri_sensor_file.name
                     if st.session_state.sidebar_visible:
-                        st.sidebar.success("✅ IRI calculation completed!")
+                        st.sidebar.success("✅ IRI calculation completed!" + (" (cached run)" if cache_hit else ""))
             else:
                 if st.session_state.sidebar_visible:
                     st.sidebar.error("❌ Data preprocessing failed")
@@ -518,6 +543,13 @@ if pothole_images_file is not None:
                     else:
                         missing_images.append(row['image_path'])
                 
+                # Popup and sidebar thumbnails of every image, generated in the background on a thread
+                # pool; pages shown before it finishes generate their own (see utils/thumbnails.py)
+                if valid_images:
+                    thumbnail_sources = [os.path.join(images_base_path, path) for path in valid_images]
+                    threading.Thread(target=default_thumbnail_cache().pregenerate, args=(thumbnail_sources,),
+                                     daemon=True).start()
+
                 # Show validation results (minimal info)
                 if st.session_state.sidebar_visible:
                     if missing_images:
@@ -626,6 +658,19 @@ if st.session_state.iri_calculation_result and st.session_state.sidebar_visible:
         </div>
         """, unsafe_allow_html=True)
 
+    # Where the upload spent its time and memory
+    with st.sidebar.expander("⏱️ Processing Report", expanded=False):
+        st.caption(result['run_report_summary'])
+        report_df = pd.DataFrame(result['run_report'])
+        report_df['stage'] = ['  ' * depth + stage for stage, depth in zip(report_df['stage'], report_df['depth'])]
+        st.dataframe(
+            report_df.drop(columns='depth').rename(columns={
+                'stage': 'Stage', 'seconds': 'Seconds', 'rows': 'Rows', 'rows_per_sec': 'Rows/s',
+                'peak_mb': 'Peak MB', 'rss_mb': 'RSS MB'
+            }),
+            hide_index=True
+        )
+
 # Display Vehicle Statistics if available
 if st.session_state.vehicle_data is not None and st.session_state.sidebar_visible:
     vehicle_df = st.session_state.vehicle_data
@@ -799,11 +844,12 @@ if st.session_state.pothole_images_data is not None and st.session_state.sidebar
                 
                 full_image_path = os.path.join(sidebar_images_base_path, row['image_path'])
                 if os.path.exists(full_image_path):
-                    try:
-                        image = Image.open(full_image_path)
-                        st.image(image, caption=f"Pothole Detection: Frame {frame_num} - {row['image_path']}", use_container_width=True)
-                    except Exception as e:
-                        st.error(f"Error loading image: {str(e)}")
+                    # A downscaled copy rather than the full frame (see utils/thumbnails.py)
+                    thumbnail_path = default_thumbnail_cache().path(full_image_path, SIDEBAR_SIZE)
+                    if thumbnail_path is not None:
+                        st.image(thumbnail_path, caption=f"Pothole Detection: Frame {frame_num} - {row['image_path']}", use_container_width=True)
+                    else:
+                        st.error(f"Error loading image: {full_image_path}")
                 else:
                     st.error(f"Image file not found: {full_image_path}")
                 
@@ -878,190 +924,23 @@ if st.session_state.sidebar_visible:
         ["OpenStreetMap", "Satellite", "3D Terrain", "Dark Mode"],
         index=0
     )
+    viewport_mode = st.sidebar.checkbox(
+        "Render only the visible area", value=True,
+        help="Send only the data in view to the map, and per-area summaries when zoomed out (see utils/viewport.py)"
+    )
 else:
     # Default map style when sidebar is hidden
     map_style = "OpenStreetMap"
+    viewport_mode = True
 
-# Determine map center
-center_lat, center_lon = 14.5995, 120.9842  # Default to Manila
-
-# If we have data, center on the data
-all_lats, all_lons = [], []
-
-# Collect IRI data coordinates for map centering
-iri_lats = []
-iri_lons = []
-if st.session_state.iri_calculation_result and layer_controls['iri']:
-    result = st.session_state.iri_calculation_result
-    df_processed = result['df_processed']
-    
-    # Check if GPS data is available
-    if 'latitude' in df_processed.columns and 'longitude' in df_processed.columns:
-        # Get coordinates for each segment
-        for i, segment in enumerate(result['segments']):
-            if i < len(result['iri_values']):
-                idx = segment['center_index']
-                if 0 <= idx < len(df_processed):
-                    lat = df_processed.iloc[idx]['latitude']
-                    lon = df_processed.iloc[idx]['longitude']
-                    iri_lats.append(lat)
-                    iri_lons.append(lon)
-
-# Collect vehicle data coordinates for map centering
-vehicle_lats = []
-vehicle_lons = []
-if st.session_state.vehicle_data is not None and layer_controls['vehicles']:
-    vehicle_lats = st.session_state.vehicle_data['latitude'].tolist()
-    vehicle_lons = st.session_state.vehicle_data['longitude'].tolist()
-
-# Collect pothole images data coordinates for map centering
-pothole_images_lats = []
-pothole_images_lons = []
-if st.session_state.pothole_images_data is not None and layer_controls['pothole_images']:
-    pothole_images_lats = st.session_state.pothole_images_data['latitude'].tolist()
-    pothole_images_lons = st.session_state.pothole_images_data['longitude'].tolist()
-
-# Session state for lats and lons
-
-# Update map center based on available data (Priority: 1. Pothole, 2. Vehicles, 3. IRI)
-if pothole_images_lats and pothole_images_lons:
-    center_lat = np.mean(pothole_images_lats)
-    center_lon = np.mean(pothole_images_lons)
-elif vehicle_lats and vehicle_lons:
-    center_lat = np.mean(vehicle_lats)
-    center_lon = np.mean(vehicle_lons)
-elif iri_lats and iri_lons:
-    center_lat = np.mean(iri_lats)
-    center_lon = np.mean(iri_lons)
-elif all_lats and all_lons:
-    center_lat = np.mean(all_lats)
-    center_lon = np.mean(all_lons)
-
-# Select tile layer based on user choice
-tile_configs = {
-    "OpenStreetMap": {
-        "tiles": "OpenStreetMap",
-        "attr": "© OpenStreetMap contributors"
-    },
-
-    "Satellite": {
-        "tiles": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
-        "attr": "Esri, Maxar, Earthstar Geographics"
-    },
-
-    "3D Terrain": {
-        "tiles": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Topo_Map/MapServer/tile/{z}/{y}/{x}",
-        "attr": "Esri, HERE, Garmin, Intermap, increment P Corp."
-    },
-
-    "Dark Mode": {
-        "tiles": "CartoDB dark_matter",
-        "attr": "© OpenStreetMap contributors, © CartoDB"
-    }
-}
-
-tile_config = tile_configs[map_style]
-
-# Create base map with selected style and enhanced controls
-if map_style == "Satellite" or map_style == "3D Terrain":
-    m = folium.Map(location=[float(center_lat), float(center_lon)],
-                    zoom_start = 15,
-                    tiles=None,
-                    control_scale=True
-    )
-    folium.TileLayer(tiles=tile_config["tiles"],
-                    attr = tile_config["attr"],
-                    name=map_style,
-                    overlay = False,
-                    control = False
-    ).add_to(m)
-
-else: 
-    m = folium.Map(location = [float(center_lat), float(center_lon)],
-                    zoom_start=15,
-                    tiles = tile_config["tiles"],
-                    attr=tile_config["attr"],
-                    control_scale=True
-    )
-
-# Add IRI data to map if available
-if st.session_state.iri_calculation_result and layer_controls['iri']:
-    result = st.session_state.iri_calculation_result
-    df_processed = result['df_processed']
-    
-    # Check if GPS data is available
-    if 'latitude' in df_processed.columns and 'longitude' in df_processed.columns:
-        # Create color-changing continuous line based on IRI values
-        for i, segment in enumerate(result['segments']):
-            if i < len(result['iri_values']):
-                idx = segment['center_index']
-                if 0 <= idx < len(df_processed):
-                    lat = df_processed.iloc[idx]['latitude']
-                    lon = df_processed.iloc[idx]['longitude']
-                    iri_value = result['iri_values'][i]
-                    
-                    # Determine color based on IRI value
-                    if iri_value <= 3:
-                        color = 'green'
-                        quality = 'Good'
-                    elif iri_value <= 5:
-                        color = 'yellow'
-                        quality = 'Fair'
-                    elif iri_value <= 7:
-                        color = 'orange'
-                        quality = 'Poor'
-                    else:
-                        color = 'red'
-                        quality = 'Bad'
-                    
-                    # Create a small line segment for this IRI value
-                    # Get the next coordinate for the line segment
-                    if i + 1 < len(result['segments']):
-                        next_idx = result['segments'][i + 1]['center_index']
-                        if next_idx < len(df_processed):
-                            next_lat = df_processed.iloc[next_idx]['latitude']
-                            next_lon = df_processed.iloc[next_idx]['longitude']
-                            
-                            # Create line segment with color based on IRI value
-                            folium.PolyLine(
-                                locations=[[lat, lon], [next_lat, next_lon]],
-                                popup=f'IRI: {iri_value:.2f}<br>Quality: {quality}',
-                                color=color,
-                                weight=6,
-                                opacity=0.8
-                            ).add_to(m)
-                    else:
-                        # For the last segment, create a small line in the same direction
-                        # Use the previous segment's direction
-                        if i > 0:
-                            prev_idx = result['segments'][i - 1]['center_index']
-                            if prev_idx < len(df_processed):
-                                prev_lat = df_processed.iloc[prev_idx]['latitude']
-                                prev_lon = df_processed.iloc[prev_idx]['longitude']
-                                
-                                # Calculate direction vector
-                                dlat = lat - prev_lat
-                                dlon = lon - prev_lon
-                                
-                                # Create a small line segment in the same direction
-                                end_lat = lat + dlat * 0.5
-                                end_lon = lon + dlon * 0.5
-                                
-                                folium.PolyLine(
-                                    locations=[[lat, lon], [end_lat, end_lon]],
-                                    popup=f'IRI: {iri_value:.2f}<br>Quality: {quality}',
-                                    color=color,
-                                    weight=6,
-                                    opacity=0.8
-                                ).add_to(m)
-
-# Add pothole images to map if available
-if st.session_state.pothole_images_data is not None and layer_controls['pothole_images']:
-    pothole_df = st.session_state.pothole_images_data
-    
-    # Use the stored images_base_path from session state, with smart fallback detection
+# Folder holding the pothole images: the one found when the CSV was loaded, else the first of the
+# usual locations (searched once per session, as the last resort walks the working directory)
+def get_images_base_path():
     images_base_path = st.session_state.get('images_base_path')
-    if not images_base_path:
+    if images_base_path:
+        return images_base_path
+
+    if st.session_state.get('fallback_images_path') is None:
         # Smart fallback detection using the same logic
         def find_images_folder_fallback():
             # First priority: Look for ../images folder relative to current working directory
@@ -1108,178 +987,274 @@ if st.session_state.pothole_images_data is not None and layer_controls['pothole_
             
             return "UPLB/streamlit_package/images/"
         
-        images_base_path = find_images_folder_fallback()
-        if st.session_state.sidebar_visible:
-            st.sidebar.info(f"🔍 Using fallback images folder: {images_base_path}")
-    
-    # Show progress for loading ALL markers
-    with st.spinner(f"Loading {len(pothole_df)} pothole markers on map..."):
-        # Display ALL markers on the map
-        for idx, row in pothole_df.iterrows():
-            try:
-                lat = row['latitude']
-                lon = row['longitude']
-                image_path = row['image_path']
-                confidence = row['confidence_score']
-                
-                # Check if this marker is in the current page for image loading
-                page_size = 10
-                page = st.session_state.pothole_page if 'pothole_page' in st.session_state else 0
-                start_idx = page * page_size
-                end_idx = min(start_idx + page_size, len(pothole_df))
-                is_in_current_page = start_idx <= idx < end_idx
-                
-                full_image_path = os.path.join(images_base_path, image_path)
-                
-                # Only load image data for markers in the current page (for performance)
-                if is_in_current_page and os.path.exists(full_image_path):
-                    with open(full_image_path, 'rb') as img_file:
-                        img_data = img_file.read()
-                        img_base64 = base64.b64encode(img_data).decode()
-                    popup_html = f"""
-                    <div style=\"text-align: center;\">
-                        <h4>🚧 Pothole Detection</h4>
-                        <img src=\"data:image/jpeg;base64,{img_base64}\" style=\"width: 250px; height: auto; border-radius: 8px; margin: 10px 0;\">
-                        <p><strong>Confidence:</strong> {confidence:.2%}</p>
-                        <p><strong>Image:</strong> {image_path}</p>
-                    </div>
-                    """
-                    folium.Marker(
-                        location=[lat, lon],
-                        popup=folium.Popup(popup_html, max_width=300),
-                        icon=folium.Icon(
-                            color='red',
-                            icon='exclamation-triangle',
-                            prefix='fa'
-                        ),
-                        tooltip=f"Pothole Detection ({confidence:.1%})"
-                    ).add_to(m)
-                elif os.path.exists(full_image_path):
-                    # For markers not in current page, just show basic info without image
-                    popup_html = f"""
-                    <div style=\"text-align: center;\">
-                        <h4>🚧 Pothole Detection</h4>
-                        <p><strong>Confidence:</strong> {confidence:.2%}</p>
-                        <p><strong>Image:</strong> {image_path}</p>
-                        <p><em>Use sidebar to view image</em></p>
-                    </div>
-                    """
-                    folium.Marker(
-                        location=[lat, lon],
-                        popup=folium.Popup(popup_html, max_width=300),
-                        icon=folium.Icon(
-                            color='red',
-                            icon='exclamation-triangle',
-                            prefix='fa'
-                        ),
-                        tooltip=f"Pothole Detection ({confidence:.1%})"
-                    ).add_to(m)
-                else:
-                    folium.Marker(
-                        location=[lat, lon],
-                        popup=f"Pothole Detection<br>Confidence: {confidence:.2%}<br>Image: {image_path}<br><em>Image file not found</em>",
-                        icon=folium.Icon(
-                            color='orange',
-                            icon='exclamation-triangle',
-                            prefix='fa'
-                        ),
-                        tooltip=f"Pothole Detection ({confidence:.1%}) - No Image"
-                    ).add_to(m)
-            except Exception as e:
-                continue
-
-# Add vehicle markers to map if available
-if st.session_state.vehicle_data is not None and layer_controls['vehicles']:
-    vehicle_df = st.session_state.vehicle_data
-    
-    # Show progress for loading vehicle markers
-    with st.spinner(f"Loading {len(vehicle_df)} vehicle markers on map..."):
-        for idx, row in vehicle_df.iterrows():
-            try:
-                lat = row['latitude']
-                lon = row['longitude']
-                vehicle_type = row['vehicle_type']
-                
-                # Define colors and icons for different vehicle types
-                vehicle_config = {
-                    'car': {'color': 'blue', 'icon': 'car', 'tooltip': '🚗 Car'},
-                    'truck': {'color': 'orange', 'icon': 'truck', 'tooltip': '🚛 Truck'},
-                    'motorcycle': {'color': 'green', 'icon': 'motorcycle', 'tooltip': '🏍️ Motorcycle'}
-                }
-                
-                config = vehicle_config.get(vehicle_type, {'color': 'gray', 'icon': 'question', 'tooltip': '❓ Unknown'})
-                
-                # Get total count for this vehicle type
-                vehicle_counts = vehicle_df['vehicle_type'].value_counts()
-                total_count = vehicle_counts.get(vehicle_type, 0)
-                
-                popup_html = f"""
-                <div style=\"text-align: center;\">
-                    <h4>{config['tooltip']}</h4>
-                    <p><strong>Type:</strong> {vehicle_type.title()}</p>
-                    <p><strong>Total Count:</strong> {total_count}</p>
-                </div>
-                """
-                
-                folium.Marker(
-                    location=[lat, lon],
-                    popup=folium.Popup(popup_html, max_width=250),
-                    icon=folium.Icon(
-                        color=config['color'],
-                        icon=config['icon'],
-                        prefix='fa'
-                    ),
-                    tooltip=config['tooltip']
-                ).add_to(m)
-            except Exception as e:
-                continue
-
-# Add legend for IRI values if IRI data is available
-if st.session_state.iri_calculation_result and layer_controls['iri']:
-    legend_html = '''
-    <div style="position: fixed; 
-                bottom: 50px; left: 50px; width: 220px; height: 180px; 
-                background-color: white; border: 2px solid #333; border-radius: 8px; z-index:9999; 
-                font-size:14px; padding: 15px; box-shadow: 0 4px 8px rgba(0,0,0,0.2);">
-    <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px; text-align: center; border-bottom: 1px solid #ccc; padding-bottom: 5px;">IRI Quality Legend</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 12px; height: 12px; background-color: green; border-radius: 50%; margin-right: 8px;"></span> Good (≤3)</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 12px; height: 12px; background-color: yellow; border-radius: 50%; margin-right: 8px;"></span> Fair (3-5)</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 12px; height: 12px; background-color: orange; border-radius: 50%; margin-right: 8px;"></span> Poor (5-7)</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 12px; height: 12px; background-color: red; border-radius: 50%; margin-right: 8px;"></span> Bad (>7)</p>
-    </div>
-    '''
-    m.get_root().html.add_child(folium.Element(legend_html))
-
-# Add legend for vehicle markers if available
-if st.session_state.vehicle_data is not None and layer_controls['vehicles']:
-    vehicle_legend_html = '''
-    <div style="position: fixed; 
-                top: 50px; right: 50px; width: 200px; height: 160px; 
-                background-color: white; border: 2px solid #333; border-radius: 8px; z-index:9999; 
-                font-size:14px; padding: 15px; box-shadow: 0 4px 8px rgba(0,0,0,0.2);">
-    <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px; text-align: center; border-bottom: 1px solid #ccc; padding-bottom: 5px;">🚗 Vehicle Detections</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: blue; border-radius: 50%; margin-right: 8px;"></span> 🚗 Car</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: orange; border-radius: 50%; margin-right: 8px;"></span> 🚛 Truck</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: green; border-radius: 50%; margin-right: 8px;"></span> 🏍️ Motorcycle</p>
-    </div>
-    '''
-    m.get_root().html.add_child(folium.Element(vehicle_legend_html))
-
-# Add legend for pothole images if available
-if st.session_state.pothole_images_data is not None and layer_controls['pothole_images']:
-    pothole_legend_html = '''
-    <div style="position: fixed; 
-                bottom: 50px; right: 50px; width: 240px; height: 170px; 
-                background-color: white; border: 2px solid #333; border-radius: 8px; z-index:9999; 
-                font-size:14px; padding: 15px; box-shadow: 0 4px 8px rgba(0,0,0,0.2);">
-    <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px; text-align: center; border-bottom: 1px solid #ccc; padding-bottom: 5px;">🚧 Pothole Detections</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: red; border-radius: 50%; margin-right: 8px;"></span> Pothole with Image</p>
-    <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: orange; border-radius: 50%; margin-right: 8px;"></span> Pothole (No Image)</p>
-    <p style="margin: 5px 0; font-size: 12px; color: #666;">All markers shown on map</p>
-    <p style="margin: 5px 0; font-size: 12px; color: #666;">Use sidebar to view images</p>
-    </div>
-    '''
-    m.get_root().html.add_child(folium.Element(pothole_legend_html))
+        st.session_state.fallback_images_path = find_images_folder_fallback()
+
+    if st.session_state.sidebar_visible:
+        st.sidebar.info(f"🔍 Using fallback images folder: {st.session_state.fallback_images_path}")
+    return st.session_state.fallback_images_path
+
+# (lats, lons, iri) along the dense sliding-window profile, or None without GPS columns
+def iri_track(iri_result):
+    df_processed = iri_result['df_processed']
+    if 'latitude' not in df_processed.columns or 'longitude' not in df_processed.columns:
+        return None
+    profile = iri_result['profile']
+    center_index = profile['center_index'][profile['center_index'] < len(df_processed)]
+    iri_profile = profile['iri'][:len(center_index)]
+    lats = np.asarray(df_processed['latitude'])[center_index]
+    lons = np.asarray(df_processed['longitude'])[center_index]
+    return lats, lons, iri_profile
+
+# Builds the folium map with every enabled layer and its legend; iri_geojson, vehicle_markers and
+# pothole_markers are the prepared layers (see get_iri_geojson and get_marker_layer). Without data
+# layers it is the base map for viewport mode: tiles and legends only, the data is added per view
+# by ViewportLayers.
+def build_map(map_style, layer_controls, iri_result, vehicle_df, pothole_df, with_data_layers=True,
+              iri_geojson=None, vehicle_markers=None, pothole_markers=None):
+    # Determine map center (Priority: 1. Pothole, 2. Vehicles, 3. IRI), default to Manila
+    center_lat, center_lon = 14.5995, 120.9842
+    if pothole_df is not None and layer_controls['pothole_images'] and len(pothole_df) > 0:
+        center_lat, center_lon = pothole_df['latitude'].mean(), pothole_df['longitude'].mean()
+    elif vehicle_df is not None and layer_controls['vehicles'] and len(vehicle_df) > 0:
+        center_lat, center_lon = vehicle_df['latitude'].mean(), vehicle_df['longitude'].mean()
+    elif iri_result and layer_controls['iri']:
+        df_processed = iri_result['df_processed']
+        if 'latitude' in df_processed.columns and 'longitude' in df_processed.columns:
+            # Segment centres that have an IRI value
+            center_index = np.asarray(iri_result['segments']['center_index'])[:len(iri_result['iri_values'])]
+            center_index = center_index[(center_index >= 0) & (center_index < len(df_processed))]
+            if len(center_index) > 0:
+                center_lat = np.mean(np.asarray(df_processed['latitude'])[center_index])
+                center_lon = np.mean(np.asarray(df_processed['longitude'])[center_index])
+
+    # Select tile layer based on user choice
+    tile_configs = {
+        "OpenStreetMap": {
+            "tiles": "OpenStreetMap",
+            "attr": "© OpenStreetMap contributors"
+        },
+
+        "Satellite": {
+            "tiles": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+            "attr": "Esri, Maxar, Earthstar Geographics"
+        },
+
+        "3D Terrain": {
+            "tiles": "https://server.arcgisonline.com/ArcGIS/rest/services/World_Topo_Map/MapServer/tile/{z}/{y}/{x}",
+            "attr": "Esri, HERE, Garmin, Intermap, increment P Corp."
+        },
+
+        "Dark Mode": {
+            "tiles": "CartoDB dark_matter",
+            "attr": "© OpenStreetMap contributors, © CartoDB"
+        }
+    }
+
+    tile_config = tile_configs[map_style]
+
+    # Create base map with selected style and enhanced controls
+    if map_style == "Satellite" or map_style == "3D Terrain":
+        m = folium.Map(location=[float(center_lat), float(center_lon)],
+                        zoom_start = 15,
+                        tiles=None,
+                        control_scale=True
+        )
+        folium.TileLayer(tiles=tile_config["tiles"],
+                        attr = tile_config["attr"],
+                        name=map_style,
+                        overlay = False,
+                        control = False
+        ).add_to(m)
+
+    else: 
+        m = folium.Map(location = [float(center_lat), float(center_lon)],
+                        zoom_start=15,
+                        tiles = tile_config["tiles"],
+                        attr=tile_config["attr"],
+                        control_scale=True
+        )
+
+    # Add IRI data to map if available (only if GPS data is available)
+    if with_data_layers and iri_geojson is not None and layer_controls['iri']:
+        # Color-changing continuous line, one GeoJSON layer, one line feature per run of equal
+        # quality class (see utils/map_layers.py)
+        add_iri_geojson(m, iri_geojson)
+
+    # Add pothole images to map if available; large sets are clustered in the browser (see utils/map_layers.py)
+    if with_data_layers and pothole_markers is not None and layer_controls['pothole_images']:
+        add_marker_layer(m, pothole_markers)
+
+    # Add vehicle markers to map if available
+    if with_data_layers and vehicle_markers is not None and layer_controls['vehicles']:
+        add_marker_layer(m, vehicle_markers)
+
+    # Add legend for IRI values if IRI data is available
+    if iri_result and layer_controls['iri']:
+        legend_html = '''
+        <div style="position: fixed; 
+                    bottom: 50px; left: 50px; width: 220px; height: 180px; 
+                    background-color: white; border: 2px solid #333; border-radius: 8px; z-index:9999; 
+                    font-size:14px; padding: 15px; box-shadow: 0 4px 8px rgba(0,0,0,0.2);">
+        <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px; text-align: center; border-bottom: 1px solid #ccc; padding-bottom: 5px;">IRI Quality Legend</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 12px; height: 12px; background-color: green; border-radius: 50%; margin-right: 8px;"></span> Good (≤3)</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 12px; height: 12px; background-color: yellow; border-radius: 50%; margin-right: 8px;"></span> Fair (3-5)</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 12px; height: 12px; background-color: orange; border-radius: 50%; margin-right: 8px;"></span> Poor (5-7)</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 12px; height: 12px; background-color: red; border-radius: 50%; margin-right: 8px;"></span> Bad (>7)</p>
+        </div>
+        '''
+        m.get_root().html.add_child(folium.Element(legend_html))
+
+    # Add legend for vehicle markers if available
+    if vehicle_df is not None and layer_controls['vehicles']:
+        vehicle_legend_html = '''
+        <div style="position: fixed; 
+                    top: 50px; right: 50px; width: 200px; height: 160px; 
+                    background-color: white; border: 2px solid #333; border-radius: 8px; z-index:9999; 
+                    font-size:14px; padding: 15px; box-shadow: 0 4px 8px rgba(0,0,0,0.2);">
+        <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px; text-align: center; border-bottom: 1px solid #ccc; padding-bottom: 5px;">🚗 Vehicle Detections</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: blue; border-radius: 50%; margin-right: 8px;"></span> 🚗 Car</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: orange; border-radius: 50%; margin-right: 8px;"></span> 🚛 Truck</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: green; border-radius: 50%; margin-right: 8px;"></span> 🏍️ Motorcycle</p>
+        </div>
+        '''
+        m.get_root().html.add_child(folium.Element(vehicle_legend_html))
+
+    # Add legend for pothole images if available
+    if pothole_df is not None and layer_controls['pothole_images']:
+        pothole_legend_html = '''
+        <div style="position: fixed; 
+                    bottom: 50px; right: 50px; width: 240px; height: 170px; 
+                    background-color: white; border: 2px solid #333; border-radius: 8px; z-index:9999; 
+                    font-size:14px; padding: 15px; box-shadow: 0 4px 8px rgba(0,0,0,0.2);">
+        <p style="margin: 0 0 10px 0; font-weight: bold; font-size: 16px; text-align: center; border-bottom: 1px solid #ccc; padding-bottom: 5px;">🚧 Pothole Detections</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: red; border-radius: 50%; margin-right: 8px;"></span> Pothole with Image</p>
+        <p style="margin: 5px 0;"><span style="display: inline-block; width: 16px; height: 16px; background-color: orange; border-radius: 50%; margin-right: 8px;"></span> Pothole (No Image)</p>
+        <p style="margin: 5px 0; font-size: 12px; color: #666;">All markers shown on map</p>
+        <p style="margin: 5px 0; font-size: 12px; color: #666;">Use sidebar to view images</p>
+        </div>
+        '''
+        m.get_root().html.add_child(folium.Element(pothole_legend_html))
+
+    return m
+
+# Content hash of a loaded dataset, computed once per object and remembered for the session
+def dataset_version(name, data, parts=lambda data: [data]):
+    if data is None:
+        return None
+    versions = st.session_state.setdefault('dataset_versions', {})
+    seen = versions.get(name)
+    if seen is None or seen[0] is not data:
+        seen = (data, content_hash(*parts(data)))
+        versions[name] = seen
+    return seen[1]
+
+# The IRI layer only depends on the profile, the segment centres and the GPS columns
+def iri_map_parts(result):
+    df_processed = result['df_processed']
+    gps_cols = [col for col in ['latitude', 'longitude'] if col in df_processed.columns]
+    return [result['profile']['center_index'], result['profile']['iri'], result['segments']['center_index'],
+            result['iri_values'], df_processed[gps_cols]]
+
+# IRI line GeoJSON per IRI data version, shared across reruns and sessions. It is kept as a JSON
+# string, which no session can change; the folium.Map around it is built fresh on every rerun, as
+# folium objects are modified by rendering and must not be shared.
+@st.cache_resource(max_entries=8, show_spinner="Preparing IRI layer...")
+def get_iri_geojson(iri_version, _iri_result, _on_build):
+    _on_build()
+    track = iri_track(_iri_result)
+    return json.dumps(iri_line_geojson(*track)) if track is not None else None
+
+# Vehicle or pothole marker layer per data version, shared like the IRI layer: marker arguments
+# with their popups (page thumbnails included, as base64) and the clustered data, as a JSON string.
+# The pothole layer also depends on the sidebar page and the images folder.
+@st.cache_resource(max_entries=16, show_spinner="Preparing markers...")
+def get_marker_layer(layer, data_version, pothole_page, images_base_path, _data, _on_build):
+    _on_build()
+    if layer == 'vehicles':
+        return json.dumps(vehicle_layer(_data))
+    return json.dumps(pothole_layer(_data, images_base_path, page=pothole_page, page_size=10))
+
+# Spatial indexes of the enabled layers, rebuilt only when the data changes
+@st.cache_resource(max_entries=4, show_spinner="Indexing map data...")
+def get_viewport_layers(data_versions, images_base_path, _datasets):
+    iri_result, vehicle_df, pothole_df = _datasets
+    return ViewportLayers(iri_track(iri_result) if iri_result else None, vehicle_df, pothole_df, images_base_path)
+
+# Prepared layer requests and builds (cache misses) in this session, and the map builds that
+# needed no layer rebuilt
+if 'map_cache_stats' not in st.session_state:
+    st.session_state.map_cache_stats = {'requests': 0, 'builds': 0, 'maps': 0, 'cached_maps': 0}
+
+def record_map_build():
+    st.session_state.map_cache_stats['builds'] += 1
+
+iri_result = st.session_state.iri_calculation_result if layer_controls['iri'] else None
+vehicle_df = st.session_state.vehicle_data if layer_controls['vehicles'] else None
+pothole_df = st.session_state.pothole_images_data if layer_controls['pothole_images'] else None
+images_base_path = get_images_base_path() if pothole_df is not None else None
+
+# The page only matters when its pothole images are on the map
+pothole_page = st.session_state.get('pothole_page', 0) if pothole_df is not None else 0
+data_versions = (
+    dataset_version('iri', iri_result, iri_map_parts),
+    dataset_version('vehicles', vehicle_df),
+    dataset_version('potholes', pothole_df)
+)
+
+# In viewport mode the base map has no data layers; ViewportLayers draws them per view itself
+map_start = time.perf_counter()
+stats = st.session_state.map_cache_stats
+builds_before = stats['builds']
+iri_geojson, vehicle_markers, pothole_markers = None, None, None
+if not viewport_mode:
+    if iri_result is not None:
+        stats['requests'] += 1
+        iri_geojson = get_iri_geojson(data_versions[0], _iri_result=iri_result, _on_build=record_map_build)
+    if vehicle_df is not None:
+        stats['requests'] += 1
+        vehicle_markers = get_marker_layer('vehicles', data_versions[1], None, None,
+                                           _data=vehicle_df, _on_build=record_map_build)
+    if pothole_df is not None:
+        stats['requests'] += 1
+        pothole_markers = get_marker_layer('potholes', data_versions[2], pothole_page, images_base_path,
+                                           _data=pothole_df, _on_build=record_map_build)
+    if any(data is not None for data in (iri_result, vehicle_df, pothole_df)):
+        stats['maps'] += 1
+        stats['cached_maps'] += stats['builds'] == builds_before
+
+m = build_map(map_style, layer_controls, iri_result, vehicle_df, pothole_df, with_data_layers=not viewport_mode,
+              iri_geojson=iri_geojson, vehicle_markers=vehicle_markers, pothole_markers=pothole_markers)
+map_build_seconds = time.perf_counter() - map_start
+
+# The base map depends on these only; a new one opens at its own centre, not the last view
+map_key = (data_versions, map_style, tuple(sorted(layer_controls.items())))
+
+# Data for the current view: the bounds and zoom the map last reported, as long as they come from this
+# base map (a new one opens at its own centre), otherwise the area a fresh map shows around its centre
+visible_layer, visible_summary = None, None
+if viewport_mode:
+    map_state = st.session_state.get('main_map') if st.session_state.get('main_map_key') == map_key else None
+    st.session_state.main_map_key = map_key
+    bounds = view_bounds(map_state)
+    zoom = map_state.get('zoom') if bounds is not None else None
+    if bounds is None or not isinstance(zoom, (int, float)):
+        zoom = m.options.get('zoom', 15)
+        bounds = approximate_bounds(*m.location, zoom)
+    visible_layer, visible_summary = get_viewport_layers(data_versions, images_base_path,
+                                                         _datasets=(iri_result, vehicle_df, pothole_df)).feature_group(
+        bounds, zoom, pothole_page=pothole_page)
+
+if st.session_state.sidebar_visible:
+    hits = stats['requests'] - stats['builds']
+    reuse = (f"; layer cache: {stats['cached_maps']} of {stats['maps']} maps reused every layer "
+             f"({stats['cached_maps'] / stats['maps']:.0%} hit rate), {hits} of {stats['requests']} layers"
+             if stats['maps'] else "")
+    st.sidebar.caption(f"Map built in {map_build_seconds:.2f} s{reuse}")
+    if visible_summary:
+        st.sidebar.caption("In view: " + ", ".join(
+            f"{layer} {counts['in_view']:,}" + (" (aggregated)" if counts['aggregated'] else "")
+            for layer, counts in visible_summary.items()
+        ))
 
 # Add comprehensive CSS to make map cover full main area
 st.markdown("""
@@ -1479,5 +1454,10 @@ window.addEventListener('resize', resizeMapAndRemoveHeader);
             unsafe_allow_html=True)
 
 # Display the full-screen map covering the entire main area
-map_data = st_folium(m, width=None, height=1000)
+if viewport_mode:
+    # Only the visible data changes between reruns; st_folium swaps that layer without reloading the map
+    map_data = st_folium(m, key='main_map', width=None, height=1000, feature_group_to_add=visible_layer,
+                         returned_objects=['bounds', 'zoom'])
+else:
+    map_data = st_folium(m, width=None, height=1000)
 
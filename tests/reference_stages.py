@@ -0,0 +1,66 @@
+"""Original per-row implementations of the optimized stages, for the tests to compare against.
+
+Copies of the code the vectorized versions replaced. They are slow on purpose;
+keep them as written.
+"""
+from math import atan2, cos, radians, sin, sqrt
+
+import numpy as np
+
+from utils import quarter_car
+
+
+# Per-row haversine speed, as calculate_speed_from_gps was originally written
+def speed_from_gps(df):
+    speeds = []
+    for i in range(len(df)):
+        if i == 0:
+            speeds.append(0)
+        else:
+            lat1, lon1 = radians(df.iloc[i-1]['latitude']), radians(df.iloc[i-1]['longitude'])
+            lat2, lon2 = radians(df.iloc[i]['latitude']), radians(df.iloc[i]['longitude'])
+            dlat = lat2 - lat1
+            dlon = lon2 - lon1
+            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+            c = 2*atan2(sqrt(a), sqrt(1-a))
+            distance = 6371000 * c
+            dt = df.iloc[i]['time'] - df.iloc[i-1]['time']
+            if dt > 0:
+                speeds.append(distance/dt)
+            else:
+                speeds.append(speeds[-1] if speeds else 0)
+    return np.array(speeds)
+
+
+# List of per-segment dicts, one argmin over the whole distance array per boundary,
+# as _create_segments was originally written
+def create_segments(distance, vertical_accel, speed, segment_length):
+    segments = []
+    for start_dist in np.arange(0, distance[-1] - segment_length, segment_length):
+        end_dist = start_dist + segment_length
+        start_idx = np.argmin(np.abs(distance - start_dist))
+        end_idx = np.argmin(np.abs(distance - end_dist))
+
+        if end_idx > start_idx:
+            segments.append({
+                'distance_start': start_dist,
+                'distance_end': end_dist,
+                'vertical_accel': vertical_accel[start_idx:end_idx],
+                'speed': speed[start_idx:end_idx],
+                'length': segment_length,
+                'center_index': start_idx + (end_idx - start_idx) // 2
+            })
+    return segments
+
+
+# Per-sample quarter-car loop from the ASTM E1926 / Sayers listing
+def loop_rectified_slope(slope, dx):
+    ST, PR = quarter_car.state_transition(dx)
+    PR = PR.ravel()
+    initial = np.mean(slope[:max(1, int(round(quarter_car.INITIAL_LENGTH / dx)))])
+    Z = np.array([initial, 0.0, initial, 0.0])
+    rectified = np.empty(len(slope))
+    for i, value in enumerate(slope):
+        Z = ST @ Z + PR * value
+        rectified[i] = abs(Z[0] - Z[2])
+    return rectified
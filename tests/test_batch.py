@@ -0,0 +1,27 @@
+import os
+
+from utils.batch import output_path, run_batch
+from utils.synthetic import synthesize_run, write_csv
+
+
+# Same-named recordings in different folders must not overwrite each other's segment table
+def test_recursive_batch_mirrors_input_tree(tmp_path):
+    run, _ = synthesize_run(60, 100, seed=0)
+    for folder in ('a', 'b', 'iri_results_old'):
+        os.makedirs(tmp_path / folder)
+        write_csv(run, str(tmp_path / folder / 'drive.csv'))
+
+    summary = run_batch(str(tmp_path), workers=1, recursive=True)
+
+    assert list(summary['status']) == ['ok'] * 3
+    for folder in ('a', 'b', 'iri_results_old'):
+        assert (tmp_path / 'iri_results' / folder / 'drive_iri.csv').exists()
+
+    # A second run skips the results inside the input tree, but not a folder that only shares their prefix
+    summary = run_batch(str(tmp_path), workers=1, recursive=True)
+    assert len(summary) == 3
+
+
+def test_output_path_without_input_dir_uses_file_name():
+    assert output_path('/data/a/drive.csv', '/out') == os.path.join('/out', 'drive_iri.csv')
+    assert output_path('/data/a/drive.csv', '/out', '/data') == os.path.join('/out', 'a', 'drive_iri.csv')
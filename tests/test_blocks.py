@@ -0,0 +1,81 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.batch import process_file
+from utils.blocks import MIN_BLOCK_SAMPLES, find_blocks, process_blocks
+from utils.iri_calculator import IRICalculator
+from utils.synthetic import synthesize_run, write_csv
+
+# Rows of the 100 Hz run below: a 5 min pause after row 6000, a 50-sample burst, then a 1 min pause
+PAUSE_ROW, BURST_END = 6000, 6050
+
+
+# 150 s drive with two recording pauses, as a synthetic run dict
+def paused_run():
+    run, _ = synthesize_run(150, 100, seed=5)
+    run['time'] = run['time'] + np.where(np.arange(len(run['time'])) >= PAUSE_ROW, 300.0, 0.0) \
+        + np.where(np.arange(len(run['time'])) >= BURST_END, 60.0, 0.0)
+    return run
+
+
+def run_frame(run):
+    return pd.DataFrame({col: values for col, values in run.items() if isinstance(values, np.ndarray)})
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def test_find_blocks_splits_at_gaps_and_rate_changes():
+    time = np.concatenate([np.arange(1000) * 0.01, 20 + np.arange(50) * 0.01, 30 + np.arange(2000) * 0.02])
+    np.testing.assert_array_equal(find_blocks(time, min_samples=0), [[0, 1000], [1000, 1050], [1050, 3050]])
+    np.testing.assert_array_equal(find_blocks(time), [[0, 1000], [1050, 3050]])
+
+    # The step from 100 Hz to 50 Hz is found to within one rate window
+    time = np.concatenate([np.arange(3000) * 0.01, 30 + np.arange(3000) * 0.02])
+    blocks = find_blocks(time)
+    assert len(blocks) == 2 and abs(blocks[0, 1] - 3000) <= 500
+
+
+# A pause adds no distance: the next block continues where the previous processed block ended
+def test_block_distances_skip_pauses_and_dropped_blocks():
+    df = run_frame(paused_run())
+    iri_values, segments, _, _ = quiet(process_blocks, df, 100, workers=1)
+
+    calc = IRICalculator()
+    first = df.iloc[:PAUSE_ROW]
+    first_distance = calc.calculate_distance(first['time'].values, calc.estimate_speed(first))[-1]
+    second_start = segments['distance_start'][segments['block'] == 1][0]
+    assert second_start == pytest.approx(first_distance)
+
+    np.testing.assert_array_equal(np.diff(segments['distance_start']) > 0, True)
+    assert segments['dropped_blocks'] == [(PAUSE_ROW, BURST_END)]
+    assert BURST_END - PAUSE_ROW < MIN_BLOCK_SAMPLES
+    assert np.all(segments['start_index'][segments['block'] == 1] >= BURST_END)
+    assert len(iri_values) == len(segments['block'])
+
+
+# Without gaps there is one block, the same as the whole-run RMS method
+def test_single_block_matches_rms_method():
+    run, _ = synthesize_run(120, 100, seed=6)
+    df = run_frame(run)
+    iri_values, segments, _, _ = quiet(process_blocks, df, 100, workers=1)
+    expected, expected_segments, _, _ = quiet(IRICalculator().calculate_iri_rms_method, df, 100)
+
+    np.testing.assert_array_equal(segments['block'], 0)
+    assert segments['dropped_blocks'] == []
+    np.testing.assert_allclose(segments['distance_start'], expected_segments['distance_start'])
+    np.testing.assert_allclose(iri_values, expected, rtol=1e-12)
+
+
+# Batch records the skipped row ranges in the summary
+def test_batch_summary_lists_dropped_blocks(tmp_path):
+    write_csv(paused_run(), str(tmp_path / 'paused.csv'))
+    summary = process_file(str(tmp_path / 'paused.csv'), str(tmp_path / 'out'), split_gaps=True)
+    assert summary['status'] == 'ok'
+    assert summary['dropped_blocks'] == f"{PAUSE_ROW}-{BURST_END}"
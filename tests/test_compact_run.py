@@ -0,0 +1,42 @@
+import numpy as np
+
+from utils.compact_run import CompactRun, Held
+from utils.iri_calculator import PREFIX_BLOCK, BlockPrefixSum
+
+
+# 1 Hz fixes held over 100 Hz samples are stored as runs and decode bit for bit
+def test_held_gps_channels_round_trip_exactly():
+    rng = np.random.default_rng(0)
+    fixes = 14.5 + rng.normal(0, 1e-3, 50)
+    latitude = np.repeat(fixes, 100)
+    latitude[:150] = np.nan                      # no fix yet at the start
+    run = CompactRun({'latitude': latitude})
+
+    assert isinstance(run._channels['latitude'], Held)
+    assert np.array_equal(run['latitude'], latitude, equal_nan=True)
+    assert run.copy(deep=True).nbytes == run.nbytes < latitude.nbytes / 10
+
+
+# Interpolated (aligned) positions fall back to the offset encoding
+def test_changing_gps_channels_are_not_held():
+    latitude = 14.5 + np.arange(1000) * 1e-7
+    run = CompactRun({'latitude': latitude})
+
+    assert run.storage()['latitude'] == 'float64 base + float32 offsets'
+    assert np.max(np.abs(run['latitude'] - latitude)) < 1e-7
+
+
+# Float32 block offsets keep every window sum within the documented 2^-23 block-sum bound
+def test_block_prefix_sum_window_error_bound():
+    rng = np.random.default_rng(1)
+    values = rng.normal(0, 2, 3 * PREFIX_BLOCK + 17)**2
+    exact = np.concatenate([[0.0], np.cumsum(values)])
+    compact = BlockPrefixSum(values)
+    start = rng.integers(0, len(values) // 2, 200)
+    end = start + rng.integers(1, len(values) // 2, 200)
+
+    error = np.abs((compact[end] - compact[start]) - (exact[end] - exact[start]))
+    block_sum = max(values[i:i + PREFIX_BLOCK].sum() for i in range(0, len(values), PREFIX_BLOCK))
+    assert len(compact) == len(exact)
+    assert np.max(error) <= 2.0**-23 * block_sum
+    assert abs(compact[-1] - exact[-1]) <= 2.0**-24 * block_sum
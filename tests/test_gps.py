@@ -0,0 +1,56 @@
+import numpy as np
+
+from utils.gps import align_gps, cumulative_geodesic_distance, fix_rows
+from utils.iri_calculator import EARTH_RADIUS
+
+
+# 100 Hz timeline over 40 s with a fix every second, NaN in between, no fixes from 10 s to 20 s and none after 29 s
+def sparse_track():
+    time = np.arange(4000) / 100.0
+    fix = (np.arange(4000) % 100 == 0) & ((time < 10) | ((time > 20) & (time < 30)))
+    lat = np.where(fix, 14.6 + time * 1e-4, np.nan)
+    lon = np.where(fix, 121.0, np.nan)
+    return time, lat, lon, fix
+
+
+# One degree along a meridian is R * pi / 180; consecutive steps add up
+def test_cumulative_geodesic_distance():
+    distance = cumulative_geodesic_distance([0.0, 0.5, 1.0], [10.0, 10.0, 10.0])
+    np.testing.assert_allclose(distance, [0.0, EARTH_RADIUS * np.pi / 360, EARTH_RADIUS * np.pi / 180], rtol=1e-12)
+
+
+# Rows repeating the previous position are not new fixes
+def test_fix_rows_skip_repeats_and_nan():
+    lat = np.array([np.nan, 1.0, 1.0, np.nan, 2.0, 2.0, 3.0])
+    lon = np.array([np.nan, 5.0, 5.0, np.nan, 5.0, 5.0, 5.0])
+    np.testing.assert_array_equal(fix_rows(lat, lon), [1, 4, 6])
+
+
+# Positions and distance are linear in time between fixes, including across the 10 s gap
+def test_interpolates_between_fixes():
+    time, lat, lon, fix = sparse_track()
+    aligned = align_gps(time, lat, lon)
+
+    np.testing.assert_allclose(aligned['latitude'][time <= 29], 14.6 + time[time <= 29] * 1e-4, rtol=1e-12)
+    np.testing.assert_array_equal(aligned['longitude'], 121.0)
+    fix_distance = cumulative_geodesic_distance(lat[fix], lon[fix])
+    np.testing.assert_allclose(aligned['gps_distance'][fix], fix_distance, rtol=1e-12)
+    np.testing.assert_allclose(aligned['speed'], EARTH_RADIUS * np.radians(1e-4), rtol=1e-6)
+
+
+# Samples from the fix before a long gap up to the next fix, or more than stale_after past the last fix,
+# are stale; the rest are fresh
+def test_stale_flags_and_age():
+    time, lat, lon, _ = sparse_track()
+    aligned = align_gps(time, lat, lon, stale_after=3.0)
+
+    in_gap = (time >= 9) & (time < 21)
+    after_last = time > 29 + 3.0
+    np.testing.assert_array_equal(aligned['gps_stale'], in_gap | after_last)
+    np.testing.assert_allclose(aligned['gps_age'][:100], time[:100])
+    np.testing.assert_allclose(aligned['gps_age'][1500], 15.0 - 9.0)
+
+
+def test_fewer_than_two_fixes():
+    time = np.arange(10.0)
+    assert align_gps(time, np.where(time == 3, 14.6, np.nan), np.where(time == 3, 121.0, np.nan)) is None
@@ -0,0 +1,110 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import ingest
+from utils.ingest import iter_sensor_csv, parse_time, read_sensor_csv
+from utils.iri_calculator import IRICalculator
+from utils.synthetic import synthesize_run, write_csv
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    run, _ = synthesize_run(30, 100, seed=9)
+    write_csv(run, str(tmp_path / 'drive.csv'))
+    # Physics Toolbox exports carry extra channels the pipeline does not read
+    df = pd.read_csv(tmp_path / 'drive.csv')
+    df.insert(4, 'gFx', 0.5)
+    df.to_csv(tmp_path / 'drive.csv', index=False)
+    return str(tmp_path / 'drive.csv')
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+# preprocess_data output of the original loader: pd.read_csv with inferred types.
+# pyarrow parses floats correctly rounded, where the C parser's default can be one ulp off,
+# so it is compared with the C parser's round-trip mode.
+def old_path(csv_file, engine='c'):
+    float_precision = 'round_trip' if engine == 'pyarrow' else None
+    return quiet(IRICalculator().preprocess_data, pd.read_csv(csv_file, float_precision=float_precision))
+
+
+def assert_same_run(df, csv_file, engine='c'):
+    processed, duration = quiet(IRICalculator().preprocess_data, df)
+    expected, expected_duration = old_path(csv_file, engine)
+    pd.testing.assert_frame_equal(processed, expected, check_exact=True)
+    assert duration == expected_duration
+
+
+# Both engines, from a path or from uploaded bytes, give the old loader's preprocessed run
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+def test_read_sensor_csv_matches_read_csv(csv_path, engine):
+    if engine == 'pyarrow' and not ingest.HAS_PYARROW:
+        pytest.skip("pyarrow not installed")
+    df = quiet(read_sensor_csv, csv_path, engine=engine)
+
+    assert 'gFx' not in df.columns
+    assert all(df[col].dtype == np.float64 for col in ingest.NUMERIC_COLUMNS if col in df.columns)
+    assert df.attrs['ingest']['engine'] == engine and df.attrs['ingest']['rows'] == len(df)
+    assert_same_run(df, csv_path, engine)
+
+    with open(csv_path, 'rb') as f:
+        upload = io.BytesIO(f.read())
+    assert_same_run(quiet(read_sensor_csv, upload, engine=engine), csv_path, engine)
+
+
+def test_auto_engine_without_pyarrow(csv_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'HAS_PYARROW', False)
+    assert quiet(read_sensor_csv, csv_path).attrs['ingest']['engine'] == 'c'
+
+
+# A non-numeric value fails the typed read; the untyped fallback turns it into NaN like the old path
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+def test_non_numeric_values_fall_back(tmp_path, csv_path, engine):
+    if engine == 'pyarrow' and not ingest.HAS_PYARROW:
+        pytest.skip("pyarrow not installed")
+    df = pd.read_csv(csv_path, dtype=str)
+    df.loc[10, 'az'] = 'n/a'
+    df.loc[20, 'speed'] = '--'
+    df.to_csv(tmp_path / 'junk.csv', index=False)
+
+    loaded = quiet(read_sensor_csv, str(tmp_path / 'junk.csv'), engine=engine)
+    assert np.isnan(loaded['az'][10]) and np.isnan(loaded['speed'][20])
+    assert_same_run(loaded, str(tmp_path / 'junk.csv'))        # the fallback reads with the C parser
+
+    with open(tmp_path / 'junk.csv', 'rb') as f:
+        upload = io.BytesIO(f.read())
+    assert_same_run(quiet(read_sensor_csv, upload, engine=engine), str(tmp_path / 'junk.csv'))
+
+
+# ISO-8601 with varying fraction digits (which breaks format inference) and with offsets;
+# other layouts use the general parser
+def test_parse_time():
+    iso = pd.Series(['2025-08-01T08:00:00', '2025-08-01T08:00:00.5', '2025-08-01T08:00:00.25',
+                     '2025-08-01T08:00:01.000001'])
+    seconds = (parse_time(iso) - parse_time(iso[:1])[0]).dt.total_seconds()
+    np.testing.assert_allclose(seconds, [0.0, 0.5, 0.25, 1.000001], atol=1e-9)
+
+    offsets = pd.Series(['2025-08-01T08:00:00.5+08:00', '2025-08-01T08:00:01+08:00'])
+    np.testing.assert_allclose((parse_time(offsets) - parse_time(offsets)[0]).dt.total_seconds(), [0.0, 0.5])
+
+    other = pd.Series(['08/01/2025 08:00:00.10', '08/01/2025 08:00:00.20'])
+    np.testing.assert_array_equal(parse_time(other), pd.to_datetime(other))
+
+
+# The streamed chunks put together are the whole-file read, junk values included
+def test_iter_sensor_csv_matches_read_sensor_csv(tmp_path, csv_path):
+    df = pd.read_csv(csv_path, dtype=str)
+    df.loc[1234, 'ax'] = 'bad'
+    df.to_csv(tmp_path / 'junk.csv', index=False)
+
+    chunks = list(iter_sensor_csv(str(tmp_path / 'junk.csv'), chunksize=700))
+    assert len(chunks) > 1
+    streamed = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(streamed, quiet(read_sensor_csv, str(tmp_path / 'junk.csv'), engine='c'))
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import reference_stages
+from utils.iri_calculator import CumulativeRun, IRICalculator, _nearest_indices
+
+
+# Non-decreasing distance with stops (repeated values), like the integrated speed of a drive
+def drive_distance(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    steps = rng.uniform(0, 0.3, n_rows)
+    steps[rng.random(n_rows) < 0.05] = 0.0
+    return np.cumsum(steps)
+
+
+@pytest.fixture
+def segment_inputs():
+    rng = np.random.default_rng(3)
+    distance = drive_distance(30_000)
+    return distance, rng.normal(0, 0.8, len(distance)), rng.uniform(5, 25, len(distance))
+
+
+# Vectorized haversine speed equals the original per-row loop, including the zero-dt fallback
+def test_speed_from_gps_matches_reference_loop():
+    rng = np.random.default_rng(2)
+    n_rows = 2000
+    time = np.cumsum(rng.choice([0.0, 0.01, 0.02], n_rows))
+    df = pd.DataFrame({'time': time,
+                       'latitude': 14.5995 + np.cumsum(rng.normal(0, 1e-5, n_rows)),
+                       'longitude': 120.9842 + np.cumsum(rng.normal(0, 1e-5, n_rows))})
+
+    speed = IRICalculator().calculate_speed_from_gps(df)
+    np.testing.assert_allclose(speed, reference_stages.speed_from_gps(df), rtol=1e-9, atol=1e-9)
+    assert IRICalculator().calculate_speed_from_gps(df.drop(columns=['longitude'])) is None
+
+
+# Same indices as np.argmin(|values - target|), including ties, repeats and targets out of range
+def test_nearest_indices_match_argmin():
+    values = np.round(drive_distance(5000), 1)          # rounding adds exact ties and repeated values
+    rng = np.random.default_rng(1)
+    targets = np.concatenate([rng.uniform(-5, values[-1] + 5, 2000), values[::97],
+                              (values[:-1:89] + values[1::89]) / 2, [values[0], values[-1]]])
+
+    expected = [np.argmin(np.abs(values - target)) for target in targets]
+    np.testing.assert_array_equal(_nearest_indices(values, targets), expected)
+
+
+def test_nearest_indices_of_empty_values():
+    assert list(_nearest_indices(np.zeros(0), [1.0, 2.0])) == [0, 0]
+
+
+# One searchsorted pass gives the segments of the original per-segment argmin loop
+@pytest.mark.parametrize('segment_length', [10, 100, 250])
+def test_create_segments_matches_reference_loop(segment_inputs, segment_length):
+    distance, vertical, speed = segment_inputs
+    segments = IRICalculator()._create_segments(distance, vertical, speed, segment_length)
+    expected = reference_stages.create_segments(distance, vertical, speed, segment_length)
+
+    assert len(segments['rms']) == len(expected) > 0
+    np.testing.assert_array_equal(segments['distance_start'], [s['distance_start'] for s in expected])
+    np.testing.assert_array_equal(segments['center_index'], [s['center_index'] for s in expected])
+    np.testing.assert_allclose(segments['rms'], [np.sqrt(np.mean(s['vertical_accel']**2)) for s in expected],
+                               rtol=1e-10)
+    np.testing.assert_allclose(segments['mean_speed'], [np.mean(s['speed']) for s in expected], rtol=1e-10)
+
+
+# Prefix-sum segmentation gives the same table as segmenting the samples directly
+@pytest.mark.parametrize('segment_length', [10, 25, 100, 250])
+def test_cumulative_run_matches_direct_segmentation(segment_inputs, segment_length):
+    distance, vertical, speed = segment_inputs
+    calc = IRICalculator()
+    direct = calc._create_segments(distance, vertical, speed, segment_length)
+    iri_values, segments = CumulativeRun(calc, distance, vertical, speed).iri(segment_length)
+
+    assert len(iri_values) == len(direct['rms']) > 0
+    for key in ('distance_start', 'start_index', 'end_index', 'center_index'):
+        np.testing.assert_array_equal(segments[key], direct[key])
+    np.testing.assert_allclose(segments['rms'], direct['rms'], rtol=1e-10)
+    np.testing.assert_allclose(segments['mean_speed'], direct['mean_speed'], rtol=1e-10)
+    np.testing.assert_allclose(iri_values, calc._calculate_segment_iri(direct['rms'], direct['mean_speed']),
+                               rtol=1e-10)
+
+
+# One run serves several lengths, each the same as asking for it alone
+def test_cumulative_run_iri_for_lengths(segment_inputs):
+    run = CumulativeRun(IRICalculator(), *segment_inputs)
+    sweep = run.iri_for_lengths([25, 100])
+    for length, (iri_values, _) in sweep.items():
+        np.testing.assert_array_equal(iri_values, run.iri(length)[0])
+
+
+# A profile whose step equals the window is the segment table; overlapping windows match a direct sum
+def test_profile_windows(segment_inputs):
+    distance, vertical, speed = segment_inputs
+    calc = IRICalculator()
+    run = CumulativeRun(calc, distance, vertical, speed)
+    _, segments = run.iri(100)
+    np.testing.assert_allclose(run.profile(100, 100)['iri'],
+                               calc._calculate_segment_iri(segments['rms'], segments['mean_speed']))
+
+    profile = run.profile(100, 5)
+    np.testing.assert_allclose(profile['chainage'], profile['distance_start'] + 50)
+    np.testing.assert_array_equal(profile['start_index'], _nearest_indices(distance, profile['distance_start']))
+    rms = [np.sqrt(np.mean(vertical[i:j]**2)) for i, j in zip(profile['start_index'], profile['end_index'])]
+    np.testing.assert_allclose(profile['rms'], rms, rtol=1e-9)
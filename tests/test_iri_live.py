@@ -0,0 +1,43 @@
+import numpy as np
+
+from utils.iri_calculator import _haversine_distance
+from utils.iri_live import LIVE_COLUMNS, MAX_DATAGRAM_BYTES, LiveIRIEngine, format_datagrams, parse_datagram
+
+
+# Full-precision floats make 500 rows exceed one UDP payload; they must be split, not truncated
+def test_datagrams_fit_udp_payload_and_round_trip():
+    rng = np.random.default_rng(0)
+    rows = rng.standard_normal((2000, len(LIVE_COLUMNS))) * 1e3 + np.pi
+    rows[::7, 6] = np.nan
+    datagrams = list(format_datagrams(rows))
+
+    assert len(datagrams) > 1
+    assert all(len(datagram) <= MAX_DATAGRAM_BYTES for datagram in datagrams)
+    parsed = np.vstack([parse_datagram(datagram) for datagram in datagrams])
+    np.testing.assert_array_equal(parsed, rows)
+
+
+def test_small_limit_splits_on_line_boundaries():
+    rows = np.arange(70, dtype=float).reshape(10, 7)
+    datagrams = list(format_datagrams(rows, max_bytes=60))
+    assert all(len(datagram) <= 60 for datagram in datagrams)
+    np.testing.assert_array_equal(np.vstack([parse_datagram(d) for d in datagrams]), rows)
+
+
+# Without a speed channel, distance is the haversine between fixes, carried across batches
+def test_gps_only_distance_across_batches():
+    n_rows = 3000
+    rng = np.random.default_rng(1)
+    fix = np.arange(n_rows) % 100 == 0
+    lat = np.where(fix, 14.6 + np.cumsum(rng.uniform(0, 2e-6, n_rows)), np.nan)
+    lon = np.where(fix, 121.0 + np.cumsum(rng.uniform(0, 2e-6, n_rows)), np.nan)
+    batch = {'time': np.arange(n_rows) / 100.0, 'ax': rng.normal(0, 0.1, n_rows), 'ay': rng.normal(0, 0.1, n_rows),
+             'az': 9.81 + rng.normal(0, 0.1, n_rows), 'latitude': lat, 'longitude': lon}
+
+    engine = LiveIRIEngine(sampling_rate=100.0)
+    for start in range(0, n_rows, 250):
+        engine.push({col: values[start:start + 250] for col, values in batch.items()})
+
+    fix_lat, fix_lon = np.radians(lat[fix]), np.radians(lon[fix])
+    expected = _haversine_distance(fix_lat[:-1], fix_lon[:-1], fix_lat[1:], fix_lon[1:]).sum()
+    np.testing.assert_allclose(engine.stats()['distance_m'], expected, rtol=1e-12)
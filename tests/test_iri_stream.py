@@ -0,0 +1,99 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import signal
+
+from utils.iri_calculator import IRICalculator, butter_lowpass_sos
+from utils.iri_stream import StreamingIRICalculator, ZeroPhaseStreamFilter
+from utils.synthetic import synthesize_run, write_csv
+
+
+# Batch segments and streamed segments of the same CSV
+def batch_and_stream(csv_path, segment_length=100, chunksize=7000):
+    calc = IRICalculator()
+    with contextlib.redirect_stdout(io.StringIO()):
+        processed, _ = calc.preprocess_data(calc.load_data(csv_path))
+        iri_values, segments, _, _ = calc.calculate_iri_rms_method(processed, segment_length)
+        streamed = StreamingIRICalculator(segment_length, chunksize=chunksize).process_file(csv_path)
+    return iri_values, segments, streamed
+
+
+# Without a speed column both derive it from the GPS deltas, carried across chunk boundaries
+def test_stream_derives_speed_from_gps_like_batch(tmp_path):
+    run, _ = synthesize_run(300, 100, seed=2)
+    write_csv(run, str(tmp_path / 'full.csv'))
+    pd.read_csv(tmp_path / 'full.csv').drop(columns=['speed']).to_csv(tmp_path / 'no_speed.csv', index=False)
+
+    iri_values, segments, streamed = batch_and_stream(str(tmp_path / 'no_speed.csv'))
+
+    assert len(streamed) == len(iri_values) > 0
+    np.testing.assert_allclose(streamed['mean_speed'], segments['mean_speed'], rtol=1e-12)
+    assert not np.allclose(streamed['mean_speed'], 15.0)
+
+
+
+# Physics Toolbox leaves the rows between 1 Hz fixes empty: speed comes from the held fixes, not NaN
+@pytest.mark.parametrize('chunksize', [3000, 100_000])
+def test_sparse_gps_without_speed_column(tmp_path, chunksize):
+    run, _ = synthesize_run(200, 100, seed=2)
+    write_csv(run, str(tmp_path / 'full.csv'))
+    df = pd.read_csv(tmp_path / 'full.csv').drop(columns=['speed'])
+    df.loc[np.arange(len(df)) % 100 != 37, ['latitude', 'longitude', 'altitude']] = np.nan
+    df.to_csv(tmp_path / 'sparse.csv', index=False)
+
+    iri_values, segments, streamed = batch_and_stream(str(tmp_path / 'sparse.csv'), chunksize=chunksize)
+
+    assert len(streamed) == len(iri_values) > 0
+    assert np.all(np.isfinite(iri_values))
+    np.testing.assert_allclose(segments['mean_speed'].mean(), np.mean(run['speed']), rtol=0.05)
+    np.testing.assert_allclose(streamed['mean_speed'], segments['mean_speed'], rtol=1e-12)
+
+
+# With fewer than two fixes both modes fall back to 15 m/s instead of failing
+def test_no_gps_fix_falls_back_to_default_speed(tmp_path):
+    run, _ = synthesize_run(100, 100, seed=3)
+    write_csv(run, str(tmp_path / 'full.csv'))
+    df = pd.read_csv(tmp_path / 'full.csv').drop(columns=['speed'])
+    df[['latitude', 'longitude']] = np.nan
+    df.loc[500, ['latitude', 'longitude']] = 14.6, 121.0
+    df.to_csv(tmp_path / 'no_fix.csv', index=False)
+
+    iri_values, segments, streamed = batch_and_stream(str(tmp_path / 'no_fix.csv'), chunksize=3000)
+
+    assert len(streamed) == len(iri_values) > 0
+    np.testing.assert_array_equal(segments['mean_speed'], 15.0)
+    np.testing.assert_array_equal(streamed['mean_speed'], 15.0)
+
+
+# Blocks of any size through the stream filter give sosfiltfilt within 1e-12 of the signal RMS
+@pytest.mark.parametrize('block', [7, 500, 4096])
+def test_stream_filter_matches_sosfiltfilt(block):
+    rng = np.random.default_rng(4)
+    x = rng.normal(0, 1, (20_000, 3)) + np.sin(np.arange(20_000) / 50)[:, None]
+    aux = np.arange(len(x), dtype=float)[:, None]
+    sos = butter_lowpass_sos(4, 10.0, 100.0)
+    stream = ZeroPhaseStreamFilter(sos, lookahead=200)
+
+    outputs = [stream.push(x[i:i + block], aux[i:i + block]) for i in range(0, len(x), block)]
+    outputs.append(stream.finish())
+    filtered = np.concatenate([out for out, _ in outputs])
+
+    np.testing.assert_array_equal(np.concatenate([a for _, a in outputs]), aux)
+    assert np.max(np.abs(filtered - signal.sosfiltfilt(sos, x, axis=0))) < 1e-12 * np.sqrt(np.mean(x**2))
+
+
+# Same segments as the batch RMS method; IRI differs only through the running gravity mean
+@pytest.mark.parametrize('chunksize', [5000, 100_000])
+def test_stream_matches_batch(tmp_path, chunksize):
+    run, _ = synthesize_run(300, 100, seed=0)
+    write_csv(run, str(tmp_path / 'run.csv'))
+
+    iri_values, segments, streamed = batch_and_stream(str(tmp_path / 'run.csv'), chunksize=chunksize)
+
+    assert len(streamed) == len(iri_values) > 0
+    np.testing.assert_array_equal(streamed['start_index'], segments['start_index'])
+    np.testing.assert_array_equal(streamed['end_index'], segments['end_index'])
+    np.testing.assert_allclose(streamed['iri_value'], iri_values, rtol=3.6e-5)
@@ -0,0 +1,40 @@
+import json
+import re
+
+import folium
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+from utils.map_layers import add_marker_layer, pothole_layer, vehicle_layer
+from utils.thumbnails import ThumbnailCache
+
+
+# Rendered map HTML without folium's random element ids
+def render(m):
+    return re.sub(r'[0-9a-f]{32}', 'ID', m.get_root().render())
+
+
+# A layer cached as a JSON string renders the same map every time it is added, clustered or not
+@pytest.mark.parametrize('rows', [30, 800])
+def test_serialized_layers_render_the_same_map(tmp_path, rows):
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 255, (60, 80, 3), dtype=np.uint8)).save(tmp_path / 'frame.jpg')
+    vehicles = pd.DataFrame({'latitude': 14.6 + rng.normal(0, 0.01, rows), 'longitude': 121 + rng.normal(0, 0.01, rows),
+                             'vehicle_type': rng.choice(['car', 'truck', 'bus'], rows)})
+    potholes = pd.DataFrame({'latitude': 14.6 + rng.normal(0, 0.01, rows), 'longitude': 121 + rng.normal(0, 0.01, rows),
+                             'confidence_score': rng.uniform(0, 1, rows),
+                             'image_path': ['frame.jpg' if i % 2 else 'missing.jpg' for i in range(rows)]})
+    thumbnails = ThumbnailCache(str(tmp_path / 'thumbs'))
+    layers = [json.dumps(vehicle_layer(vehicles)),
+              json.dumps(pothole_layer(potholes, str(tmp_path), page=1, page_size=10, thumbnails=thumbnails))]
+    assert 'base64' in layers[1]
+
+    maps = []
+    for _ in range(2):
+        m = folium.Map(location=[14.6, 121.0])
+        clustered = [add_marker_layer(m, layer) for layer in layers]
+        maps.append(render(m))
+    assert clustered == [rows > 500] * 2
+    assert maps[0] == maps[1]
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from reference_stages import loop_rectified_slope
+from utils import quarter_car
+from utils.iri_calculator import IRICalculator
+
+
+# The sosfilt form of the Golden Car equals the ASTM per-sample state loop
+def test_rectified_slope_matches_state_loop():
+    rng = np.random.default_rng(5)
+    slope = np.cumsum(rng.normal(0, 1e-4, 8000)) + 2e-3
+    expected = loop_rectified_slope(slope, quarter_car.BASE_LENGTH)
+    np.testing.assert_allclose(quarter_car.rectified_slope(slope, quarter_car.BASE_LENGTH), expected,
+                               rtol=1e-7, atol=1e-12 * np.max(expected))
+
+
+# Starting at rest on the initial slope, a constant grade excites nothing; the response is linear
+def test_constant_slope_has_zero_iri_and_response_is_linear():
+    dx = quarter_car.BASE_LENGTH
+    assert np.max(quarter_car.rectified_slope(np.full(2000, 0.03), dx)) < 1e-12
+
+    rng = np.random.default_rng(6)
+    slope = rng.normal(0, 1e-3, 4000)
+    np.testing.assert_allclose(quarter_car.rectified_slope(3 * slope, dx),
+                               3 * quarter_car.rectified_slope(slope, dx), rtol=1e-9, atol=1e-15)
+
+
+# Segment IRI is the mean rectified slope over each segment, in m/km
+def test_segment_iri_is_mean_rectified_slope():
+    grid = np.arange(0, 300, 0.25)
+    rectified = np.where(grid < 100, 0.002, 0.004)
+    iri = quarter_car.segment_iri(grid, rectified, np.array([0.0, 100.0]), np.array([100.0, 200.0]))
+    np.testing.assert_allclose(iri, [2.0, 4.0])
+
+
+# The quarter-car method returns one IRI per RMS-method segment and scales with the road's roughness
+def test_quarter_car_method_segments_and_scaling():
+    rng = np.random.default_rng(7)
+    n_rows = 60_000
+    time = np.arange(n_rows) / 100.0
+    base = {'time': time, 'ax': rng.normal(0, 0.1, n_rows), 'ay': rng.normal(0, 0.1, n_rows),
+            'latitude': 14.6, 'longitude': 121.0, 'speed': np.full(n_rows, 15.0)}
+    bumps = rng.normal(0, 0.2, n_rows)
+    calc = IRICalculator()
+
+    smooth = pd.DataFrame(dict(base, az=9.81 + bumps))
+    rough = pd.DataFrame(dict(base, az=9.81 + 4 * bumps))
+    smooth_iri, segments, _, _ = calc.calculate_iri_quarter_car_method(smooth, 100)
+    rough_iri, _, _, _ = calc.calculate_iri_quarter_car_method(rough, 100)
+    _, rms_segments, _, _ = calc.calculate_iri_rms_method(smooth, 100)
+
+    np.testing.assert_array_equal(segments['distance_start'], rms_segments['distance_start'])
+    assert np.all(np.isfinite(smooth_iri)) and np.all(smooth_iri > 0)
+    np.testing.assert_allclose(rough_iri / smooth_iri, 4.0, rtol=1e-6)
@@ -0,0 +1,95 @@
+import contextlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import run_cache
+from utils.iri_calculator import IRICalculator
+from utils.run_cache import RunCache, load_filtered_run
+from utils.stage_graph import build_iri_graph
+from utils.synthetic import synthesize_run, write_csv
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    run, _ = synthesize_run(60, 100, seed=4)
+    write_csv(run, str(tmp_path / 'run.csv'))
+    return str(tmp_path / 'run.csv')
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+# A second load of the same content is a hit with the same frames as the miss that stored it
+def test_hit_returns_stored_run(tmp_path, csv_path):
+    cache = RunCache(str(tmp_path / 'cache'))
+    first = quiet(load_filtered_run, csv_path, cache, 10)
+    second = quiet(load_filtered_run, csv_path, cache, 10)
+
+    assert (first[-1], second[-1]) == (False, True)
+    assert (cache.hits, cache.misses) == (1, 1)
+    pd.testing.assert_frame_equal(second[0], first[0], check_dtype=False)
+    for col in run_cache.FILTERED_COLUMNS:
+        np.testing.assert_array_equal(second[2][col], first[2][col])
+    assert second[1] == pytest.approx(first[1]) and second[3] == pytest.approx(first[3])
+
+
+# Another cutoff or calculator version is another key, so stale arrays are never returned
+def test_key_changes_with_params_and_version(tmp_path, csv_path, monkeypatch):
+    cache = RunCache(str(tmp_path / 'cache'))
+    quiet(load_filtered_run, csv_path, cache, 10)
+    assert quiet(load_filtered_run, csv_path, cache, 5)[-1] is False
+
+    data = b'time,ax\n0,1\n'
+    key = RunCache.make_key(data, cutoff_freq=10)
+    assert RunCache.make_key(data, cutoff_freq=10) == key != RunCache.make_key(data, cutoff_freq=5)
+    monkeypatch.setattr(run_cache, 'CALCULATOR_VERSION', '0.0')
+    assert RunCache.make_key(data, cutoff_freq=10) != key
+    assert quiet(load_filtered_run, csv_path, cache, 10)[-1] is False
+
+
+# Least recently used entries go first; a hit refreshes an entry
+def test_evict_least_recently_used(tmp_path):
+    cache = RunCache(str(tmp_path / 'cache'))
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, {'x': np.zeros(1000)})
+        os.utime(cache._path(key), (1_000_000 + i, 1_000_000 + i))
+
+    assert cache.get('a') is not None
+    cache.max_bytes = 2 * os.path.getsize(cache._path('a'))
+    cache.evict()
+
+    assert sorted(os.listdir(cache.cache_dir)) == ['a.npz', 'c.npz']
+
+
+# An entry removed by another session between listing and eviction is skipped
+def test_evict_ignores_entries_removed_concurrently(tmp_path, monkeypatch):
+    cache = RunCache(str(tmp_path / 'cache'), max_bytes=0)
+    cache.put('a', {'x': np.zeros(10)})
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda path: listdir(path) + ['gone.npz'])
+    cache.evict()
+    assert listdir(cache.cache_dir) == []
+
+
+# A new session re-opening the run reads the filtered channels from disk instead of filtering again
+@pytest.mark.parametrize('compact', [False, True])
+def test_stage_graph_reuses_filtered_run(tmp_path, csv_path, monkeypatch, compact):
+    cache = RunCache(str(tmp_path / 'cache'))
+    expected = quiet(build_iri_graph(IRICalculator(), cache).run, 'filter', source=csv_path, cutoff_freq=10,
+                     compact=compact)
+
+    calculator = IRICalculator()
+    monkeypatch.setattr(calculator, 'filter_accelerometer_data', None)
+    monkeypatch.setattr(calculator, 'preprocess_data', None)
+    df_filtered, sampling_rate = quiet(build_iri_graph(calculator, cache).run, 'filter', source=csv_path,
+                                       cutoff_freq=10, compact=compact)
+
+    assert sampling_rate == pytest.approx(expected[1])
+    for col in run_cache.FILTERED_COLUMNS:
+        np.testing.assert_array_equal(df_filtered[col], expected[0][col])
@@ -0,0 +1,94 @@
+import contextlib
+import io
+import struct
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import run_format
+from utils.iri_calculator import IRICalculator
+from utils.run_format import RecordingRun, convert_csv
+from utils.synthetic import synthesize_run, write_csv
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    run, _ = synthesize_run(90, 100, seed=7)
+    write_csv(run, str(tmp_path / 'drive.csv'))
+    return str(tmp_path / 'drive.csv')
+
+
+def quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def preprocessed(csv_path):
+    calc = IRICalculator()
+    return quiet(calc.preprocess_data, quiet(calc.load_data, csv_path))
+
+
+# At float64 a converted run reads back as exactly what preprocess_data gives for the CSV
+def test_float64_round_trip_matches_preprocess_data(tmp_path, csv_path):
+    path = quiet(convert_csv, csv_path, str(tmp_path / 'drive.daanrun'), dtype=np.float64)
+    df, duration = RecordingRun(path).to_dataframe()
+    expected, expected_duration = preprocessed(csv_path)
+
+    expected = expected.apply(pd.to_numeric, errors='coerce').astype(float)
+    pd.testing.assert_frame_equal(df, expected, check_exact=True)
+    assert duration == expected_duration
+
+
+# float32 rounds the sensor channels only; time and positions stay exact. A slice reads the same rows.
+def test_float32_channels_and_slices(tmp_path, csv_path):
+    run = RecordingRun(quiet(convert_csv, csv_path, str(tmp_path / 'drive.daanrun')))
+    expected, _ = preprocessed(csv_path)
+
+    df, _ = run.to_dataframe()
+    for col in ('time', 'latitude', 'longitude'):
+        np.testing.assert_array_equal(df[col], expected[col])
+    np.testing.assert_allclose(df['az'], expected['az'], rtol=1e-7, atol=1e-6)
+
+    part, duration = run.to_dataframe(start=1000, stop=2500)
+    pd.testing.assert_frame_equal(part, df.iloc[1000:2500].reset_index(drop=True))
+    assert duration == pytest.approx(df['time'].iloc[2499] - df['time'].iloc[1000])
+
+
+# Header fields, then one 64-byte aligned, non-overlapping channel per preprocessed column
+def test_header_and_channel_table(tmp_path, csv_path):
+    path = quiet(convert_csv, csv_path, str(tmp_path / 'drive.daanrun'))
+    expected, _ = preprocessed(csv_path)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, version, channel_count, sample_count, start_time, sampling_rate, data_offset = \
+        run_format.HEADER.unpack_from(data)
+    assert (magic, version) == (run_format.MAGIC, run_format.VERSION)
+    assert (channel_count, sample_count) == (len(expected.columns), len(expected))
+    assert start_time == pytest.approx(1754035200.0, abs=1e-3)
+    assert sampling_rate == pytest.approx(100.0)
+
+    offsets = []
+    for i, col in enumerate(expected.columns):
+        name, dtype, offset = run_format.CHANNEL.unpack_from(data, run_format.HEADER.size + i * run_format.CHANNEL.size)
+        dtype = dtype.rstrip(b'\x00').decode()
+        assert name.rstrip(b'\x00').decode() == col
+        assert dtype == ('<f8' if col in run_format.FLOAT64_CHANNELS else '<f4')
+        offsets.append((offset, np.dtype(dtype).itemsize * sample_count))
+    assert offsets[0][0] == data_offset
+    assert all(offset % run_format.ALIGNMENT == 0 for offset, _ in offsets)
+    assert all(start + size <= following for (start, size), (following, _) in zip(offsets, offsets[1:]))
+    assert len(data) >= offsets[-1][0] + offsets[-1][1]
+
+
+def test_rejects_other_files_and_newer_versions(tmp_path, csv_path):
+    with pytest.raises(ValueError, match='not a run file'):
+        RecordingRun(csv_path)
+
+    path = quiet(convert_csv, csv_path, str(tmp_path / 'drive.daanrun'))
+    with open(path, 'r+b') as f:
+        f.seek(8)
+        f.write(struct.pack('<H', run_format.VERSION + 1))
+    with pytest.raises(ValueError, match='newer'):
+        RecordingRun(path)
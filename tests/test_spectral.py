@@ -0,0 +1,54 @@
+import numpy as np
+
+from utils import spectral
+
+
+# Segment table of back-to-back segments of `length` meters over `total` meters
+def segment_table(total, length):
+    return {'distance_start': np.arange(0, total - length + 1, length, dtype=float), 'length': length}
+
+
+# A 5 m corrugation puts its whole variance (A^2 / 2) in the medium band and peaks at 5 m
+def test_sine_energy_and_dominant_wavelength():
+    grid = np.arange(0, 1000, spectral.SAMPLE_INTERVAL)
+    values = 0.6 * np.sin(2 * np.pi * grid / 5.0)
+    features = spectral.segment_features(values, segment_table(1000, 100))
+
+    np.testing.assert_allclose(features['energy_medium'], 0.6**2 / 2, rtol=0.05)
+    assert np.all(features['energy_short'] + features['energy_long'] < 0.01 * features['energy_medium'])
+    np.testing.assert_allclose(features['dominant_wavelength'], 5.0, atol=0.5)
+
+
+# The batched PSD of many segments equals the PSD of each segment on its own
+def test_batched_psd_matches_per_segment():
+    rng = np.random.default_rng(8)
+    rows = rng.normal(0, 1, (6, 400))
+    wavenumbers, psd = spectral.batched_psd(rows, spectral.SAMPLE_INTERVAL)
+    for i, row in enumerate(rows):
+        single_wavenumbers, single = spectral.batched_psd(row[None, :], spectral.SAMPLE_INTERVAL)
+        np.testing.assert_array_equal(single_wavenumbers, wavenumbers)
+        np.testing.assert_allclose(single[0], psd[i], rtol=1e-12)
+
+    # Parseval: the one-sided density integrates to the mean windowed variance of white noise
+    step = wavenumbers[1] - wavenumbers[0]
+    np.testing.assert_allclose(psd.sum(axis=1) * step, 1.0, rtol=0.25)
+
+
+# Segments too short for a spectrum get NaN features instead of failing
+def test_short_segments_give_nan():
+    features = spectral.segment_features(np.zeros(100), segment_table(20, 1))
+    assert all(np.all(np.isnan(features[col])) for col in spectral.FEATURE_COLUMNS)
+
+
+# Features from raw samples follow the distance grid, so a slower drive over the same road agrees
+# (wavelengths long enough that linear interpolation of the 0.2 m samples does not damp them)
+def test_spectral_features_independent_of_speed():
+    road = lambda x: np.sin(2 * np.pi * x / 6.0) + 0.5 * np.sin(2 * np.pi * x / 15.0)
+    segments = segment_table(600, 100)
+    results = []
+    for speed in (10.0, 20.0):
+        distance = np.arange(0, 620, speed / 100.0)
+        results.append(spectral.spectral_features(distance, road(distance), segments))
+
+    for col in spectral.FEATURE_COLUMNS:
+        np.testing.assert_allclose(results[0][col], results[1][col], rtol=0.02, atol=1e-4)
@@ -0,0 +1,51 @@
+import contextlib
+import io
+
+import pytest
+
+from utils.iri_calculator import IRICalculator
+from utils.stage_graph import build_iri_graph
+from utils.synthetic import synthesize_run, write_csv
+
+TARGETS = ['preprocess', 'gps', 'filter', 'vertical', 'cumulative', 'segmentation', 'iri', 'profile', 'spectral']
+
+
+@pytest.fixture
+def run_graph(tmp_path):
+    run, _ = synthesize_run(120, 100, seed=1)
+    write_csv(run, str(tmp_path / 'run.csv'))
+    graph = build_iri_graph(IRICalculator())
+
+    # Runs the dashboard's targets and returns the stages that were recomputed
+    def run_graph(**params):
+        params = dict({'source': str(tmp_path / 'run.csv'), 'cutoff_freq': 10, 'segment_length': 100}, **params)
+        with contextlib.redirect_stdout(io.StringIO()):
+            graph.run(TARGETS, **params)
+        return {row['stage'] for row in graph.report() if row['last'] == 'miss'}
+
+    run_graph.graph = graph
+    return run_graph
+
+
+def test_first_run_computes_every_stage(run_graph):
+    assert run_graph() == {row['stage'] for row in run_graph.graph.report()}
+
+
+# The threshold is display-only; passing a default explicitly keys the same as omitting it
+def test_threshold_and_explicit_defaults_recompute_nothing(run_graph):
+    run_graph(threshold=2.0)
+    assert run_graph(threshold=5.0) == set()
+    assert run_graph(distance_source='speed', compact=False, profile_step=5) == set()
+    assert all(run['status'] == 'hit' for run in run_graph.graph.last_run.values())
+
+
+def test_segment_length_recomputes_segmentation_and_dependents(run_graph):
+    run_graph()
+    assert run_graph(segment_length=50) == {'segmentation', 'iri', 'profile', 'spectral'}
+    assert run_graph(segment_length=100) == set()       # the previous length is still memoized
+
+
+def test_cutoff_recomputes_from_filter_down(run_graph):
+    run_graph()
+    assert run_graph(cutoff_freq=5) == {'filter', 'vertical', 'cumulative', 'segmentation', 'iri', 'profile',
+                                        'resample', 'spectral'}
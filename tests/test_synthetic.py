@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from utils.synthetic import _smooth_noise, gps_track, speed_profile
+
+
+# The ends of the smooth noise must look like the middle: no filter start-up transient
+@pytest.mark.parametrize('seed', range(8))
+def test_speed_profile_is_stationary(seed):
+    speed = speed_profile(360_000, 100, mean_speed=15.0, seed=seed)
+    low, high = np.percentile(speed, [0.5, 99.5])
+    assert low <= speed[0] <= high
+    assert low <= speed[-1] <= high
+
+    # Means of the first, middle and last tenth agree to within the profile's own spread
+    tenths = np.array_split(speed, 10)
+    spread = np.std([block.mean() for block in tenths])
+    assert abs(tenths[0].mean() - speed.mean()) < 3 * spread + 0.5
+    assert abs(tenths[-1].mean() - speed.mean()) < 3 * spread + 0.5
+
+
+def test_smooth_noise_has_unit_scale_at_the_edges():
+    rng = np.random.default_rng(0)
+    edges = np.array([_smooth_noise(rng, 20_000, 2000)[[0, -1]] for _ in range(200)])
+    # Unit standard deviation overall, so the edge values are standard normal too
+    assert 0.7 < np.std(edges) < 1.3
+    assert np.abs(edges).max() < 5
+
+
+def test_gps_track_curvature_has_no_edge_spike():
+    distance = np.linspace(0, 20_000, 20_001)
+    latitude, longitude = gps_track(distance, seed=3)
+    step = np.hypot(np.diff(latitude), np.diff(longitude) * np.cos(np.radians(latitude[0])))
+    heading = np.unwrap(np.arctan2(np.diff(longitude), np.diff(latitude)))
+    turn = np.abs(np.diff(heading))
+    assert turn[:100].max() <= 5 * np.percentile(turn, 99)
+    assert np.all(step > 0)
@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from utils.thumbnails import ThumbnailCache
+
+
+# A thumbnail read since the last write must outlive one that was only written: eviction is LRU
+def test_evict_keeps_recently_used_entries(tmp_path):
+    rng = np.random.default_rng(0)
+    sources = []
+    for name in ('old.jpg', 'new.jpg'):
+        path = tmp_path / name
+        Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)).save(path, quality=90)
+        sources.append(str(path))
+
+    cache = ThumbnailCache(str(tmp_path / 'cache'))
+    old, new = (cache.path(source, 200) for source in sources)
+    os.utime(old, (1_000_000, 1_000_000))
+    os.utime(new, (2_000_000, 2_000_000))
+
+    assert cache.path(sources[0], 200) == old       # hit: `old` becomes the most recently used
+    assert cache.hits == 1 and cache.misses == 2
+    cache.max_bytes = os.path.getsize(old)
+    cache.evict()
+
+    assert os.path.exists(old)
+    assert not os.path.exists(new)
@@ -0,0 +1,43 @@
+import folium
+import numpy as np
+import pandas as pd
+
+from utils.viewport import PointIndex, ViewportLayers, grid_aggregate
+
+
+def test_point_index_query_matches_brute_force():
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(0, 1, 5000), rng.uniform(0, 1, 5000)
+    lat[::50] = np.nan
+    index = PointIndex(lat, lon)
+    for south, west, north, east in rng.uniform(0, 1, (20, 4)):
+        south, north = sorted((south, north))
+        west, east = sorted((west, east))
+        expected = np.flatnonzero((lat >= south) & (lat <= north) & (lon >= west) & (lon <= east))
+        np.testing.assert_array_equal(index.query((south, west, north, east)), expected)
+
+
+def test_grid_aggregate_counts_and_means():
+    lat = np.array([0.1, 0.2, 1.1, 1.3, 1.5])
+    lon = np.array([0.1, 0.3, 0.1, 0.2, 0.3])
+    cell_lat, cell_lon, count, mean = grid_aggregate(lat, lon, 1.0, values=np.array([1, 3, 2, 4, 6.0]))
+    assert sorted(count.tolist()) == [2, 3]
+    assert sorted(mean.tolist()) == [2.0, 4.0]
+    assert count.sum() == len(lat)
+
+
+# Popups in a zoomed-in view still show the dataset's total per vehicle type
+def test_vehicle_popups_show_dataset_totals():
+    vehicles = pd.DataFrame({
+        'latitude': np.r_[np.full(3, 14.6), np.full(7, 15.6)],
+        'longitude': np.full(10, 121.0),
+        'vehicle_type': ['car'] * 10
+    })
+    layers = ViewportLayers(vehicle_df=vehicles)
+    group, summary = layers.feature_group((14.599, 120.999, 14.601, 121.001), zoom=17)
+    assert summary['vehicles'] == {'in_view': 3, 'aggregated': False}
+
+    m = folium.Map(location=[14.6, 121.0], zoom_start=17)
+    group.add_to(m)
+    html = m.get_root().render()
+    assert html.count('<strong>Total Count:</strong> 10') == 3
@@ -0,0 +1,141 @@
+"""Parallel batch processing of whole directories of drives.
+
+Each CSV is processed in its own worker process. Per-run segment tables are
+written next to a combined summary, and throughput is reported at the end.
+Output files mirror the input tree: with --recursive, ``a/run.csv`` and
+``b/run.csv`` become ``a/run_iri.csv`` and ``b/run_iri.csv`` in the output
+directory, so recordings with the same name do not overwrite each other:
+
+    python -m utils.iri_calculator batch recordings/ --workers 8 --segment-length 100
+"""
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from utils.iri_calculator import IRICalculator
+from utils.run_format import EXTENSION as RUN_EXTENSION
+
+
+# Path of the segment table for `csv_path`: its path relative to `input_dir` (or its file name
+# without one) under `output_dir`, with the extension replaced by _iri.csv
+def output_path(csv_path, output_dir, input_dir=None):
+    relative = os.path.relpath(csv_path, input_dir) if input_dir else os.path.basename(csv_path)
+    return os.path.join(output_dir, f"{os.path.splitext(relative)[0]}_iri.csv")
+
+
+# Processes one recording and writes its segment table; returns one summary row
+def process_file(csv_path, output_dir, segment_length=100, streaming=False, verbose=False, method='rms',
+                 split_gaps=False, input_dir=None):
+    output_csv = output_path(csv_path, output_dir, input_dir)
+    summary = {'file': csv_path, 'output': output_csv, 'status': 'ok', 'error': '',
+               'samples': 0, 'segments': 0, 'distance_m': 0.0, 'dropped_blocks': '',
+               'mean_iri': np.nan, 'std_iri': np.nan, 'seconds': 0.0}
+
+    start = time.perf_counter()
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with log:
+            iri_calc = IRICalculator()
+            os.makedirs(os.path.dirname(output_csv), exist_ok=True)
+            if streaming and (method != 'rms' or split_gaps):
+                raise ValueError("Streaming supports the RMS method without gap splitting only")
+            if streaming and not csv_path.endswith(RUN_EXTENSION):
+                if os.path.exists(output_csv):
+                    os.remove(output_csv)
+                results_df, summary['samples'] = _stream_file(iri_calc, csv_path, output_csv, segment_length)
+            else:
+                if csv_path.endswith(RUN_EXTENSION):
+                    # Binary runs are memory-mapped already, no CSV parsing or preprocessing
+                    processed = iri_calc.load_run(csv_path)
+                else:
+                    df = iri_calc.load_data(csv_path)
+                    processed = iri_calc.preprocess_data(df) if df is not None else None
+                if processed is None:
+                    raise ValueError("Data preprocessing failed")
+                df_processed, _ = processed
+                if split_gaps:
+                    if method != 'rms':
+                        raise ValueError("Gap splitting supports the RMS method only")
+                    # Blocks run one after another here; the files are already spread over the pool
+                    iri_values, segments, _, _ = iri_calc.calculate_iri_by_blocks(df_processed, segment_length, workers=1)
+                    if segments is not None:
+                        # Row ranges of blocks too short to process, e.g. "1200-1260;5400-5420"
+                        summary['dropped_blocks'] = ';'.join(f"{start}-{end}" for start, end in segments['dropped_blocks'])
+                else:
+                    calculate = iri_calc.calculate_iri_quarter_car_method if method == 'quarter-car' \
+                        else iri_calc.calculate_iri_rms_method
+                    iri_values, segments, _, _ = calculate(df_processed, segment_length)
+                if segments is None:
+                    raise ValueError("No block long enough to process")
+                results_df = iri_calc.save_results(iri_values, segments, output_csv)
+                summary['samples'] = len(df_processed)
+
+        summary['segments'] = len(results_df)
+        if len(results_df) > 0:
+            summary['distance_m'] = float(results_df['distance_end'].iloc[-1])
+            summary['mean_iri'] = float(results_df['iri_value'].mean())
+            summary['std_iri'] = float(results_df['iri_value'].std(ddof=0))
+    except Exception as e:
+        summary['status'] = 'failed'
+        summary['error'] = str(e)
+
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def _stream_file(iri_calc, csv_path, output_csv, segment_length):
+    from utils.iri_stream import StreamingIRICalculator
+    streamer = StreamingIRICalculator(segment_length, calculator=iri_calc)
+    results_df = streamer.process_file(csv_path, output_csv)
+    return results_df, streamer.samples_processed
+
+
+# Fans the CSVs in `input_dir` out over a process pool and writes summary.csv
+def run_batch(input_dir, output_dir=None, segment_length=100, workers=None,
+              pattern='*.csv', recursive=False, streaming=False, verbose=False, method='rms', split_gaps=False):
+    search = os.path.join(input_dir, '**', pattern) if recursive else os.path.join(input_dir, pattern)
+    files = sorted(glob(search, recursive=recursive))
+    output_dir = output_dir or os.path.join(input_dir, 'iri_results')
+    # Skip earlier results when the output directory is inside the input tree (symlinks resolved)
+    output_real = os.path.realpath(output_dir)
+    files = [f for f in files if os.path.commonpath([os.path.realpath(f), output_real]) != output_real]
+
+    if not files:
+        print(f"No files matching {pattern} in {input_dir}")
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    print(f"Processing {len(files)} files with {workers} workers -> {output_dir}")
+
+    rows = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process_file, f, output_dir, segment_length, streaming, verbose, method, split_gaps,
+                               input_dir)
+                   for f in files]
+        for done, future in enumerate(as_completed(futures), start=1):
+            row = future.result()
+            rows.append(row)
+            status = f"{row['segments']} segments, mean IRI {row['mean_iri']:.2f}" if row['status'] == 'ok' \
+                else f"FAILED: {row['error']}"
+            print(f"[{done}/{len(files)}] {os.path.relpath(row['file'], input_dir)}: {status} ({row['seconds']:.1f}s)")
+    elapsed = time.perf_counter() - start
+
+    summary_df = pd.DataFrame(rows).sort_values('file').reset_index(drop=True)
+    summary_path = os.path.join(output_dir, 'summary.csv')
+    summary_df.to_csv(summary_path, index=False)
+
+    total_samples = int(summary_df['samples'].sum())
+    failed = int((summary_df['status'] != 'ok').sum())
+    print(f"Summary saved to {summary_path}")
+    print(f"{len(files)} files ({failed} failed) in {elapsed:.1f}s: "
+          f"{len(files) / elapsed:.2f} files/sec, {total_samples / elapsed:,.0f} samples/sec")
+
+    return summary_df
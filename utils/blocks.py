@@ -0,0 +1,149 @@
+"""Gap-aware splitting of a recording into contiguous blocks.
+
+Recording pauses, GPS dropouts and sampling-rate changes break the assumptions
+of the whole-run pipeline: ``filtfilt`` smears across the gap, one median dt
+is used for the whole file, and the gyro angles keep integrating over the
+pause. ``find_blocks`` locates those breaks in one vectorized pass over the
+time column:
+
+- a gap is any dt larger than ``gap_factor`` times the typical dt (or ``max_gap`` seconds)
+- a rate change is a jump of more than ``rate_tolerance`` in the median dt between
+  consecutive windows of ``rate_window`` samples (so it is located to within one window)
+
+Each block is then filtered and segmented on its own, on a process pool, and
+the per-block segment tables are stitched back into one. Segments restart at
+every block, so they never straddle a gap. The partial segment at the end of
+each block is dropped as usual.
+
+Distances are block-local: each block's distance axis starts where the previous
+processed block's ended, so a recording pause (or a block too short to process)
+adds no distance, whatever speed was last logged before it. Blocks shorter than
+``MIN_BLOCK_SAMPLES`` are listed as (start, end) row ranges in
+``segments['dropped_blocks']``.
+
+    iri_values, segments, sampling_rate, speed = IRICalculator().calculate_iri_by_blocks(df_processed, 100)
+"""
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.iri_calculator import IRICalculator
+
+MIN_BLOCK_SAMPLES = 100         # shorter blocks cannot be filtered reliably and are skipped
+
+
+# (start, end) row ranges of the contiguous blocks of a time column, as an (n_blocks, 2) array
+def find_blocks(time, gap_factor=5.0, max_gap=None, rate_window=500, rate_tolerance=0.25,
+                min_samples=MIN_BLOCK_SAMPLES):
+    time = np.asarray(time, dtype=float)
+    n = len(time)
+    if n < 2:
+        return np.array([[0, n]]) if n >= min_samples else np.zeros((0, 2), dtype=int)
+
+    dt = np.diff(time)
+    positive = dt[dt > 0]
+    typical = np.median(positive) if len(positive) > 0 else 0.0
+    gap_threshold = max_gap if max_gap is not None else gap_factor * typical
+
+    # Row index where a new block starts: after each gap ...
+    breaks = [np.flatnonzero(dt > gap_threshold) + 1]
+
+    # ... and at windows whose median dt differs from the previous window's
+    n_windows = len(dt) // rate_window
+    if n_windows >= 2:
+        windows = dt[:n_windows * rate_window].reshape(n_windows, rate_window)
+        windows = np.where(windows > gap_threshold, np.nan, windows)
+        with np.errstate(all='ignore'):
+            window_dt = np.nanmedian(windows, axis=1)
+            changed = np.abs(np.diff(window_dt)) > rate_tolerance * window_dt[:-1]
+        breaks.append((np.flatnonzero(changed) + 1) * rate_window)
+
+    bounds = np.unique(np.concatenate([[0, n], *breaks]))
+    blocks = np.column_stack([bounds[:-1], bounds[1:]])
+    return blocks[blocks[:, 1] - blocks[:, 0] >= min_samples]
+
+
+# Worker: filters and segments one block, and measures the distance covered in it.
+# Runs in a separate process, so output is captured.
+def _process_block(block_df, segment_length, cutoff_freq):
+    with contextlib.redirect_stdout(io.StringIO()):
+        calculator = IRICalculator()
+        df_filtered, sampling_rate = calculator.filter_accelerometer_data(block_df, cutoff_freq)
+        iri_values, segments, _, _ = calculator.calculate_iri_from_filtered(df_filtered, sampling_rate, segment_length)
+        distance = calculator.calculate_distance(block_df['time'].values, calculator.estimate_speed(block_df))
+    return iri_values, segments, sampling_rate, float(distance[-1])
+
+
+# One segment table from per-block tables: distances shifted by each block's starting
+# distance, sample indices by the block's first row
+def stitch_segments(block_results, blocks, distance_offsets, segment_length):
+    segments = {'length': segment_length}
+    iri_parts, block_ids = [], []
+    columns = None
+
+    for block_id, ((iri_values, block_segments, *_), (start, _), offset) in \
+            enumerate(zip(block_results, blocks, distance_offsets)):
+        if columns is None:
+            columns = [key for key, value in block_segments.items() if isinstance(value, np.ndarray)]
+            parts = {key: [] for key in columns}
+        for key in columns:
+            values = block_segments[key]
+            if key in ('distance_start', 'distance_end'):
+                values = values + offset
+            elif key in ('start_index', 'end_index', 'center_index'):
+                values = values + start
+            parts[key].append(values)
+        iri_parts.append(iri_values)
+        block_ids.append(np.full(len(iri_values), block_id))
+
+    if columns is None:
+        return np.zeros(0), None
+
+    for key in columns:
+        segments[key] = np.concatenate(parts[key])
+    segments['block'] = np.concatenate(block_ids)
+    return np.concatenate(iri_parts), segments
+
+
+# Splits df at gaps and rate changes, processes the blocks on `workers` processes and stitches
+# the results. Returns (iri_values, segments, sampling_rate, speed) like calculate_iri_rms_method;
+# sampling_rate is that of the longest block.
+def process_blocks(df, segment_length=100, workers=None, cutoff_freq=10, **split_options):
+    min_samples = split_options.pop('min_samples', MIN_BLOCK_SAMPLES)
+    blocks = find_blocks(df['time'].values, min_samples=0, **split_options)
+    blocks = blocks[blocks[:, 1] > blocks[:, 0]]
+    short = blocks[:, 1] - blocks[:, 0] < min_samples
+    dropped = [(int(start), int(end)) for start, end in blocks[short]]
+    blocks = blocks[~short]
+    for start, end in dropped:
+        print(f"Skipped rows {start}-{end}: {end - start} samples, fewer than {min_samples}")
+    if len(blocks) == 0:
+        print("Error: No block long enough to process")
+        return np.zeros(0), None, None, None
+
+    block_frames = [df.iloc[start:end].reset_index(drop=True) for start, end in blocks]
+    workers = min(workers or os.cpu_count() or 1, len(blocks))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_process_block, block_frames, [segment_length] * len(blocks),
+                                    [cutoff_freq] * len(blocks)))
+    else:
+        results = [_process_block(block_df, segment_length, cutoff_freq) for block_df in block_frames]
+
+    for block_id, ((start, end), (iri_values, _, sampling_rate, _)) in enumerate(zip(blocks, results)):
+        print(f"Block {block_id}: rows {start}-{end}, {sampling_rate:.2f} Hz, {len(iri_values)} segments")
+
+    # Each block starts where the previous processed block ended
+    distance_offsets = np.concatenate([[0.0], np.cumsum([result[3] for result in results])[:-1]])
+    iri_values, segments = stitch_segments(results, blocks, distance_offsets, segment_length)
+    if segments is not None:
+        segments['dropped_blocks'] = dropped
+    longest = int(np.argmax(blocks[:, 1] - blocks[:, 0]))
+    sampling_rate = results[longest][2]
+    speed = segments['mean_speed'][-1] if len(iri_values) > 0 else None
+    print(f"Processed {len(blocks)} blocks with {workers} workers: {len(iri_values)} segments")
+
+    return iri_values, segments, sampling_rate, speed
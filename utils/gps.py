@@ -0,0 +1,87 @@
+"""Alignment of sparse GPS fixes with the accelerometer timeline.
+
+Physics Toolbox logs GPS at about 1 Hz and the accelerometer at 100 Hz or more,
+so between fixes the latitude/longitude/speed columns are either NaN or repeat
+the last fix. ``align_gps`` finds the real fixes (finite rows whose position
+changed), then interpolates position, speed and cumulative distance onto every
+accelerometer sample with one ``np.interp`` per channel.
+
+Cumulative distance is the haversine (great-circle) distance summed over
+consecutive fixes and interpolated in time. It is an alternative to
+integrating ``speed``, and it places segments consistently with the positions
+used on the map.
+
+A sample is flagged stale when it falls inside a gap between fixes longer than
+``stale_after`` seconds, or lies before the first fix or more than
+``stale_after`` after the last one. A stationary vehicle keeps reporting the same
+position, so its repeated fixes are not detected and long stops are flagged
+stale as well.
+"""
+import numpy as np
+
+from utils.iri_calculator import _haversine_distance
+
+STALE_SECONDS = 3.0
+
+
+# Row indices of real GPS fixes: finite positions that differ from the previous finite position
+def fix_rows(lat, lon):
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    finite = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+    if len(finite) == 0:
+        return finite
+
+    changed = np.empty(len(finite), dtype=bool)
+    changed[0] = True
+    changed[1:] = (np.diff(lat[finite]) != 0) | (np.diff(lon[finite]) != 0)
+    return finite[changed]
+
+
+# Cumulative great-circle distance (m) along a sequence of fixes in degrees
+def cumulative_geodesic_distance(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    steps = _haversine_distance(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    return np.concatenate([[0.0], np.cumsum(steps)])
+
+
+# GPS channels on the accelerometer timeline. Returns a dict of equal-length arrays:
+# latitude, longitude, speed, gps_distance, gps_age (s since the last fix) and gps_stale,
+# or None if there are fewer than two fixes.
+def align_gps(time, lat, lon, speed=None, stale_after=STALE_SECONDS):
+    time = np.asarray(time, dtype=float)
+    fixes = fix_rows(lat, lon)
+    if len(fixes) < 2:
+        return None
+
+    fix_time = time[fixes]
+    fix_lat = np.asarray(lat, dtype=float)[fixes]
+    fix_lon = np.asarray(lon, dtype=float)[fixes]
+    fix_distance = cumulative_geodesic_distance(fix_lat, fix_lon)
+
+    aligned = {
+        'latitude': np.interp(time, fix_time, fix_lat),
+        'longitude': np.interp(time, fix_time, fix_lon),
+        'gps_distance': np.interp(time, fix_time, fix_distance)
+    }
+
+    # Recorded speed at the fixes when available, otherwise the slope of the geodesic distance
+    fix_speed = np.asarray(speed, dtype=float)[fixes] if speed is not None else np.full(len(fixes), np.nan)
+    if np.all(np.isnan(fix_speed)):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fix_speed = np.gradient(fix_distance, fix_time)
+    valid = np.isfinite(fix_speed)
+    aligned['speed'] = np.interp(time, fix_time[valid], fix_speed[valid]) if valid.any() else np.zeros(len(time))
+
+    # Age of the last fix and length of the gap each sample sits in
+    previous = np.searchsorted(fix_time, time, side='right') - 1
+    before_first = previous < 0
+    previous = np.clip(previous, 0, len(fixes) - 1)
+    following = np.clip(previous + 1, 0, len(fixes) - 1)
+    aligned['gps_age'] = np.where(before_first, np.inf, time - fix_time[previous])
+
+    gap = fix_time[following] - fix_time[previous]
+    after_last = previous == len(fixes) - 1
+    aligned['gps_stale'] = before_first | (gap > stale_after) | (after_last & (aligned['gps_age'] > stale_after))
+    return aligned
@@ -0,0 +1,144 @@
+"""Per-stage timing and memory instrumentation for IRICalculator.
+
+A ``RunReport`` collects one record per stage (load, preprocess, filter,
+orientation, speed, segmentation, iri, ...). Each stage is timed with
+``time.perf_counter`` and, unless ``trace_memory=False``, its peak Python
+allocations are measured with ``tracemalloc``. Tracing only runs while a
+stage is open, because it slows down every allocation in the process. The
+process RSS is sampled when each stage ends.
+
+    report = RunReport()
+    calculator = IRICalculator(report=report)
+    df = calculator.load_data('drive.csv')
+    ...
+    report.rows()          # [{'stage': 'load', 'seconds': ..., 'rows_per_sec': ..., 'peak_mb': ...}, ...]
+    print(report.summary())
+
+Each finished stage is also emitted on the ``utils.instrumentation`` logger at
+INFO level. Nothing is shown unless logging is configured (for example with
+``logging.basicConfig(level=logging.INFO)``); pass ``emit=False`` to switch
+the emitter off for one report.
+"""
+import contextlib
+import logging
+import os
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+# Resident set size of this process in bytes, or None where it cannot be read
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024      # peak, in KB on Linux
+    except (ImportError, OSError):
+        return None
+
+
+class RunReport:
+
+    def __init__(self, trace_memory=True, emit=True):
+        self.trace_memory = trace_memory
+        self.emit = emit
+        self.records = []               # in the order the stages started; finished ones have 'seconds'
+        self._open = []                 # records of the stages currently running, outermost first
+        self._started_tracing = False
+
+    # Times the enclosed block as one stage. `rows` (if known) gives rows/sec; it can also be
+    # set on the yielded record inside the block, e.g. record['rows'] = len(df).
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        record = {'stage': name, 'rows': rows, 'depth': len(self._open)}
+        self._enter(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self._exit(record)
+
+    def _enter(self, record):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            self._fold_peak(peak)
+            tracemalloc.reset_peak()
+            record['_baseline'] = current
+            record['_peak'] = current
+        self._open.append(record)
+        self.records.append(record)
+
+    def _exit(self, record):
+        self._open.pop()
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, record.pop('_peak'))
+            record['peak_mb'] = (peak - record.pop('_baseline')) / 1024 / 1024
+            self._fold_peak(peak)
+            tracemalloc.reset_peak()
+            if not self._open and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+        else:
+            record['peak_mb'] = None
+
+        rss = rss_bytes()
+        record['rss_mb'] = rss / 1024 / 1024 if rss is not None else None
+        rows = record['rows']
+        record['rows_per_sec'] = rows / record['seconds'] if rows and record['seconds'] > 0 else None
+        if self.emit:
+            logger.info(self._format(record))
+
+    # Peaks of nested stages also count towards the stages around them
+    def _fold_peak(self, peak):
+        for outer in self._open:
+            outer['_peak'] = max(outer['_peak'], peak)
+
+    @staticmethod
+    def _format(record):
+        parts = [f"{record['stage']}: {record['seconds'] * 1000:.1f} ms"]
+        if record['rows_per_sec'] is not None:
+            parts.append(f"{record['rows_per_sec']:,.0f} rows/s")
+        if record['peak_mb'] is not None:
+            parts.append(f"peak {record['peak_mb']:.1f} MB")
+        if record['rss_mb'] is not None:
+            parts.append(f"RSS {record['rss_mb']:.0f} MB")
+        return ', '.join(parts)
+
+    def _finished(self):
+        return [record for record in self.records if 'seconds' in record]
+
+    # One row per finished stage, in the order the stages started
+    def rows(self):
+        return [{key: record[key] for key in ('stage', 'depth', 'seconds', 'rows', 'rows_per_sec', 'peak_mb', 'rss_mb')}
+                for record in self._finished()]
+
+    # Wall time of the outermost stages
+    @property
+    def total_seconds(self):
+        return sum(record['seconds'] for record in self._finished() if record['depth'] == 0)
+
+    # Largest stage peak of traced allocations (MB), or None without memory tracing
+    @property
+    def peak_mb(self):
+        peaks = [record['peak_mb'] for record in self._finished() if record['peak_mb'] is not None]
+        return max(peaks) if peaks else None
+
+    def summary(self):
+        text = f"{len(self._finished())} stages in {self.total_seconds:.2f} s"
+        if self.peak_mb is not None:
+            text += f", peak {self.peak_mb:.1f} MB"
+        return text
+
+    def clear(self):
+        self.records = []
@@ -1,27 +1,264 @@
+import functools
 import pandas as pd
 import numpy as np
 from scipy import signal
 from scipy.integrate import cumulative_trapezoid
 import matplotlib.pyplot as plt
-from math import radians, cos, sin, sqrt, atan2
 import warnings
 warnings.filterwarnings('ignore')
 
 
+EARTH_RADIUS = 6371000  # Earth radius in meters
 
+# Bump when a change alters processing results, so cached runs (utils/run_cache.py) are rebuilt
+CALCULATOR_VERSION = '1.1'
+
+
+ACCEL_AXES = ['ax', 'ay', 'az']
+FILTERED_AXES = ['ax_filtered', 'ay_filtered', 'az_filtered']
+
+
+# 4th-order Butterworth low-pass as second-order sections, designed once per (order, cutoff, sampling rate).
+# Cutoffs at or above Nyquist are lowered to 0.9 * Nyquist. The returned array is shared, so do not modify it.
+@functools.lru_cache(maxsize=64)
+def butter_lowpass_sos(order, cutoff_freq, sampling_rate):
+    nyquist = sampling_rate / 2                    # max frequency to capture (half of sample rate)
+    if cutoff_freq >= nyquist:                     # lower cutoff_freq if too high
+        cutoff_freq = nyquist * 0.9
+
+    sos = signal.butter(order, cutoff_freq / nyquist, btype='low', output='sos')
+    return sos
+
+
+# Zero-phase filtering of each column of a 2-D (samples, channels) array along axis 0, written into `out`.
+# Same result as sosfiltfilt(sos, x, axis=0), but filtering a column at a time keeps the
+# temporaries to one column instead of three full-size copies of the whole array.
+def sosfiltfilt_columns(sos, x, out=None):
+    if out is None:
+        out = np.empty(x.shape, dtype=float)
+    for i in range(x.shape[1]):
+        out[:, i] = signal.sosfiltfilt(sos, x[:, i])
+    return out
+
+
+# Haversine distance (meters) between arrays of points given in radians
+def _haversine_distance(lat1, lon1, lat2, lon2):
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    a = np.clip(a, 0.0, 1.0)    # guard against rounding just outside [0, 1]
+    c = 2*np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return EARTH_RADIUS * c
+
+
+# GPS positions with every row that has no fix (NaN latitude or longitude) holding the last fix
+# before it, or the first fix for rows before it. (None, None) if there are fewer than two fixes.
+def _hold_fixes(lat, lon):
+    fix = np.isfinite(lat) & np.isfinite(lon)
+    if np.count_nonzero(fix) < 2:
+        return None, None
+    if fix.all():
+        return lat, lon
+    held = np.maximum.accumulate(np.where(fix, np.arange(len(fix)), np.argmax(fix)))
+    return lat[held], lon[held]
+
+
+# Index of the sample nearest to each target on a non-decreasing array.
+# Matches np.argmin(np.abs(values - target)): ties go to the first occurrence.
+def _nearest_indices(values, targets):
+    targets = np.asarray(targets, dtype=float)
+    if len(values) == 0:
+        return np.zeros(len(targets), dtype=np.intp)
+
+    right = np.clip(np.searchsorted(values, targets, side='left'), 0, len(values) - 1)
+    left = np.maximum(right - 1, 0)
+    use_left = np.abs(targets - values[left]) <= np.abs(values[right] - targets)
+
+    # For repeated values, argmin returns the first of them
+    left_first = np.searchsorted(values, values[left], side='left')
+    return np.where(use_left, left_first, right)
+
+
+# Sum of values[start:end] for each (start, end) pair, assuming start < end
+def _segment_sums(values, start_idx, end_idx):
+    if len(start_idx) == 0:
+        return np.zeros(0)
+
+    bounds = np.column_stack([start_idx, end_idx]).ravel()
+    padded = np.append(values, 0.0)     # lets an end index equal len(values)
+    return np.add.reduceat(padded, bounds)[::2]
+
+
+# Boundaries of fixed-length segments on the cumulative distance, found in one pass.
+# Segments start every `step` meters (default: segment_length, i.e. no overlap).
+# Only whole segments that contain samples are returned.
+def _segment_bounds(distance, segment_length, step=None):
+    max_distance = distance[-1] if len(distance) > 0 else 0
+    start_dist = np.arange(0, max_distance - segment_length, step or segment_length)
+    end_dist = start_dist + segment_length
+
+    # All segment boundaries at once on the monotone cumulative distance
+    start_idx = _nearest_indices(distance, start_dist)
+    end_idx = _nearest_indices(distance, end_dist)
+
+    # Keep only segments that contain samples
+    keep = end_idx > start_idx
+    return start_dist[keep], end_dist[keep], start_idx[keep], end_idx[keep]
+
+
+# Columnar segment table from per-segment sums of a^2 and speed
+def _segment_table(start_dist, end_dist, start_idx, end_idx, accel_sq_sum, speed_sum, segment_length):
+    sample_count = end_idx - start_idx
+    return {
+        'distance_start': start_dist,
+        'distance_end': end_dist,
+        'start_index': start_idx,
+        'end_index': end_idx,
+        'rms': np.sqrt(accel_sq_sum / sample_count),
+        'mean_speed': speed_sum / sample_count,
+        'center_index': start_idx + sample_count // 2,
+        'length': segment_length
+    }
+
+
+# Rows handled by an instrumented call: the length of its first argument (frame, array),
+# else of its result, e.g. the DataFrame returned by load_data
+def _row_count(args, result):
+    for value in (args[0] if args else None, result[0] if isinstance(result, tuple) else result):
+        if hasattr(value, '__len__') and not isinstance(value, (str, bytes)):
+            return len(value)
+    return None
+
+
+# Runs an IRICalculator method as a named stage of the calculator's RunReport, if it has one
+# (see utils/instrumentation.py). Without a report the method is called directly.
+def _instrumented(stage):
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.report is None:
+                return method(self, *args, **kwargs)
+            with self.report.stage(stage) as record:
+                result = method(self, *args, **kwargs)
+                record['rows'] = _row_count(args, result)
+            return result
+        return wrapper
+    return decorator
+
+
+# Values at the sensor samples interpolated onto a uniform distance grid of dx meters, in one
+# np.interp call. Distance must be non-decreasing. Returns (grid distances, resampled values).
+def resample_to_distance(distance, values, dx):
+    distance = np.asarray(distance, dtype=float)
+    if len(distance) < 2 or distance[-1] <= dx:
+        return np.zeros(0), np.zeros(0)
+
+    # float32 values (a CompactRun) stay float32 on the grid
+    values = np.asarray(values)
+    dtype = np.float32 if values.dtype == np.float32 else float
+    grid = np.arange(0, distance[-1], dx)
+    return grid, np.interp(grid, distance, values.astype(float)).astype(dtype, copy=False)
+
+
+# Prefix sums as float32 offsets from a float64 sum at the start of each block of
+# PREFIX_BLOCK samples: 4 bytes per sample instead of 8. An offset rounds by at most
+# 2^-24 of the sum over its block, so a window sum is off by at most 2^-23 times the
+# largest block sum (about 1e-6 of the IRI of a 100 m segment at 100 Hz and 15 m/s).
+PREFIX_BLOCK = 4096
+
+
+class BlockPrefixSum:
+
+    def __init__(self, values):
+        cumsum = np.concatenate([[0.0], np.cumsum(values)])
+        self.bases = cumsum[::PREFIX_BLOCK].copy()
+        self.offsets = (cumsum - np.repeat(self.bases, PREFIX_BLOCK)[:len(cumsum)]).astype(np.float32)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        index = np.asarray(index)
+        index = np.where(index < 0, index + len(self.offsets), index)
+        return self.bases[index // PREFIX_BLOCK] + self.offsets[index]
+
+
+# Prefix sums of a^2 and speed over one filtered run. Segment RMS and mean speed only
+# need these sums, so any segment length costs one searchsorted and a few subtractions
+# (O(S) per length) instead of re-reading, re-filtering and re-segmenting the data.
+# With compact=True (used for CompactRun inputs) the sums are BlockPrefixSums.
+class CumulativeRun:
+
+    def __init__(self, calculator, distance, vertical_accel, speed, sampling_rate=None, compact=False):
+        self.calculator = calculator
+        self.sampling_rate = sampling_rate
+        self.distance = np.asarray(distance, dtype=float)
+
+        # Leading zero so that sum(values[i:j]) = cumsum[j] - cumsum[i]
+        accel_sq = np.asarray(vertical_accel, dtype=float)**2
+        speed = np.asarray(speed, dtype=float)
+        if compact:
+            self.accel_sq_cumsum = BlockPrefixSum(accel_sq)
+            self.speed_cumsum = BlockPrefixSum(speed)
+        else:
+            self.accel_sq_cumsum = np.concatenate([[0.0], np.cumsum(accel_sq)])
+            self.speed_cumsum = np.concatenate([[0.0], np.cumsum(speed)])
+
+    def __len__(self):
+        return len(self.distance)
+
+    @property
+    def total_distance(self):
+        return self.distance[-1] if len(self.distance) > 0 else 0.0
+
+    # Columnar segment table for one segment length (same layout as _create_segments)
+    def segments(self, segment_length):
+        start_dist, end_dist, start_idx, end_idx = _segment_bounds(self.distance, segment_length)
+        accel_sq_sum = self.accel_sq_cumsum[end_idx] - self.accel_sq_cumsum[start_idx]
+        speed_sum = self.speed_cumsum[end_idx] - self.speed_cumsum[start_idx]
+        return _segment_table(start_dist, end_dist, start_idx, end_idx,
+                              accel_sq_sum, speed_sum, segment_length)
+
+    # IRI values and segment table for one segment length
+    def iri(self, segment_length):
+        segments = self.segments(segment_length)
+        iri_values = self.calculator._calculate_segment_iri(segments['rms'], segments['mean_speed'])
+        return iri_values, segments
+
+    # IRI for several segment lengths at once: {segment_length: (iri_values, segments)}
+    def iri_for_lengths(self, segment_lengths):
+        return {length: self.iri(length) for length in segment_lengths}
+
+    # Dense IRI-vs-chainage profile: a window of window_length meters every `step` meters.
+    # Each window is two prefix-sum lookups, so the cost is O(N + windows) whatever the overlap.
+    # Returns the window table (same layout as segments()) plus 'chainage' (window centres),
+    # 'iri' and 'step'.
+    def profile(self, window_length=100, step=5):
+        start_dist, end_dist, start_idx, end_idx = _segment_bounds(self.distance, window_length, step)
+        accel_sq_sum = self.accel_sq_cumsum[end_idx] - self.accel_sq_cumsum[start_idx]
+        speed_sum = self.speed_cumsum[end_idx] - self.speed_cumsum[start_idx]
+        profile = _segment_table(start_dist, end_dist, start_idx, end_idx,
+                                 accel_sq_sum, speed_sum, window_length)
+        profile['chainage'] = start_dist + window_length / 2
+        profile['iri'] = self.calculator._calculate_segment_iri(profile['rms'], profile['mean_speed'])
+        profile['step'] = step
+        return profile
 
 
 class IRICalculator:
 
-    # Initialization
-    def __init__(self):
+    # Initialization. With a RunReport, every stage below is timed and memory-sampled into it.
+    def __init__(self, report=None):
         self.gravity = 9.81 
         self.iri_segments = []
+        self.report = report
 
-    # Loads the Data
-    def load_data(self, csv_file):
+    # Loads the Data - only the sensor columns, already typed (see utils/ingest.py)
+    @_instrumented('load')
+    def load_data(self, csv_file, engine='auto'):
+        from utils.ingest import read_sensor_csv
         try:
-            df = pd.read_csv(csv_file)
+            df = read_sensor_csv(csv_file, engine=engine)
             print(f"Loaded data has {len(df)} rows")
             print(f"Features: {list(df.columns)}")
             return df
@@ -29,7 +266,22 @@ class IRICalculator:
             print(f"Error in loading data: {e}")
             return None
 
+    # Loads rows [start, stop) of a binary run file (see utils/run_format.py) via np.memmap.
+    # Returns (df, duration) like preprocess_data, so the result goes straight to filtering.
+    @_instrumented('load')
+    def load_run(self, run_file, start=None, stop=None):
+        from utils.run_format import RecordingRun
+        try:
+            run = RecordingRun(run_file)
+            df, duration = run.to_dataframe(start, stop)
+            print(f"Loaded {len(df)} of {len(run)} rows from {run_file}")
+            return df, duration
+        except Exception as e:
+            print(f"Error in loading run: {e}")
+            return None
+
     # Processing and Cleaning the Data
+    @_instrumented('preprocess')
     def preprocess_data(self, df):
         # Linear Accelerometer: ax, ay, az (m/s2) - to confirm
         # GPS: latitude, longitude, altitude, speed (m/s) - to confirm
@@ -61,11 +313,12 @@ class IRICalculator:
         processed_df['ay'] = pd.to_numeric(df['ay'], errors='coerce')
         processed_df['az'] = pd.to_numeric(df['az'], errors='coerce')
 
-        # GPS data - to numeric
-        if all(col in df.columns for col in ['latitude', 'longitude', 'speed']):
+        # GPS data - to numeric. Without a speed column, estimate_speed derives it from the positions
+        if all(col in df.columns for col in ['latitude', 'longitude']):
             processed_df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
             processed_df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
-            processed_df['speed'] = pd.to_numeric(df['speed'], errors='coerce')
+            if 'speed' in df.columns:
+                processed_df['speed'] = pd.to_numeric(df['speed'], errors='coerce')
             processed_df['altitude'] = pd.to_numeric(df['altitude'], errors='coerce') if 'altitude' in df.columns else None
 
         # Gyroscope data(wx, wy, wz) - to numeric
@@ -107,37 +360,39 @@ class IRICalculator:
         if 'latitude' not in df.columns or 'longitude' not in df. columns:
             return None
 
-        speeds = []
-        for i in range(len(df)):
-            
-            if i == 0:             # Handling initial position
-                speeds.append(0)
+        if len(df) == 0:
+            return np.array([])
 
-            else:
-                # Distance Calculation between consecutive GPS Points
-                lat1, lon1 = radians(df.iloc[i-1]['latitude']), radians(df.iloc[i-1]['longitude'])
-                lat2, lon2 = radians(df.iloc[i]['latitude']), radians(df.iloc[i]['longitude'])
+        lat = np.radians(np.asarray(df['latitude'], dtype=float))
+        lon = np.radians(np.asarray(df['longitude'], dtype=float))
+        time = np.asarray(df['time'], dtype=float)
+
+        # Physics Toolbox logs GPS at about 1 Hz and leaves the rows between fixes empty: hold the
+        # last fix over them (rows before the first fix take the first one). Under two fixes, no speed.
+        lat, lon = _hold_fixes(lat, lon)
+        if lat is None:
+            return None
 
-                # Haversine Formula
-                dlat = lat2 - lat1
-                dlon = lon2 - lon1
-                a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                c = 2*atan2(sqrt(a), sqrt(1-a))
-                distance = 6371000 * c                 # Earth radius in meters
+        # Distance between consecutive GPS points and the elapsed time, whole array at once
+        distance = _haversine_distance(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        dt = np.diff(time)
 
-                # Change in time and Speed Calculation
-                dt = df.iloc[i]['time'] - df.iloc[i-1]['time']   # time computation elapsed
+        # Speed is distance over time; the first row starts at 0
+        valid = np.empty(len(df), dtype=bool)
+        valid[0] = True
+        valid[1:] = dt > 0
 
-                if dt > 0:
-                    speed = distance/dt            # distance over time
-                    speeds.append(speed)           
-                else:
-                    speeds.append(speeds[-1] if speeds else 0)  # reuse the initial and last value
+        speeds = np.zeros(len(df))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speeds[1:] = np.where(valid[1:], distance / dt, 0)
 
-        return np.array(speeds)
+        # Rows with dt <= 0 reuse the last valid speed (forward fill by index)
+        last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(df)), 0))
+        return speeds[last_valid]
 
     # filters accelerometer data to remove noise and keep only the useful vibration signals
     # estimates sampling rate
+    @_instrumented('filter')
     def filter_accelerometer_data(self, df, cutoff_freq=10, sampling_rate = None):
 
         if sampling_rate is None:
@@ -147,26 +402,22 @@ class IRICalculator:
 
             print(f"Estimated sampling rate: {sampling_rate:.2f} Hz")
 
-        # Design low-pass filter
-        nyquist = sampling_rate / 2                    # max frequency to capture (half of sample rate)
-        if cutoff_freq >= nyquist:                     # lower  cutoff_freq if too high
-            cutoff_freq = nyquist * 0.9
+        # 4th-order Butterworth low-pass filter, allows road bumps, blocks high frequency noise like phone shake and vibration
+        sos = butter_lowpass_sos(4, float(cutoff_freq), float(sampling_rate))
 
-        b, a = signal.butter(4, cutoff_freq / nyquist, btype = 'low')     # 4th-order Butterworth low-pass filter, allows road bumps, blocks  high frequency noise like phone shake and vibration where b and a are filter coefficients for filtfilt
-
-        # Apply filter
-        df_filtered = df.copy()
-        df_filtered['ax_filtered'] = signal.filtfilt(b, a, df['ax'])
-        df_filtered['ay_filtered'] = signal.filtfilt(b, a, df['ay'])
-        df_filtered['az_filtered'] = signal.filtfilt(b, a, df['az'])
+        # Apply filter to all three axes into one preallocated block; the input columns are shared, not copied
+        accel = np.column_stack([np.asarray(df[col], dtype=float) for col in ACCEL_AXES])
+        df_filtered = df.copy(deep=False)
+        df_filtered[FILTERED_AXES] = sosfiltfilt_columns(sos, accel, out=accel)
 
         return df_filtered, sampling_rate
 
     # Extract the vertical acceleration component
+    @_instrumented('orientation')
     def extract_vertical_acceleration(self, df):
 
         # Use Z-axis as this is the vertical movement from the mounting set-up
-        vertical_accel_simple = df['az_filtered'].values
+        vertical_accel_simple = np.asarray(df['az_filtered'])
 
         # Use gyroscope to correct phone orientation - optional
         if all(col in df.columns for col in ['wx', 'wy', 'wz']):
@@ -174,13 +425,14 @@ class IRICalculator:
         else:
             vertical_accel_corrected = vertical_accel_simple
 
-        return vertical_accel_corrected
+        # Same precision as the filtered channels (float32 for a CompactRun)
+        return vertical_accel_corrected.astype(vertical_accel_simple.dtype, copy=False)
 
     # Correct accelerometer data using gyroscope data
     def _correct_orientation(self, df):
         # Use wx, wy, wz
-        ax, ay , az = df['ax_filtered'].values, df['ay_filtered'].values, df['az_filtered'].values
-        wx, wy, wz = df['wx'].values, df['wy'].values, df['wz'].values
+        ax, ay , az = (np.asarray(df[col], dtype=float) for col in FILTERED_AXES)
+        wx, wy, wz = (np.asarray(df[col], dtype=float) for col in ['wx', 'wy', 'wz'])
 
         # Simple correction assuming small rotations from visual observations
         dt = np.median(np.diff(df['time']))
@@ -194,77 +446,171 @@ class IRICalculator:
 
         return vertical_accel
 
-    # Finally, calculation of IRI by RMS method
-    # Possible points of improvement: Have a user input how many meters is in a segment
-    def calculate_iri_rms_method(self, df, segment_length=100):     # create IRI values for every 100m
+    # Speed per sample: the recorded speed column, else from GPS, else a constant default
+    @_instrumented('speed')
+    def estimate_speed(self, df):
+        if 'speed' in df.columns:
+            return np.asarray(df['speed'])
+
+        speed = self.calculate_speed_from_gps(df)
+        if speed is None:
+            # Assume constant speed if no GPS data
+            speed = np.full(len(df), 15.0) # 15 m/s default
+            print("Warning: Using default speed of 15 m/s")
+        return speed
+
+    # Cumulative distance traveled (m) from speed over time
+    def calculate_distance(self, time_array, speed):
+        return cumulative_trapezoid(speed, time_array, initial = 0)
+
+    # Interpolates the sparse GPS fixes onto every accelerometer sample (see utils/gps.py).
+    # Adds gps_distance, gps_age and gps_stale columns; the frame is returned unchanged without GPS.
+    @_instrumented('gps')
+    def align_gps(self, df, stale_after=3.0):
+        from utils.gps import align_gps
+        if 'latitude' not in df.columns or 'longitude' not in df.columns or 'gps_distance' in df.columns:
+            return df
 
-        # Filtered data
-        df_filtered, sampling_rate = self.filter_accelerometer_data(df)
+        speed = np.asarray(df['speed']) if 'speed' in df.columns else None
+        aligned = align_gps(np.asarray(df['time']), np.asarray(df['latitude']), np.asarray(df['longitude']), speed, stale_after)
+        if aligned is None:
+            print("Warning: Fewer than two GPS fixes, positions not aligned")
+            return df
+
+        df_aligned = df.copy(deep=False)
+        for col, values in aligned.items():
+            df_aligned[col] = values
+        print(f"Aligned GPS: {aligned['gps_distance'][-1]:.1f} m, {aligned['gps_stale'].mean() * 100:.1f}% of samples stale")
+        return df_aligned
+
+    # Vertical acceleration (gravity removed), speed and cumulative distance used for segmentation.
+    # distance_source 'speed' integrates the speed column; 'gps' uses the geodesic distance between GPS fixes.
+    def _segment_inputs(self, df_filtered, vertical_accel=None, distance_source='speed'):
 
         # Extract vertical acceleration
-        vertical_accel = self.extract_vertical_acceleration(df_filtered)
+        if vertical_accel is None:
+            vertical_accel = self.extract_vertical_acceleration(df_filtered)
+
+        if distance_source == 'gps':
+            df_filtered = self.align_gps(df_filtered)
+            if 'gps_distance' not in df_filtered.columns:
+                print("Warning: No GPS track, integrating speed instead")
+                distance_source = 'speed'
 
         # Calculate Speed
-        if 'speed' in df_filtered.columns:
-            speed = df_filtered['speed'].values
-        else:
-            speed = self.calculate_speed_from_gps(df_filtered)
-            if speed is None:
-                # Assume constant speed if no GPS data
-                speed = np.full(len(df_filtered), 15.0) # 15 m/s default
-                print("Warning: Using default speed of 15 m/s")
+        speed = self.estimate_speed(df_filtered)
 
         # Remove gravity component and calculate RMS
         vertical_accel_corrected = vertical_accel - np.mean(vertical_accel)
 
         # Calculate distance traveled
-        time_array = df_filtered['time'].values
-        distance = cumulative_trapezoid(speed, time_array, initial = 0)
+        if distance_source == 'gps':
+            distance = np.asarray(df_filtered['gps_distance'])
+        else:
+            distance = self.calculate_distance(np.asarray(df_filtered['time']), speed)
+
+        return vertical_accel_corrected, speed, distance
+
+    # Finally, calculation of IRI by RMS method
+    # Possible points of improvement: Have a user input how many meters is in a segment
+    def calculate_iri_rms_method(self, df, segment_length=100, distance_source='speed'):     # create IRI values for every 100m
+
+        # Filtered data
+        df_filtered, sampling_rate = self.filter_accelerometer_data(df)
+
+        return self.calculate_iri_from_filtered(df_filtered, sampling_rate, segment_length, distance_source)
+
+    # RMS-method IRI for a run that is already filtered (e.g. loaded from the run cache)
+    def calculate_iri_from_filtered(self, df_filtered, sampling_rate, segment_length=100, distance_source='speed'):
+
+        vertical_accel_corrected, speed, distance = self._segment_inputs(df_filtered, distance_source=distance_source)
 
         # Segmentation of data
         segments = self._create_segments(distance, vertical_accel_corrected, speed, segment_length)
 
         # Calculation of IRI for each segment
-        iri_values = []
-        for segment in segments:
-            iri, speed = self._calculate_segment_iri(segment)
-            iri_values.append(iri)
+        iri_values = self._calculate_segment_iri(segments['rms'], segments['mean_speed'])
+
+        # Spectral roughness features on the distance grid (see utils/spectral.py)
+        segments.update(self.spectral_features(distance, vertical_accel_corrected, segments))
+
+        # Report the mean speed of the last segment (or the raw speed if nothing was segmented)
+        if len(iri_values) > 0:
+            speed = segments['mean_speed'][-1]
 
         return iri_values, segments, sampling_rate, speed
 
+    # Standards-based IRI: the Golden Car quarter-car driven over a profile reconstructed from the
+    # vertical acceleration on a uniform grid of sample_interval meters (see utils/quarter_car.py).
+    # Same segments and return values as calculate_iri_rms_method.
+    def calculate_iri_quarter_car_method(self, df, segment_length=100, sample_interval=0.25, distance_source='speed'):
+        from utils import quarter_car
+
+        # Filtered data
+        df_filtered, sampling_rate = self.filter_accelerometer_data(df)
+        vertical_accel_corrected, speed, distance = self._segment_inputs(df_filtered, distance_source=distance_source)
+
+        # Segmentation of data, identical to the RMS method
+        segments = self._create_segments(distance, vertical_accel_corrected, speed, segment_length)
+
+        # Quarter-car simulation over the whole run, then averaged per segment
+        grid, slope = quarter_car.profile_slope(distance, vertical_accel_corrected, speed, sample_interval)
+        rectified = quarter_car.rectified_slope(slope, sample_interval)
+        iri_values = quarter_car.segment_iri(grid, rectified, segments['distance_start'], segments['distance_end'])
+        segments.update(self.spectral_features(distance, vertical_accel_corrected, segments))
+
+        # Report the mean speed of the last segment (or the raw speed if nothing was segmented)
+        if len(iri_values) > 0:
+            speed = segments['mean_speed'][-1]
+
+        return iri_values, segments, sampling_rate, speed
+
+    # Splits the run at time gaps and sampling-rate changes, filters and segments each block on a
+    # process pool and stitches one segment table (see utils/blocks.py). Same return values as
+    # calculate_iri_rms_method, plus a 'block' column and the skipped short blocks ('dropped_blocks') in the segments.
+    def calculate_iri_by_blocks(self, df, segment_length=100, workers=None, cutoff_freq=10):
+        from utils.blocks import process_blocks
+        return process_blocks(df, segment_length, workers, cutoff_freq)
+
+    # Per-segment band energies and dominant wavelength, added as columns next to the IRI values
+    @_instrumented('spectral')
+    def spectral_features(self, distance, vertical_accel, segments, sample_interval=0.25):
+        from utils.spectral import spectral_features
+        return spectral_features(distance, vertical_accel, segments, sample_interval)
+
+    # Streaming mode for logs too large to load at once: yields segment rows as they complete
+    def stream_iri(self, csv_file, segment_length=100, chunksize=100_000, cutoff_freq=10):
+        from utils.iri_stream import StreamingIRICalculator
+        streamer = StreamingIRICalculator(segment_length, cutoff_freq, chunksize, calculator=self)
+        return streamer.iter_segments(csv_file)
+
+    # Cumulative-sum form of an already filtered run, for re-segmenting without the raw data
+    @_instrumented('segmentation')
+    def build_cumulative_run(self, df_filtered, sampling_rate=None, vertical_accel=None, distance_source='speed'):
+        from utils.compact_run import CompactRun
+        vertical_accel_corrected, speed, distance = self._segment_inputs(df_filtered, vertical_accel, distance_source)
+        return CumulativeRun(self, distance, vertical_accel_corrected, speed, sampling_rate,
+                             compact=isinstance(df_filtered, CompactRun))
+
     #Create Segments of specified length
+    # Returns columnar arrays: one entry per segment in each of the arrays
+    @_instrumented('segmentation')
     def _create_segments(self, distance, vertical_accel, speed, segment_length):
-        segments = []
-        max_distance = distance[-1]
-
-        for start_dist in np.arange(0, max_distance - segment_length, segment_length):
-            end_dist = start_dist + segment_length
-
-            # Find indices for this segment
-            start_idx = np.argmin(np.abs(distance - start_dist))
-            end_idx = np.argmin(np.abs(distance - end_dist))
-
-            if end_idx > start_idx:
-                segment = {
-                    'distance_start': start_dist,
-                    'distance_end': end_dist,
-                    'vertical_accel': vertical_accel [start_idx: end_idx],
-                    'speed' : speed[start_idx:end_idx],
-                    'length' : segment_length,
-                    'center_index': start_idx + (end_idx - start_idx) // 2
-                }
-                segments.append(segment)
-
-        return segments
-    
-
-    # Computation of IRI per segment(100 meters)
-    def _calculate_segment_iri(self, segment):
-        vertical_accel = segment['vertical_accel']
-        mean_speed = np.mean(segment['speed'])
-
-        # Calculate RMS acceleration
-        rms_accel = np.sqrt(np.mean(vertical_accel**2))
+        start_dist, end_dist, start_idx, end_idx = _segment_bounds(distance, segment_length)
+
+        # Sums over [start_idx, end_idx) for every segment in one reduction
+        accel_sq_sum = _segment_sums(np.asarray(vertical_accel, dtype=float)**2, start_idx, end_idx)
+        speed_sum = _segment_sums(np.asarray(speed, dtype=float), start_idx, end_idx)
+
+        return _segment_table(start_dist, end_dist, start_idx, end_idx,
+                              accel_sq_sum, speed_sum, segment_length)
+
+
+    # Computation of IRI per segment(100 meters), for arrays of segment RMS and mean speed
+    @_instrumented('iri')
+    def _calculate_segment_iri(self, rms_accel, mean_speed):
+        rms_accel = np.asarray(rms_accel, dtype=float)
+        mean_speed = np.asarray(mean_speed, dtype=float)
 
         # Convert to IRI with empirical relationship
         # IRI = K * (RMS_accel)^n / speed^m
@@ -274,12 +620,11 @@ class IRICalculator:
         n = 1  # Acceleration exponent
         m = 1 # Speed Exponent
 
-        if mean_speed > 0:
-            iri = K*(rms_accel**n) / (mean_speed**m)
-        else:
-            iri = 0 
+        iri = np.zeros(np.shape(rms_accel))
+        moving = mean_speed > 0
+        iri[moving] = K*(rms_accel[moving]**n) / (mean_speed[moving]**m)
 
-        return iri, mean_speed
+        return iri
 
     # Plotting the Results
     def plot_results(self, df, iri_values, segments):
@@ -295,8 +640,8 @@ class IRICalculator:
         axes[0].legend()
         axes[0].grid(True)
 
-        # Plot filtered vertical acceleration
-        df_filtered, _ = self.filter_accelerometer_data(df)
+        # Plot filtered vertical acceleration (reusing the filtered columns if df already has them)
+        df_filtered = df if 'az_filtered' in df.columns else self.filter_accelerometer_data(df)[0]
         vertical_accel = self.extract_vertical_acceleration(df_filtered)
         axes[1].plot(df_filtered['time'], vertical_accel)
         axes[1].set_ylabel('Vertical Acceleration (m/s^2)')
@@ -304,7 +649,7 @@ class IRICalculator:
         axes[1].grid(True)
 
         # Plot IRI values
-        segment_centers = [s['distance_start'] + s['length']/2 for s in segments]
+        segment_centers = segments['distance_start'] + segments['length']/2
         axes[2].plot(segment_centers, iri_values, 'ro-')
         axes[2].set_xlabel('Distance (m)')
         axes[2].set_ylabel('IRI (m/km)')
@@ -343,27 +688,162 @@ class IRICalculator:
     # Saving the Results
     def save_results(self, iri_values, segments, filename = 'iri_results.csv'):
 
-        results = []
-        for i, (iri, segment) in enumerate(zip(iri_values, segments)):
-            results.append({
-                'segment_id' : i + 1,
-                'distance_start' : segment['distance_start'],
-                'distance_end' : segment['distance_end'],
-                'segment_length' : segment['length'],
-                'iri_value' : iri, 
-                'mean_speed' : np.mean(segment['speed']),
-                'rms_accel' : np.sqrt(np.mean(segment['vertical_accel']**2))
-            })
-
-        results_df = pd.DataFrame(results)
+        results_df = pd.DataFrame({
+            'segment_id' : np.arange(1, len(iri_values) + 1),
+            'distance_start' : segments['distance_start'],
+            'distance_end' : segments['distance_end'],
+            'segment_length' : segments['length'],
+            'iri_value' : iri_values,
+            'mean_speed' : segments['mean_speed'],
+            'rms_accel' : segments['rms']
+        })
+
+        # Block (from calculate_iri_by_blocks) and spectral feature columns, when the segments carry them
+        from utils.spectral import FEATURE_COLUMNS
+        for col in ['block'] + FEATURE_COLUMNS:
+            if col in segments:
+                results_df[col] = segments[col]
+
         results_df.to_csv(filename, index = False)
         print(f"Results saved to {filename}")
 
         return results_df
-        
-        
 
-            
-            
 
-        
\ No newline at end of file
+# Command line entry point: python -m utils.iri_calculator <command> ...
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m utils.iri_calculator',
+                                     description="IRI calculation tools")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    batch = commands.add_parser('batch', help="process every CSV in a directory in parallel")
+    batch.add_argument('input_dir', help="directory of Physics Toolbox CSV exports")
+    batch.add_argument('-o', '--output-dir', help="where to write results (default: <input_dir>/iri_results)")
+    batch.add_argument('-s', '--segment-length', type=float, default=100, help="segment length in meters")
+    batch.add_argument('-w', '--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    batch.add_argument('--pattern', default='*.csv', help="file name pattern (default: *.csv)")
+    batch.add_argument('-r', '--recursive', action='store_true', help="search subdirectories too")
+    batch.add_argument('--streaming', action='store_true', help="use the chunked pipeline for very large files")
+    batch.add_argument('-v', '--verbose', action='store_true', help="show per-file calculator output")
+    batch.add_argument('--split-gaps', action='store_true',
+                       help="process each recording as separate blocks split at time gaps and rate changes")
+    batch.add_argument('--method', choices=['rms', 'quarter-car'], default='rms',
+                       help="IRI method: empirical RMS relation or Golden Car quarter-car simulation")
+
+    convert = commands.add_parser('convert', help="convert CSV exports to the binary run format")
+    convert.add_argument('csv_files', nargs='+', help="Physics Toolbox CSV exports")
+    convert.add_argument('-o', '--output-dir', help="where to write .daanrun files (default: next to each CSV)")
+    convert.add_argument('--float64', action='store_true', help="store sensor channels as float64 instead of float32")
+
+    live = commands.add_parser('live', help="compute IRI from sensor batches received over UDP")
+    live.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    live.add_argument('--port', type=int, default=9870, help="UDP port to listen on")
+    live.add_argument('-s', '--segment-length', type=float, default=100, help="segment length in meters")
+    live.add_argument('--cutoff', type=float, default=10, help="low-pass cutoff frequency (Hz)")
+    live.add_argument('--sampling-rate', type=float, default=None, help="sensor rate in Hz (default: estimated)")
+    live.add_argument('-o', '--output', help="append each closed segment to this CSV")
+    live.add_argument('--idle-timeout', type=float, default=None, help="stop after this many seconds without data")
+
+    replay = commands.add_parser('replay', help="replay a recorded CSV as a live stream, for load testing")
+    replay.add_argument('csv_file', help="Physics Toolbox CSV export")
+    replay.add_argument('--host', default='127.0.0.1', help="address of the live receiver")
+    replay.add_argument('--port', type=int, default=9870, help="UDP port of the live receiver")
+    replay.add_argument('--rate', type=float, default=1.0, help="playback speed: 1 real time, 10 ten times faster, 0 unthrottled")
+    replay.add_argument('--batch-size', type=int, default=100, help="samples per batch")
+    replay.add_argument('--direct', action='store_true', help="feed an in-process engine instead of sending UDP")
+    replay.add_argument('-s', '--segment-length', type=float, default=100, help="segment length in meters (with --direct)")
+
+    synth = commands.add_parser('synth', help="generate a synthetic sensor log with ground-truth IRI")
+    synth.add_argument('output', help="output file: .csv (Physics Toolbox layout) or .daanrun (binary run)")
+    synth.add_argument('--duration', type=float, default=600, help="length of the run in seconds")
+    synth.add_argument('--rate', type=float, default=100, help="sensor sampling rate in Hz")
+    synth.add_argument('--road-class', default='C',
+                       help="ISO 8608 class A-H, or several (e.g. ACE) alternating every --class-length meters")
+    synth.add_argument('--class-length', type=float, default=1000, help="meters of road per class")
+    synth.add_argument('--speed', type=float, default=15, help="mean vehicle speed in m/s")
+    synth.add_argument('--gps-rate', type=float, default=1, help="GPS fixes per second")
+    synth.add_argument('-s', '--segment-length', type=float, default=100, help="ground-truth segment length in meters")
+    synth.add_argument('--seed', type=int, default=None, help="random seed for a reproducible run")
+    synth.add_argument('--truth', help="ground-truth CSV (default: <output>_truth.csv)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'batch':
+        from utils.batch import run_batch
+        summary_df = run_batch(args.input_dir, args.output_dir, args.segment_length, args.workers,
+                               args.pattern, args.recursive, args.streaming, args.verbose, args.method,
+                               args.split_gaps)
+        return 0 if summary_df is not None and (summary_df['status'] == 'ok').all() else 1
+
+    if args.command == 'convert':
+        import os
+        import numpy as np
+        from utils.run_format import EXTENSION, convert_csv
+        failed = 0
+        for csv_file in args.csv_files:
+            output_path = None
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+                name = os.path.splitext(os.path.basename(csv_file))[0] + EXTENSION
+                output_path = os.path.join(args.output_dir, name)
+            try:
+                convert_csv(csv_file, output_path, np.float64 if args.float64 else np.float32)
+            except Exception as e:
+                print(f"Error converting {csv_file}: {e}")
+                failed += 1
+        return 1 if failed else 0
+
+    if args.command == 'live':
+        from utils.iri_live import LiveIRIEngine, print_segment, print_stats, serve_udp
+        engine = LiveIRIEngine(args.segment_length, args.cutoff, args.sampling_rate)
+        written = []
+
+        def on_segment(segment):
+            print_segment(segment)
+            if args.output:
+                pd.DataFrame([segment]).to_csv(args.output, mode='a', index=False, header=not written)
+                written.append(segment['segment_id'])
+
+        print_stats(serve_udp(engine, args.host, args.port, on_segment, args.idle_timeout))
+        return 0
+
+    if args.command == 'replay':
+        from utils.iri_live import LiveIRIEngine, print_segment, print_stats, replay_csv
+        engine = LiveIRIEngine(args.segment_length) if args.direct else None
+        stats = replay_csv(args.csv_file, engine, args.host, args.port, args.rate, args.batch_size,
+                           on_segment=print_segment)
+        if stats is not None:
+            print_stats(stats)
+        return 0
+
+    if args.command == 'synth':
+        import os
+        import time
+        from utils.run_format import EXTENSION
+        from utils.synthetic import synthesize_run, write_binary, write_csv
+        start = time.perf_counter()
+        try:
+            run, truth = synthesize_run(args.duration, args.rate, args.road_class, args.speed, args.gps_rate,
+                                        args.segment_length, args.seed, class_length=args.class_length)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return 1
+        if args.output.endswith(EXTENSION):
+            write_binary(run, args.output)
+        else:
+            write_csv(run, args.output)
+        truth_path = args.truth or os.path.splitext(args.output)[0] + '_truth.csv'
+        truth.to_csv(truth_path, index=False)
+
+        elapsed = time.perf_counter() - start
+        rows = len(run['time'])
+        print(f"Wrote {rows:,} rows to {args.output} in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/sec)")
+        print(f"Ground truth: {len(truth)} segments, mean IRI {truth['iri'].mean():.2f} m/km -> {truth_path}")
+        return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
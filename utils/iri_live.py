@@ -0,0 +1,326 @@
+"""Push-based IRI engine for live phone streams.
+
+Samples arrive in small batches of (time, ax, ay, az, latitude, longitude,
+speed), with time in Unix seconds. The engine keeps the low-pass filter state,
+the cumulative distance and the open segment between batches, and returns each
+segment's IRI from the batch in which the segment closes:
+
+    engine = LiveIRIEngine(segment_length=100, sampling_rate=100)
+    for batch in incoming_batches:
+        for segment in engine.push(batch):
+            print(segment['distance_start'], segment['iri_value'])
+    print(engine.stats())
+
+Differences from IRICalculator.calculate_iri_rms_method:
+
+- Filtering is causal (forward SOS pass only, started from the steady state of
+  the first sample). A zero-phase pass would need future samples, so the output
+  lags by the filter's group delay (about 40 ms for 10 Hz at 100 Hz). That delay
+  shifts each segment boundary by well under a metre.
+- Gravity removal uses the running mean of the vertical acceleration, as in
+  utils/iri_stream.py.
+- The vertical axis is the filtered ``az``; the live payload has no gyroscope
+  channels for orientation correction.
+- Without a speed field, distance is the sum of haversine steps between GPS
+  fixes and speed is step / dt, so the mean speed of a segment is its distance
+  over its duration.
+
+For load testing, ``serve_udp`` accepts batches as UDP datagrams of CSV lines
+and ``replay_csv`` feeds an existing recording at real-time or accelerated
+rates:
+
+    python -m utils.iri_calculator live --port 9870
+    python -m utils.iri_calculator replay drive.csv --port 9870 --rate 10
+"""
+import math
+import socket
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+from utils.iri_calculator import IRICalculator, _haversine_distance, butter_lowpass_sos
+from utils.iri_stream import SegmentAccumulator, _carried_trapezoid
+
+LIVE_COLUMNS = ['time', 'ax', 'ay', 'az', 'latitude', 'longitude', 'speed']
+DEFAULT_PORT = 9870
+MAX_DATAGRAM_BYTES = 65507      # largest UDP payload over IPv4 (65,535 - 8 byte UDP - 20 byte IP header)
+
+
+# Haversine distance (meters) from one fix to the next, for fixes given in degrees
+def _gps_steps(lat, lon, last_lat, last_lon):
+    lat1 = np.radians(np.concatenate([[last_lat], lat[:-1]]))
+    lon1 = np.radians(np.concatenate([[last_lon], lon[:-1]]))
+    return _haversine_distance(lat1, lon1, np.radians(lat), np.radians(lon))
+
+
+# Forward-fills NaNs from the previous value, starting from `last` (which may be NaN)
+def _fill_forward(values, last):
+    values = np.concatenate([[last], values])
+    idx = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(idx, out=idx)
+    return values[idx][1:]
+
+
+class LiveIRIEngine:
+
+    def __init__(self, segment_length=100, cutoff_freq=10, sampling_rate=None, calculator=None,
+                 latency_window=10_000):
+        self.segment_length = segment_length
+        self.cutoff_freq = cutoff_freq
+        self.sampling_rate = sampling_rate          # estimated from the first samples if None
+        self.calculator = calculator if calculator is not None else IRICalculator()
+
+        self.segments = SegmentAccumulator(segment_length, self.calculator)
+        self.latencies = deque(maxlen=latency_window)   # seconds spent in each push()
+        self.batches = 0
+        self.samples = 0
+        self.busy_seconds = 0.0
+
+        self._sos = None
+        self._zi = None
+        self._pending = []          # batches held back until the sampling rate can be estimated
+        self._last = None           # time, speed, distance, latitude, longitude of the last sample
+
+    # Accepts a dict of arrays, a DataFrame or a 2-D array with LIVE_COLUMNS.
+    # Returns the segments closed by this batch (same columns as utils/iri_stream.py).
+    def push(self, batch):
+        start = time.perf_counter()
+
+        rows = self._rows(batch)
+        closed = []
+        if len(rows['time']) > 0:
+            if self._sos is None:
+                rows = self._start(rows)
+            if rows is not None:
+                closed = self._consume(rows)
+
+        elapsed = time.perf_counter() - start
+        self.latencies.append(elapsed)
+        self.busy_seconds += elapsed
+        self.batches += 1
+        return closed
+
+    # Per-batch processing latency and throughput so far
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            'batches': self.batches,
+            'samples': self.samples,
+            'segments': self.segments.segment_count,
+            'distance_m': self._last['distance'] if self._last else 0.0,
+            'mean_ms': float(np.mean(latencies)) if len(latencies) else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+            'max_ms': float(np.max(latencies)) if len(latencies) else 0.0,
+            'samples_per_sec': self.samples / self.busy_seconds if self.busy_seconds > 0 else 0.0
+        }
+
+    # Column arrays for one batch; rows without time or acceleration are dropped
+    def _rows(self, batch):
+        if isinstance(batch, np.ndarray):
+            batch = dict(zip(LIVE_COLUMNS, np.atleast_2d(batch).T))
+
+        rows = {}
+        length = len(batch['time'])
+        for col in LIVE_COLUMNS:
+            values = np.asarray(batch[col]) if col in batch else None
+            if values is None:
+                rows[col] = np.full(length, np.nan)
+            elif values.dtype.kind == 'f':
+                rows[col] = values.astype(float, copy=False)
+            else:
+                rows[col] = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+
+        valid = ~(np.isnan(rows['time']) | np.isnan(rows['ax']) | np.isnan(rows['ay']) | np.isnan(rows['az']))
+        return {col: values[valid] for col, values in rows.items()}
+
+    # Filter design once the sampling rate is known; returns the rows to process, or None to keep waiting
+    def _start(self, rows):
+        if self.sampling_rate is None:
+            self._pending.append(rows)
+            rows = {col: np.concatenate([pending[col] for pending in self._pending]) for col in LIVE_COLUMNS}
+            steps = np.diff(rows['time'])
+            if not np.any(steps > 0):
+                return None
+            self.sampling_rate = 1.0 / np.median(steps[steps > 0])
+            print(f"Estimated sampling rate: {self.sampling_rate:.2f} Hz")
+            self._pending = []
+
+        self._sos = butter_lowpass_sos(4, float(self.cutoff_freq), float(self.sampling_rate))
+        first = np.array([rows['ax'][0], rows['ay'][0], rows['az'][0]])
+        self._zi = signal.sosfilt_zi(self._sos)[:, :, None] * first
+        return rows
+
+    def _consume(self, rows):
+        accel = np.column_stack([rows['ax'], rows['ay'], rows['az']])
+        filtered, self._zi = signal.sosfilt(self._sos, accel, axis=0, zi=self._zi)
+        vertical_accel = filtered[:, 2]
+
+        speed, distance = self._advance(rows)
+        self.samples += len(vertical_accel)
+        return self.segments.push(distance, vertical_accel, speed)
+
+    # Speed and cumulative distance for a batch, continuing from the previous one
+    def _advance(self, rows):
+        t = rows['time']
+        last = self._last
+        time_steps = np.clip(np.diff(t, prepend=t[0] if last is None else last['time']), 0, None)
+
+        lat = _fill_forward(rows['latitude'], last['latitude'] if last else np.nan)
+        lon = _fill_forward(rows['longitude'], last['longitude'] if last else np.nan)
+
+        if not np.all(np.isnan(rows['speed'])) or (last and not math.isnan(last['speed'])):
+            # Recorded speed, integrated over time as in IRICalculator
+            speed = _fill_forward(rows['speed'], last['speed'] if last else np.nan)
+            speed = np.nan_to_num(speed, nan=0.0)
+            distance = _carried_trapezoid(speed, time_steps, last and (last['speed'], last['distance']))
+        elif not np.all(np.isnan(lat)):
+            # GPS only: distance between fixes, speed as step / dt
+            first_lat = last['latitude'] if last and not math.isnan(last['latitude']) else lat[0]
+            first_lon = last['longitude'] if last and not math.isnan(last['longitude']) else lon[0]
+            steps = np.nan_to_num(_gps_steps(lat, lon, first_lat, first_lon), nan=0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                speed = np.where(time_steps > 0, steps / time_steps, 0.0)
+            distance = (last['distance'] if last else 0.0) + np.cumsum(steps)
+        else:
+            # Assume constant speed if no GPS data
+            speed = np.full(len(t), 15.0)
+            distance = _carried_trapezoid(speed, time_steps, last and (15.0, last['distance']))
+
+        self._last = {
+            'time': t[-1], 'distance': distance[-1], 'latitude': lat[-1], 'longitude': lon[-1],
+            'speed': rows['speed'][-1] if not np.isnan(rows['speed'][-1]) else (last['speed'] if last else np.nan)
+        }
+        return speed, distance
+
+
+# One datagram: newline-separated CSV lines "time,ax,ay,az,latitude,longitude,speed" (empty fields allowed)
+def format_datagram(rows):
+    lines = [','.join('' if np.isnan(v) else repr(float(v)) for v in row) for row in rows]
+    return '\n'.join(lines).encode()
+
+
+# Datagrams of whole CSV lines, each at most max_bytes long. Lines carry full-precision floats
+# (up to ~130 bytes), so the row count that fits depends on the values, not a fixed number.
+def format_datagrams(rows, max_bytes=MAX_DATAGRAM_BYTES):
+    lines, size = [], 0
+    for row in rows:
+        line = format_datagram([row])
+        if lines and size + 1 + len(line) > max_bytes:
+            yield b'\n'.join(lines)
+            lines, size = [], 0
+        size += len(line) + (1 if lines else 0)
+        lines.append(line)
+    if lines:
+        yield b'\n'.join(lines)
+
+
+def parse_datagram(data):
+    rows = []
+    for line in data.decode(errors='replace').splitlines():
+        fields = line.split(',')
+        if len(fields) != len(LIVE_COLUMNS):
+            continue
+        try:
+            rows.append([float(v) if v.strip() else np.nan for v in fields])
+        except ValueError:
+            continue
+    return np.array(rows, dtype=float).reshape(-1, len(LIVE_COLUMNS))
+
+
+# Receives batches over UDP and pushes them into the engine until interrupted,
+# idle for `idle_timeout` seconds, or `max_batches` datagrams have arrived
+def serve_udp(engine, host='127.0.0.1', port=DEFAULT_PORT, on_segment=None, idle_timeout=None, max_batches=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    sock.settimeout(idle_timeout)
+    print(f"Listening for sensor batches on udp://{host}:{sock.getsockname()[1]}")
+
+    received = 0
+    try:
+        while max_batches is None or received < max_batches:
+            try:
+                data, _ = sock.recvfrom(65535)
+            except socket.timeout:
+                print(f"No data for {idle_timeout}s, stopping")
+                break
+            received += 1
+            for segment in engine.push(parse_datagram(data)):
+                if on_segment is not None:
+                    on_segment(segment)
+    except KeyboardInterrupt:
+        print("Stopped")
+    finally:
+        sock.close()
+
+    return engine.stats()
+
+
+# Samples of a recorded CSV as (time, LIVE_COLUMNS array), time in Unix seconds
+def _recorded_samples(csv_file, calculator):
+    df = calculator.load_data(csv_file)
+    if df is None:
+        raise ValueError(f"Could not load {csv_file}")
+
+    data = np.full((len(df), len(LIVE_COLUMNS)), np.nan)
+    data[:, 0] = pd.to_datetime(df['time']).astype('int64').to_numpy() / 1e9
+    for i, col in enumerate(LIVE_COLUMNS[1:], start=1):
+        if col in df.columns:
+            data[:, i] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+    return data[~np.isnan(data[:, 0])]
+
+
+# Replays a recorded CSV in batches, either into an engine directly or as UDP datagrams.
+# rate=1 is real time, rate=10 ten times faster, rate=0 as fast as possible. Over UDP a batch
+# too large for one datagram is sent as several.
+def replay_csv(csv_file, engine=None, host='127.0.0.1', port=DEFAULT_PORT, rate=1.0, batch_size=100,
+               on_segment=None, calculator=None):
+    data = _recorded_samples(csv_file, calculator if calculator is not None else IRICalculator())
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if engine is None else None
+
+    start = time.perf_counter()
+    lag = 0.0
+    try:
+        for offset in range(0, len(data), batch_size):
+            batch = data[offset:offset + batch_size]
+
+            # Send a batch once its last sample would have been recorded
+            if rate > 0:
+                due = (batch[-1, 0] - data[0, 0]) / rate
+                wait = due - (time.perf_counter() - start)
+                if wait > 0:
+                    time.sleep(wait)
+                else:
+                    lag = max(lag, -wait)
+
+            if engine is None:
+                for datagram in format_datagrams(batch):
+                    sock.sendto(datagram, (host, port))
+            else:
+                for segment in engine.push(batch):
+                    if on_segment is not None:
+                        on_segment(segment)
+    finally:
+        if sock is not None:
+            sock.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {len(data)} samples in {elapsed:.2f}s ({len(data) / max(elapsed, 1e-9):,.0f} samples/sec"
+          + (f", max lag {lag * 1000:.1f} ms" if rate > 0 else "") + ")")
+    return engine.stats() if engine is not None else None
+
+
+def print_segment(segment):
+    print(f"Segment {segment['segment_id']}: {segment['distance_start']:.0f}-{segment['distance_end']:.0f} m, "
+          f"IRI {segment['iri_value']:.2f} m/km at {segment['mean_speed'] * 3.6:.1f} km/h")
+
+
+def print_stats(stats):
+    print(f"{stats['batches']} batches, {stats['samples']} samples, {stats['segments']} segments, "
+          f"{stats['distance_m'] / 1000:.2f} km")
+    print(f"Batch latency: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, "
+          f"p95 {stats['p95_ms']:.2f} ms, max {stats['max_ms']:.2f} ms; "
+          f"{stats['samples_per_sec']:,.0f} samples/sec")
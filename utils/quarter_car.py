@@ -0,0 +1,109 @@
+"""Reference quarter-car (Golden Car) IRI, as in ASTM E1926 / Sayers (1995).
+
+The vertical acceleration is turned into a longitudinal profile slope on a
+uniform distance grid:
+
+    curvature(x) = a(t) / v(t)^2            (d2z/dx2 = d2z/dt2 / v^2)
+    slope(x)     = integral of curvature, high-pass filtered at 91 m wavelength
+
+The Golden Car is then driven over that slope at 80 km/h. The quarter-car is a
+linear time-invariant system, so instead of stepping the state
+``Z = ST @ Z + PR * slope`` sample by sample in Python, the exact discrete
+system (ST = expm(A * dt), PR = A^-1 (ST - I) B) is converted once per grid
+spacing to second-order sections and run with ``scipy.signal.sosfilt``. The
+ASTM start condition (both masses on the average slope of the first 11 m) is
+the steady state for that slope, which is what ``sosfilt_zi`` gives.
+
+IRI is the mean rectified slope |z_s' - z_u'| in m/km over each segment.
+The profile comes from a phone on the sprung mass rather than a profiler, so
+the result is only as good as that reconstruction; it is not calibrated.
+"""
+import functools
+
+import numpy as np
+from scipy import linalg, signal
+
+from utils.iri_calculator import resample_to_distance
+
+GOLDEN_CAR = {'k1': 653.0, 'k2': 63.3, 'c': 6.0, 'mu': 0.15}     # kt/ms, ks/ms, cs/ms, mu/ms
+SIMULATION_SPEED = 80 / 3.6             # m/s
+BASE_LENGTH = 0.25                      # m, moving-average base length of the profile
+INITIAL_LENGTH = 11.0                   # m, profile length used for the initial slope
+HIGHPASS_WAVELENGTH = 91.0              # m, longer wavelengths do not affect IRI
+MIN_SPEED = 1.0                         # m/s, below this the vehicle is treated as stopped
+
+
+# Exact discretization of the Golden Car for one step of dx meters at the simulation speed
+@functools.lru_cache(maxsize=16)
+def state_transition(dx, speed=SIMULATION_SPEED):
+    k1, k2, c, mu = GOLDEN_CAR['k1'], GOLDEN_CAR['k2'], GOLDEN_CAR['c'], GOLDEN_CAR['mu']
+    A = np.array([[0, 1, 0, 0],
+                  [-k2, -c, k2, c],
+                  [0, 0, 0, 1],
+                  [k2 / mu, c / mu, -(k1 + k2) / mu, -c / mu]])
+    B = np.array([[0], [0], [0], [k1 / mu]])
+
+    ST = linalg.expm(A * dx / speed)
+    PR = np.linalg.solve(A, ST - np.eye(4)) @ B
+    return ST, PR
+
+
+# Second-order sections from profile slope to z_s' - z_u' (output taken after each state update)
+@functools.lru_cache(maxsize=16)
+def quarter_car_sos(dx, speed=SIMULATION_SPEED):
+    ST, PR = state_transition(dx, speed)
+    C = np.array([[1.0, 0.0, -1.0, 0.0]])
+    z, p, k = signal.ss2zpk(ST, PR, C @ ST, C @ PR)
+    return signal.zpk2sos(z, p, k)
+
+
+# Rectified slope |z_s' - z_u'| at every grid point of a profile slope sampled every dx meters
+def rectified_slope(slope, dx, speed=SIMULATION_SPEED):
+    slope = np.asarray(slope, dtype=float)
+    if len(slope) == 0:
+        return np.zeros(0)
+
+    sos = quarter_car_sos(dx, speed)
+    initial = np.mean(slope[:max(1, int(round(INITIAL_LENGTH / dx)))])
+    response, _ = signal.sosfilt(sos, slope, zi=signal.sosfilt_zi(sos) * initial)
+    return np.abs(response)
+
+
+# Profile slope on a uniform grid of dx meters from vertical acceleration (gravity removed),
+# speed and cumulative distance at the sensor samples. Returns (grid distances, slope).
+def profile_slope(distance, vertical_accel, speed, dx=BASE_LENGTH):
+    distance = np.asarray(distance, dtype=float)
+    if len(distance) < 2 or distance[-1] <= dx:
+        return np.zeros(0), np.zeros(0)
+
+    # Curvature in the distance domain; samples while stopped carry no profile information
+    speed = np.asarray(speed, dtype=float)
+    moving = speed > MIN_SPEED
+    curvature = np.where(moving, np.asarray(vertical_accel, dtype=float) / np.maximum(speed, MIN_SPEED)**2, 0.0)
+
+    grid, curvature = resample_to_distance(distance, curvature, dx)
+
+    # Integrate to slope, then remove the drift the integration leaves at long wavelengths
+    slope = np.cumsum(curvature) * dx
+    cutoff = 2 * dx / HIGHPASS_WAVELENGTH           # fraction of the grid's Nyquist wavenumber
+    if len(slope) > 30:
+        slope = signal.sosfiltfilt(signal.butter(2, cutoff, btype='high', output='sos'), slope)
+
+    # 250 mm moving average of the profile (ASTM E1926), as a moving average of the slope
+    base = int(round(BASE_LENGTH / dx))
+    if base > 1:
+        slope = np.convolve(slope, np.ones(base) / base, mode='same')
+
+    return grid, slope
+
+
+# IRI (m/km) of each segment [start_dist, end_dist) from the rectified slope on the grid
+def segment_iri(grid, rectified, start_dist, end_dist):
+    if len(grid) == 0:
+        return np.zeros(len(start_dist))
+
+    cumsum = np.concatenate([[0.0], np.cumsum(rectified)])
+    start_idx = np.searchsorted(grid, start_dist, side='left')
+    end_idx = np.searchsorted(grid, end_dist, side='left')
+    count = np.maximum(end_idx - start_idx, 1)
+    return (cumsum[end_idx] - cumsum[start_idx]) / count * 1000
@@ -0,0 +1,189 @@
+"""Content-addressed on-disk cache of preprocessed and filtered runs.
+
+Entries are keyed by a SHA-256 of the uploaded file's bytes together with the
+processing parameters (cutoff frequency, calculator version), so re-opening a
+known drive in any session skips parsing and filtering entirely. Each entry is
+one uncompressed NPZ file holding one array per column. When the cache grows
+past ``max_bytes`` the least recently used entries are removed.
+
+    cache = RunCache()
+    df_processed, duration, df_filtered, sampling_rate, hit = load_filtered_run(uploaded_file, cache)
+
+``load_processed_run`` caches only the preprocessed columns, so the stage graph
+(utils/stage_graph.py) can filter one parsed run at several cutoffs; its filter
+stage passes that run to ``load_filtered_run`` to reuse the filtered channels.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from utils.compact_run import CompactRun
+from utils.iri_calculator import CALCULATOR_VERSION, IRICalculator
+
+DEFAULT_CACHE_DIR = os.environ.get('DAAN_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'daan', 'runs'))
+DEFAULT_MAX_BYTES = int(float(os.environ.get('DAAN_CACHE_MAX_MB', 2048)) * 1024 * 1024)
+
+FILTERED_COLUMNS = ['ax_filtered', 'ay_filtered', 'az_filtered']
+
+
+class RunCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Key from the file content plus every parameter that changes the cached arrays
+    @staticmethod
+    def make_key(data, **params):
+        params = dict(params, calculator_version=CALCULATOR_VERSION)
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    # Returns (arrays, meta) or None; a hit refreshes the entry's LRU timestamp
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files if name != '__meta__'}
+                meta = json.loads(str(npz['__meta__']))
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return arrays, meta
+
+    # Stores a dict of equal-length arrays plus JSON metadata, then enforces the size limit
+    def put(self, key, arrays, meta=None):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, __meta__=np.array(json.dumps(meta or {})), **arrays)
+            os.replace(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.evict()
+
+    # Removes least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.cache_dir, name))
+                   for name in os.listdir(self.cache_dir) if name.endswith('.npz'))
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npz'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def _read_bytes(csv_file):
+    if hasattr(csv_file, 'getvalue'):       # Streamlit UploadedFile / BytesIO
+        return csv_file.getvalue()
+    with open(csv_file, 'rb') as f:
+        return f.read()
+
+
+# Numeric column arrays of a preprocessed frame or CompactRun; an all-None altitude column is stored as NaN
+def _column_arrays(df_processed):
+    return {col: np.asarray(pd.to_numeric(df_processed[col], errors='coerce'), dtype=float)
+            for col in df_processed.columns}
+
+
+# Preprocessed (not yet filtered) run for a CSV, from the cache when the same content was seen before.
+# Returns (df_processed, duration, cache_hit), or None if preprocessing fails.
+def load_processed_run(csv_file, cache, calculator=None):
+    calculator = calculator if calculator is not None else IRICalculator()
+    data = _read_bytes(csv_file)
+    key = cache.make_key(data, stage='preprocess')
+
+    cached = cache.get(key)
+    if cached is not None:
+        arrays, meta = cached
+        df_processed = pd.DataFrame({col: arrays[col] for col in meta['columns']})
+        print(f"Loaded cached run {key[:12]} ({len(df_processed)} rows)")
+        return df_processed, meta['duration'], True
+
+    df = calculator.load_data(io.BytesIO(data))
+    processed = calculator.preprocess_data(df) if df is not None else None
+    if processed is None:
+        return None
+    df_processed, duration = processed
+
+    cache.put(key, _column_arrays(df_processed), {'columns': list(df_processed.columns), 'duration': float(duration)})
+    return df_processed, duration, False
+
+
+# Preprocessed and filtered run for a CSV, from the cache when the same content was seen before.
+# `processed` is an already preprocessed (df_processed, duration), used instead of parsing the CSV again on a
+# miss; a CompactRun gets its own entries, as its channels are rounded.
+# Returns (df_processed, duration, df_filtered, sampling_rate, cache_hit), or None if preprocessing fails.
+def load_filtered_run(csv_file, cache, cutoff_freq=10, calculator=None, processed=None):
+    calculator = calculator if calculator is not None else IRICalculator()
+    data = _read_bytes(csv_file)
+    compact = processed is not None and isinstance(processed[0], CompactRun)
+    key = cache.make_key(data, cutoff_freq=cutoff_freq, **({'compact': True} if compact else {}))
+
+    cached = cache.get(key)
+    if cached is not None:
+        arrays, meta = cached
+        if processed is not None:
+            df_processed, duration = processed
+        else:
+            df_processed = pd.DataFrame({col: arrays[col] for col in meta['columns']})
+            duration = meta['duration']
+        df_filtered = df_processed.copy(deep=False)
+        for col in FILTERED_COLUMNS:
+            df_filtered[col] = arrays[col]
+        print(f"Loaded cached run {key[:12]} ({len(df_processed)} rows)")
+        return df_processed, duration, df_filtered, meta['sampling_rate'], True
+
+    if processed is None:
+        df = calculator.load_data(io.BytesIO(data))
+        processed = calculator.preprocess_data(df) if df is not None else None
+        if processed is None:
+            return None
+    df_processed, duration = processed
+    df_filtered, sampling_rate = calculator.filter_accelerometer_data(df_processed, cutoff_freq)
+
+    columns = list(df_processed.columns)
+    arrays = _column_arrays(df_processed)
+    for col in FILTERED_COLUMNS:
+        arrays[col] = np.asarray(df_filtered[col], dtype=float)
+    meta = {'columns': columns, 'duration': float(duration), 'sampling_rate': float(sampling_rate)}
+    cache.put(key, arrays, meta)
+
+    return df_processed, duration, df_filtered, sampling_rate, False
@@ -0,0 +1,154 @@
+"""Memory-mapped binary format for sensor runs (``.daanrun``).
+
+Layout (little-endian):
+
+    header        magic 'DAANRUN\\0', version, channel count, sample count,
+                  start time (Unix seconds of the first sample), nominal
+                  sampling rate (Hz), data offset
+    channel table one entry per channel: name (16 bytes), dtype ('<f4'/'<f8'),
+                  byte offset of the channel's data
+    data          each channel as one contiguous array, 64-byte aligned
+
+``time`` (seconds from the start of the run) and the GPS coordinates are always
+float64, since float32 would round positions to about a metre; the other
+channels are float32 by default. Because every channel is contiguous, a worker
+can ``np.memmap`` a run and read only the rows it needs:
+
+    run = RecordingRun('drive.daanrun')
+    df_processed, duration = run.to_dataframe(start=360_000, stop=720_000)
+"""
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b'DAANRUN\x00'
+VERSION = 1
+EXTENSION = '.daanrun'
+
+HEADER = struct.Struct('<8sHHQddI')        # magic, version, channels, samples, start time, rate, data offset
+CHANNEL = struct.Struct('<16s4sQ')         # name, dtype, offset
+ALIGNMENT = 64
+
+# Channels that keep full precision regardless of the requested dtype
+FLOAT64_CHANNELS = ('time', 'latitude', 'longitude')
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+# Writes channels (name -> 1-D array of equal length) to a run file
+def write_run(path, channels, start_time=0.0, sampling_rate=0.0, dtype=np.float32):
+    names = list(channels)
+    if 'time' not in names:
+        raise ValueError("A run needs a 'time' channel")
+
+    sample_count = len(channels['time'])
+    arrays = []
+    for name in names:
+        if len(name.encode()) > 16:
+            raise ValueError(f"Channel name too long: {name}")
+        channel_dtype = np.float64 if name in FLOAT64_CHANNELS else dtype
+        array = np.ascontiguousarray(pd.to_numeric(pd.Series(channels[name]), errors='coerce'),
+                                     dtype=channel_dtype)
+        if len(array) != sample_count:
+            raise ValueError(f"Channel {name} has {len(array)} samples, expected {sample_count}")
+        arrays.append(array)
+
+    # Offsets: header and channel table first, then each channel aligned
+    offset = _align(HEADER.size + CHANNEL.size * len(names))
+    data_offset = offset
+    offsets = []
+    for array in arrays:
+        offsets.append(offset)
+        offset = _align(offset + array.nbytes)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(names), sample_count,
+                            float(start_time), float(sampling_rate), data_offset))
+        for name, array, channel_offset in zip(names, arrays, offsets):
+            f.write(CHANNEL.pack(name.encode(), array.dtype.str.encode(), channel_offset))
+        for array, channel_offset in zip(arrays, offsets):
+            f.seek(channel_offset)
+            f.write(array.tobytes())
+        f.truncate(offset)
+
+    return path
+
+
+# Read-only view of a run file; channel data is memory-mapped, not loaded
+class RecordingRun:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError(f"{path} is not a run file")
+            magic, version, channel_count, self.sample_count, self.start_time, self.sampling_rate, _ = \
+                HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a run file")
+            if version > VERSION:
+                raise ValueError(f"{path} uses run format version {version}, newer than {VERSION}")
+
+            table = f.read(CHANNEL.size * channel_count)
+
+        self.channels = {}
+        for i in range(channel_count):
+            name, dtype, offset = CHANNEL.unpack_from(table, i * CHANNEL.size)
+            name = name.rstrip(b'\x00').decode()
+            self.channels[name] = np.memmap(path, dtype=np.dtype(dtype.rstrip(b'\x00').decode()), mode='r',
+                                            offset=offset, shape=(self.sample_count,))
+
+    def __len__(self):
+        return self.sample_count
+
+    def __getitem__(self, name):
+        return self.channels[name]
+
+    @property
+    def columns(self):
+        return list(self.channels)
+
+    @property
+    def nbytes(self):
+        return os.path.getsize(self.path)
+
+    # Rows [start, stop) in preprocess_data's output shape: (DataFrame, duration).
+    # Only that slice is read from disk; channels are returned as float64 like preprocess_data.
+    def to_dataframe(self, start=None, stop=None):
+        rows = slice(start, stop)
+        df = pd.DataFrame({name: np.asarray(channel[rows], dtype=np.float64)
+                           for name, channel in self.channels.items()})
+        duration = df['time'].iloc[-1] - df['time'].iloc[0] if len(df) > 0 else 0.0
+        return df, duration
+
+
+# One-shot conversion of a Physics Toolbox CSV into a run file
+def convert_csv(csv_path, output_path=None, dtype=np.float32, calculator=None):
+    from utils.ingest import parse_time
+    from utils.iri_calculator import IRICalculator
+
+    calculator = calculator if calculator is not None else IRICalculator()
+    output_path = output_path or os.path.splitext(csv_path)[0] + EXTENSION
+
+    df = calculator.load_data(csv_path)
+    processed = calculator.preprocess_data(df) if df is not None else None
+    if processed is None:
+        raise ValueError(f"Could not preprocess {csv_path}")
+    df_processed, _ = processed
+
+    # Absolute time of the first sample; preprocess_data keeps only relative seconds
+    first_time = parse_time(df['time'].dropna().iloc[:1])
+    start_time = first_time.astype('int64').iloc[0] / 1e9 if len(first_time) > 0 else 0.0
+    sampling_rate = 1.0 / np.median(np.diff(df_processed['time'])) if len(df_processed) > 1 else 0.0
+
+    channels = {col: df_processed[col] for col in df_processed.columns}
+    write_run(output_path, channels, start_time, sampling_rate, dtype)
+
+    size = os.path.getsize(output_path)
+    print(f"Converted {csv_path} -> {output_path} ({len(df_processed)} rows, {size / 1e6:.1f} MB)")
+    return output_path
@@ -0,0 +1,96 @@
+"""Per-segment spectral roughness features in the distance domain.
+
+Vertical acceleration is first resampled onto a uniform distance grid
+(``resample_to_distance``), so every segment of length L has the same number of
+samples whatever the speed. All segments are then cut out of the grid as one
+(segments, samples) array, split into Hann-windowed half-overlapping windows
+with a strided view, and transformed with a single batched ``rfft``. The
+averaged window spectra give each segment's PSD over wavenumber (cycles/m).
+
+Features per segment (columns next to the IRI values in save_results):
+
+    energy_short         acceleration variance from 0.5-3 m wavelengths  (m^2/s^4)
+    energy_medium        from 3-10 m wavelengths
+    energy_long          from 10-30 m wavelengths
+    dominant_wavelength  wavelength of the PSD peak within 0.5-30 m        (m)
+
+Energies are acceleration, not profile, so they depend on speed and vehicle
+like the RMS value does; they are meant for comparing segments of one drive.
+"""
+import numpy as np
+
+from utils.iri_calculator import resample_to_distance
+
+SAMPLE_INTERVAL = 0.25          # m, grid spacing (Nyquist wavelength 0.5 m)
+WINDOW_SAMPLES = 256            # samples per FFT window (64 m at 0.25 m)
+WAVELENGTH_BANDS = {
+    'short': (0.5, 3.0),
+    'medium': (3.0, 10.0),
+    'long': (10.0, 30.0)
+}
+FEATURE_COLUMNS = [f'energy_{name}' for name in WAVELENGTH_BANDS] + ['dominant_wavelength']
+
+
+# (segments, samples) array of grid values; segment i covers samples [start_idx[i], start_idx[i] + length)
+def segment_matrix(values, start_idx, length):
+    start_idx = np.asarray(start_idx, dtype=int)
+    overrun = int(start_idx.max()) + length - len(values) if len(start_idx) > 0 else 0
+    if overrun > 0:
+        values = np.pad(values, (0, overrun), mode='edge')
+    return values[start_idx[:, None] + np.arange(length)]
+
+
+# Welch PSD of every row of a (segments, samples) array with one batched FFT.
+# Returns (wavenumbers in cycles/m, psd of shape (segments, wavenumbers)).
+def batched_psd(rows, dx, window_samples=WINDOW_SAMPLES):
+    length = rows.shape[1]
+    window_samples = min(window_samples, length)
+    hop = window_samples // 2
+
+    # (segments, windows, window_samples) strided view; no copy until detrending
+    windows = np.lib.stride_tricks.sliding_window_view(rows, window_samples, axis=1)[:, ::hop]
+    taper = np.hanning(window_samples)
+    spectra = np.fft.rfft((windows - windows.mean(axis=-1, keepdims=True)) * taper, axis=-1)
+
+    # One-sided density scaling, averaged over windows
+    psd = (np.abs(spectra)**2).mean(axis=1) * (2 * dx / np.sum(taper**2))
+    psd[:, 0] /= 2
+    if window_samples % 2 == 0:
+        psd[:, -1] /= 2
+    return np.fft.rfftfreq(window_samples, dx), psd
+
+
+# Band energies and dominant wavelength from per-segment PSDs
+def band_features(wavenumbers, psd):
+    features = {}
+    step = wavenumbers[1] - wavenumbers[0] if len(wavenumbers) > 1 else 0.0
+    for name, (short, long) in WAVELENGTH_BANDS.items():
+        band = (wavenumbers > 1 / long) & (wavenumbers <= 1 / short)
+        features[f'energy_{name}'] = psd[:, band].sum(axis=1) * step
+
+    shortest, longest = min(b[0] for b in WAVELENGTH_BANDS.values()), max(b[1] for b in WAVELENGTH_BANDS.values())
+    in_range = np.flatnonzero((wavenumbers >= 1 / longest) & (wavenumbers <= 1 / shortest))
+    if len(in_range) > 0:
+        peak = in_range[np.argmax(psd[:, in_range], axis=1)]
+        features['dominant_wavelength'] = 1 / wavenumbers[peak]
+    else:
+        features['dominant_wavelength'] = np.full(len(psd), np.nan)
+    return features
+
+
+# Spectral features for every segment of a segment table from already resampled grid values
+def segment_features(grid_values, segments, dx=SAMPLE_INTERVAL):
+    start_dist = np.asarray(segments['distance_start'], dtype=float)
+    length = int(round(segments['length'] / dx))
+    if len(start_dist) == 0 or length < 8 or len(grid_values) == 0:
+        return {col: np.full(len(start_dist), np.nan) for col in FEATURE_COLUMNS}
+
+    rows = segment_matrix(grid_values, np.round(start_dist / dx).astype(int), length)
+    wavenumbers, psd = batched_psd(rows, dx)
+    return band_features(wavenumbers, psd)
+
+
+# Resamples vertical acceleration onto the distance grid and computes the features per segment
+def spectral_features(distance, vertical_accel, segments, dx=SAMPLE_INTERVAL):
+    _, grid_values = resample_to_distance(distance, vertical_accel, dx)
+    return segment_features(grid_values, segments, dx)
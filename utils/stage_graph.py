@@ -0,0 +1,211 @@
+"""Incremental recompute graph for the IRI pipeline.
+
+Each stage's output is memoized on a key made of its own parameters and the
+keys of the stages it reads from. Only the stages downstream of a changed
+parameter are recomputed:
+
+    preprocess(source, compact) --+--> filter(cutoff_freq) --> vertical -----------------+--> cumulative --> segmentation(segment_length) --> iri
+                                  |                                                      |                 +--> profile(segment_length, profile_step)
+                                  |                                                      |                          |
+                                  +--> gps(distance_source) --> speed --> distance ------+--> resample -----------> spectral
+
+The IRI threshold is only used for display, so it is not an input to any
+stage. With ``distance_source='gps'`` the gps stage interpolates the GPS fixes
+onto the sensor timeline and distance is the geodesic distance between them;
+with ``'speed'`` (the default) distance is integrated from speed. With
+``compact=True`` the run is held as a float32 ``CompactRun`` (utils/compact_run.py).
+``graph.last_run`` records which stages were hits or misses in the most
+recent run, and ``graph.report()`` returns the totals per stage:
+
+    graph = build_iri_graph(IRICalculator(), RunCache())
+    outputs = graph.run(['segmentation', 'iri'], source='drive.csv', cutoff_freq=10, segment_length=100)
+"""
+import hashlib
+import inspect
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import spectral
+from utils.compact_run import CompactRun
+from utils.iri_calculator import CumulativeRun, IRICalculator, resample_to_distance
+
+
+# Hashable identity of a parameter value
+def _param_key(value):
+    if hasattr(value, 'file_id'):               # Streamlit UploadedFile
+        return ('upload', value.file_id)
+    if hasattr(value, 'getvalue'):              # BytesIO
+        return ('bytes', hashlib.sha256(value.getvalue()).hexdigest())
+    if isinstance(value, (bytes, bytearray)):
+        return ('bytes', hashlib.sha256(value).hexdigest())
+    if isinstance(value, str) and os.path.isfile(value):
+        stat = os.stat(value)
+        return ('path', os.path.abspath(value), stat.st_mtime_ns, stat.st_size)
+    return value
+
+
+# One step of the pipeline: func(*input_values, **params)
+class Stage:
+
+    def __init__(self, name, func, inputs=(), params=(), max_entries=1):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = tuple(params)
+        self.max_entries = max_entries      # memoized outputs kept, least recently used dropped first
+        # Values used for parameters not passed to run(), so an omitted parameter keys like its default
+        signature = inspect.signature(func).parameters
+        self.defaults = {p: signature[p].default for p in self.params
+                         if p in signature and signature[p].default is not inspect.Parameter.empty}
+
+
+class StageGraph:
+
+    def __init__(self, stages):
+        self.stages = OrderedDict((stage.name, stage) for stage in stages)
+        self.stats = {name: {'hits': 0, 'misses': 0, 'seconds': 0.0} for name in self.stages}
+        self.last_run = {}
+        self._memo = {name: OrderedDict() for name in self.stages}
+
+    # Memo key of a stage: its parameter values plus the keys of its inputs
+    def _key(self, name, params, keys):
+        if name not in keys:
+            stage = self.stages[name]
+            keys[name] = (tuple(_param_key(params.get(p, stage.defaults.get(p))) for p in stage.params),
+                          tuple(self._key(dep, params, keys) for dep in stage.inputs))
+        return keys[name]
+
+    def _evaluate(self, name, params, keys):
+        stage = self.stages[name]
+        key = self._key(name, params, keys)
+        memo = self._memo[name]
+
+        if key in memo:
+            memo.move_to_end(key)
+            if name not in self.last_run:
+                self.stats[name]['hits'] += 1
+                self.last_run[name] = {'status': 'hit', 'seconds': 0.0}
+            return memo[key]
+
+        # Inputs are only evaluated on a miss, so stages upstream of a hit are not touched
+        input_values = [self._evaluate(dep, params, keys) for dep in stage.inputs]
+        start = time.perf_counter()
+        # Parameters not passed to run() fall back to the stage function's defaults
+        value = stage.func(*input_values, **{p: params[p] for p in stage.params if p in params})
+        elapsed = time.perf_counter() - start
+
+        memo[key] = value
+        while len(memo) > stage.max_entries:
+            memo.popitem(last=False)
+
+        self.stats[name]['misses'] += 1
+        self.stats[name]['seconds'] += elapsed
+        self.last_run[name] = {'status': 'miss', 'seconds': elapsed}
+        return value
+
+    # Output of one stage, or a dict of outputs for a list of stages
+    def run(self, targets, **params):
+        self.last_run = {}
+        keys = {}
+        names = [targets] if isinstance(targets, str) else list(targets)
+        outputs = {name: self._evaluate(name, params, keys) for name in names}
+
+        summary = ', '.join(f"{name} {run['status']}" for name, run in self.last_run.items())
+        print(f"Pipeline stages: {summary}")
+        return outputs[targets] if isinstance(targets, str) else outputs
+
+    # True if the stage's output for these parameters is already memoized
+    def is_cached(self, name, **params):
+        return self._key(name, params, {}) in self._memo[name]
+
+    # One row per stage: last status, last and total compute time, hit and miss counts
+    def report(self):
+        rows = []
+        for name, stats in self.stats.items():
+            last = self.last_run.get(name, {'status': 'skipped', 'seconds': 0.0})
+            rows.append({'stage': name, 'last': last['status'], 'last_seconds': last['seconds'],
+                         'hits': stats['hits'], 'misses': stats['misses'], 'total_seconds': stats['seconds']})
+        return rows
+
+    def clear(self):
+        for memo in self._memo.values():
+            memo.clear()
+
+
+# The RMS-method pipeline of IRICalculator as a stage graph.
+# With a RunCache, preprocessed and filtered runs are also shared on disk across sessions.
+def build_iri_graph(calculator=None, run_cache=None):
+    calculator = calculator if calculator is not None else IRICalculator()
+
+    def preprocess(source, compact=False):
+        if run_cache is not None:
+            from utils.run_cache import load_processed_run
+            loaded = load_processed_run(source, run_cache, calculator)
+            processed = loaded[:2] if loaded is not None else None
+        else:
+            df = calculator.load_data(source)
+            processed = calculator.preprocess_data(df) if df is not None else None
+        if processed is None:
+            raise ValueError("Data preprocessing failed")
+        if compact:
+            return CompactRun.from_dataframe(processed[0]), processed[1]
+        return processed
+
+    def filter_stage(processed, source, cutoff_freq):
+        if run_cache is not None:
+            from utils.run_cache import load_filtered_run
+            loaded = load_filtered_run(source, run_cache, cutoff_freq, calculator, processed=processed)
+            return loaded[2], loaded[3]
+        return calculator.filter_accelerometer_data(processed[0], cutoff_freq)
+
+    def vertical(filtered):
+        return calculator.extract_vertical_acceleration(filtered[0])
+
+    def gps(processed, distance_source='speed'):
+        return calculator.align_gps(processed[0]) if distance_source == 'gps' else processed[0]
+
+    def speed(df):
+        return calculator.estimate_speed(df)
+
+    def distance(df, speed):
+        if 'gps_distance' in df.columns:
+            return np.asarray(df['gps_distance'])
+        return calculator.calculate_distance(np.asarray(df['time']), speed)
+
+    def cumulative(filtered, vertical_accel, speed, distance):
+        # Remove gravity component before summing a^2
+        return CumulativeRun(calculator, distance, vertical_accel - np.mean(vertical_accel), speed, filtered[1],
+                             compact=isinstance(filtered[0], CompactRun))
+
+    def segmentation(cumulative_run, segment_length):
+        return cumulative_run.segments(segment_length)
+
+    def profile(cumulative_run, segment_length, profile_step=5):
+        return cumulative_run.profile(segment_length, profile_step)
+
+    def iri(segments):
+        return calculator._calculate_segment_iri(segments['rms'], segments['mean_speed'])
+
+    def resample(vertical_accel, distance):
+        return resample_to_distance(distance, vertical_accel, spectral.SAMPLE_INTERVAL)
+
+    def spectral_stage(resampled, segments):
+        return spectral.segment_features(resampled[1], segments, spectral.SAMPLE_INTERVAL)
+
+    return StageGraph([
+        Stage('preprocess', preprocess, params=('source', 'compact')),
+        Stage('filter', filter_stage, inputs=('preprocess',), params=('source', 'cutoff_freq')),
+        Stage('vertical', vertical, inputs=('filter',)),
+        Stage('gps', gps, inputs=('preprocess',), params=('distance_source',)),
+        Stage('speed', speed, inputs=('gps',)),
+        Stage('distance', distance, inputs=('gps', 'speed')),
+        Stage('cumulative', cumulative, inputs=('filter', 'vertical', 'speed', 'distance')),
+        Stage('segmentation', segmentation, inputs=('cumulative',), params=('segment_length',), max_entries=8),
+        Stage('iri', iri, inputs=('segmentation',), max_entries=8),
+        Stage('profile', profile, inputs=('cumulative',), params=('segment_length', 'profile_step'), max_entries=8),
+        Stage('resample', resample, inputs=('vertical', 'distance')),
+        Stage('spectral', spectral_stage, inputs=('resample', 'segmentation'), max_entries=8),
+    ])
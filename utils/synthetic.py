@@ -0,0 +1,245 @@
+"""Synthetic Physics Toolbox-shaped sensor logs with known ground-truth roughness.
+
+A run is generated in four vectorized steps:
+
+1. Road profile: random-phase sum of sinusoids with the ISO 8608 displacement
+   PSD  Gd(n) = Gd(n0) * (n / n0)^-2  (n0 = 0.1 cycles/m, 0.011-2.83 cycles/m),
+   built with one inverse FFT on a uniform distance grid.
+2. Speed and GPS track: a smooth random speed around ``mean_speed``, integrated
+   to distance, and a smooth random heading turned into latitude/longitude.
+   GPS is sampled at ``gps_rate`` and held between fixes, as Physics Toolbox logs it.
+3. Vehicle response: the road height under the wheel at each sample drives
+   the Golden Car quarter-car, discretized once for the sampling rate and run with
+   ``sosfilt``. Its sprung-mass acceleration plus sensor noise is ``az``.
+4. Ground truth: the standard IRI (quarter-car at 80 km/h over the true
+   profile, see utils/quarter_car.py) of every ``segment_length`` segment.
+
+    run, truth = synthesize_run(duration=3600, sampling_rate=100, road_class='C', seed=1)
+    write_csv(run, 'drive.csv')                 # or write_binary(run, 'drive.daanrun')
+    truth.to_csv('drive_truth.csv', index=False)
+
+From the command line:
+
+    python -m utils.iri_calculator synth drive.csv --duration 3600 --road-class C
+
+The RMS method is an empirical relation, so its values track the ground truth
+only after calibration; the ground truth is exact for the quarter-car method up
+to the profile reconstruction.
+"""
+import numpy as np
+import pandas as pd
+from scipy import signal
+from scipy.integrate import cumulative_trapezoid
+
+from utils.ingest import HAS_PYARROW
+from utils.iri_calculator import EARTH_RADIUS
+from utils.quarter_car import BASE_LENGTH, GOLDEN_CAR, rectified_slope, segment_iri
+
+# ISO 8608 geometric-mean displacement PSD Gd(n0) per road class (m^3)
+ISO_8608_CLASSES = {
+    'A': 16e-6,
+    'B': 64e-6,
+    'C': 256e-6,
+    'D': 1024e-6,
+    'E': 4096e-6,
+    'F': 16384e-6,
+    'G': 65536e-6,
+    'H': 262144e-6
+}
+REFERENCE_WAVENUMBER = 0.1              # cycles/m, n0
+WAVENUMBER_RANGE = (0.011, 2.83)        # cycles/m, band covered by ISO 8608
+PROFILE_INTERVAL = 0.05                 # m, profile grid spacing
+CSV_COLUMNS = ['time', 'ax', 'ay', 'az', 'wx', 'wy', 'wz', 'latitude', 'longitude', 'speed', 'altitude']
+SENSOR_NOISE = {'accel': 0.05, 'gyro': 0.002, 'gps': 1.5}     # m/s^2, rad/s, m (standard deviations)
+
+
+# Smooth zero-mean noise with unit standard deviation, varying on a time scale of `period` samples.
+# White noise is low-passed in the frequency domain (a Gaussian of width 1 / period), so there is no
+# filter start-up transient at the ends. The FFT is circular, so the sequence is generated with
+# 4 periods of padding, which is dropped, and the ends of the kept part are independent.
+def _smooth_noise(rng, count, period):
+    if count < 2:
+        return np.zeros(count)
+    period = max(period, 2)
+    total = count + int(4 * period)
+    frequencies = np.fft.rfftfreq(total)
+    spectrum = np.fft.rfft(rng.standard_normal(total)) * np.exp(-0.5 * (frequencies * period)**2)
+    smooth = np.fft.irfft(spectrum, n=total)
+    return smooth[:count] / (np.std(smooth) or 1.0)
+
+
+# Road class at each distance: one class, or a sequence of classes of class_length meters each, repeated
+def classes_along(distance, road_class, class_length=1000.0):
+    classes = list(road_class)                  # 'C', 'ACE' or ['A', 'C', 'E']
+    unknown = [c for c in classes if c not in ISO_8608_CLASSES]
+    if unknown:
+        raise ValueError(f"Unknown ISO 8608 road class: {unknown[0]}")
+    index = (np.asarray(distance) // class_length).astype(int) % len(classes)
+    return np.array(classes)[index]
+
+
+# ISO 8608 road profile: (distances, heights) on a grid of dx meters. With several classes,
+# one unit-PSD profile is scaled by sqrt(Gd(n0)) of the class at each point.
+def road_profile(length, road_class='C', dx=PROFILE_INTERVAL, seed=None, class_length=1000.0):
+    rng = np.random.default_rng(seed)
+    count = int(np.ceil(length / dx)) + 1
+    count += count % 2
+
+    wavenumbers = np.fft.rfftfreq(count, dx)
+    band = (wavenumbers >= WAVENUMBER_RANGE[0]) & (wavenumbers <= WAVENUMBER_RANGE[1])
+    psd = np.zeros(len(wavenumbers))
+    psd[band] = (wavenumbers[band] / REFERENCE_WAVENUMBER)**-2
+
+    # Amplitude sqrt(2 Gd dn) per component with a random phase, summed by the inverse FFT
+    amplitude = np.sqrt(2 * psd * (wavenumbers[1] - wavenumbers[0]))
+    phases = np.exp(2j * np.pi * rng.random(len(wavenumbers)))
+    heights = np.fft.irfft(amplitude * phases * count / 2, n=count)
+
+    distance = np.arange(count) * dx
+    gd_n0 = np.vectorize(ISO_8608_CLASSES.get)(classes_along(distance, road_class, class_length))
+    return distance, heights * np.sqrt(gd_n0)
+
+
+# Speed per sample (m/s): mean_speed with smooth variation of relative size `variation`
+def speed_profile(sample_count, sampling_rate, mean_speed=15.0, variation=0.2, seed=None):
+    rng = np.random.default_rng(seed)
+    period = 60 * sampling_rate                 # speed changes over about a minute
+    speed = mean_speed * (1 + variation * _smooth_noise(rng, sample_count, period))
+    return np.clip(speed, 0.3 * mean_speed, None)
+
+
+# Latitude/longitude along a smooth random route of the given cumulative distance
+def gps_track(distance, origin=(14.6, 120.98), seed=None):
+    rng = np.random.default_rng(seed)
+    step = np.diff(distance, prepend=distance[:1])
+
+    # Heading turns with a smooth random curvature, typically a 500 m radius
+    curvature = _smooth_noise(rng, len(distance), 2000) / 500
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(curvature * step)
+    north = np.cumsum(step * np.cos(heading))
+    east = np.cumsum(step * np.sin(heading))
+    latitude = origin[0] + np.degrees(north / EARTH_RADIUS)
+    longitude = origin[1] + np.degrees(east / (EARTH_RADIUS * np.cos(np.radians(origin[0]))))
+    return latitude, longitude
+
+
+# Second-order sections from road height to sprung-mass acceleration at the sampling rate
+def sprung_mass_sos(sampling_rate):
+    k1, k2, c, mu = GOLDEN_CAR['k1'], GOLDEN_CAR['k2'], GOLDEN_CAR['c'], GOLDEN_CAR['mu']
+    A = np.array([[0, 1, 0, 0],
+                  [-k2, -c, k2, c],
+                  [0, 0, 0, 1],
+                  [k2 / mu, c / mu, -(k1 + k2) / mu, -c / mu]])
+    B = np.array([[0], [0], [0], [k1 / mu]])
+    C = A[1:2]                                  # z_s'' is the second row of the state derivative
+    D = np.zeros((1, 1))
+    Ad, Bd, Cd, Dd, _ = signal.cont2discrete((A, B, C, D), 1 / sampling_rate, method='bilinear')
+    z, p, k = signal.ss2zpk(Ad, Bd, Cd, Dd)
+    return signal.zpk2sos(z, p, k)
+
+
+# Standard IRI (m/km) of the true profile for segments [start, start + segment_length)
+def ground_truth_iri(profile_x, profile_z, segment_length, total_distance, road_class='C', class_length=1000.0):
+    dx = profile_x[1] - profile_x[0]
+    slope = np.gradient(profile_z, dx)
+    base = int(round(BASE_LENGTH / dx))
+    if base > 1:
+        slope = np.convolve(slope, np.ones(base) / base, mode='same')
+
+    start = np.arange(0, total_distance - segment_length, segment_length)
+    iri = segment_iri(profile_x, rectified_slope(slope, dx), start, start + segment_length)
+    return pd.DataFrame({'distance_start': start, 'distance_end': start + segment_length, 'iri': iri,
+                         'road_class': classes_along(start + segment_length / 2, road_class, class_length)})
+
+
+# One synthetic run. Returns (run, truth): run is a dict of channel arrays in preprocess_data's
+# units (time in seconds from the start) plus 'start_time' (Unix seconds) and 'sampling_rate';
+# truth is the ground-truth IRI and road class per segment. road_class is one ISO 8608 class
+# or a sequence such as 'ACE', each covering class_length meters in turn.
+def synthesize_run(duration=600.0, sampling_rate=100.0, road_class='C', mean_speed=15.0,
+                   gps_rate=1.0, segment_length=100.0, seed=None, start_time=1754035200.0,
+                   class_length=1000.0):
+    classes_along([0.0], road_class)            # validates the classes
+
+    rng = np.random.default_rng(seed)
+    seeds = rng.integers(0, 2**32, size=4)
+    count = int(duration * sampling_rate) + 1
+    time = np.arange(count) / sampling_rate
+
+    # Vehicle motion
+    speed = speed_profile(count, sampling_rate, mean_speed, seed=seeds[0])
+    distance = cumulative_trapezoid(speed, time, initial=0)
+    latitude, longitude = gps_track(distance, seed=seeds[1])
+
+    # Road under the wheel, and the car's response to it
+    profile_x, profile_z = road_profile(distance[-1] + segment_length, road_class, seed=seeds[2],
+                                        class_length=class_length)
+    road_height = np.interp(distance, profile_x, profile_z)
+    sos = sprung_mass_sos(sampling_rate)
+    vertical = signal.sosfilt(sos, road_height - road_height[0])
+
+    noise = np.random.default_rng(seeds[3])
+    accel_noise = SENSOR_NOISE['accel'] * noise.standard_normal((3, count))
+    gyro_noise = SENSOR_NOISE['gyro'] * noise.standard_normal((3, count))
+
+    # GPS fixes every 1 / gps_rate seconds with position noise, held until the next fix
+    fix = (np.floor(time * gps_rate) / gps_rate * sampling_rate).round().astype(int)
+    gps_noise = SENSOR_NOISE['gps'] / EARTH_RADIUS * noise.standard_normal((2, count))
+    run = {
+        'time': time,
+        'ax': np.gradient(speed, time) + accel_noise[0],
+        'ay': accel_noise[1],
+        'az': vertical + accel_noise[2],
+        'wx': gyro_noise[0],
+        'wy': gyro_noise[1],
+        'wz': gyro_noise[2],
+        'latitude': (latitude + np.degrees(gps_noise[0]))[fix],
+        'longitude': (longitude + np.degrees(gps_noise[1]) / np.cos(np.radians(latitude)))[fix],
+        'speed': speed[fix],
+        'altitude': (10 + 5 * _smooth_noise(rng, count, 120 * sampling_rate))[fix],
+        'start_time': start_time,
+        'sampling_rate': sampling_rate
+    }
+
+    truth = ground_truth_iri(profile_x, profile_z, segment_length, distance[-1], road_class, class_length)
+    return run, truth
+
+
+# Writes a run as a Physics Toolbox-style CSV with ISO timestamps, chunk by chunk.
+# pyarrow's CSV writer is used when installed (about ten times faster than pandas).
+def write_csv(run, path, chunk_rows=500_000):
+    count = len(run['time'])
+    start = np.datetime64(int(round(run['start_time'] * 1e6)), 'us')
+    writer = None
+    if HAS_PYARROW:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        f = open(path, 'wb')
+        f.write((','.join(CSV_COLUMNS) + '\n').encode())      # unquoted header, as Physics Toolbox writes it
+    for first in range(0, max(count, 1), chunk_rows):
+        rows = slice(first, first + chunk_rows)
+        offsets = np.round(run['time'][rows] * 1e6).astype('timedelta64[us]')
+        chunk = pd.DataFrame({col: run[col][rows] for col in CSV_COLUMNS[1:]})
+        chunk.insert(0, 'time', np.datetime_as_string(start + offsets, unit='us'))
+
+        if HAS_PYARROW:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                options = pa_csv.WriteOptions(include_header=False, quoting_style='none')
+                writer = pa_csv.CSVWriter(f, table.schema, write_options=options)
+            writer.write_table(table)
+        else:
+            chunk.to_csv(path, mode='w' if first == 0 else 'a', header=first == 0, index=False,
+                         float_format='%.9g')
+    if HAS_PYARROW:
+        if writer is not None:
+            writer.close()
+        f.close()
+    return path
+
+
+# Writes a run in the binary run format (see utils/run_format.py)
+def write_binary(run, path, dtype=np.float32):
+    from utils.run_format import write_run
+    return write_run(path, {col: run[col] for col in CSV_COLUMNS}, run['start_time'],
+                     run['sampling_rate'], dtype)
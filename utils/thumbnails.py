@@ -0,0 +1,147 @@
+"""On-disk cache of downscaled pothole images for map popups and the sidebar viewer.
+
+Detection frames are full-resolution JPEGs of about 400 KB. A popup shows them
+250 pixels wide and the sidebar a few hundred, so both use thumbnails instead:
+the frame is decoded at reduced scale (``Image.draft``), resized to fit a
+square of the requested size and re-encoded as JPEG. Entries are keyed by the
+source path, its modification time and size and the thumbnail size and
+quality, so a changed frame gets a new thumbnail and a stale one is never
+served. Writes go through a temporary file and ``os.replace``, so several
+threads or sessions may generate the same thumbnail at once. Every hit
+touches the entry's modification time, so when the cache grows past
+``max_bytes`` the least recently used entries are removed.
+
+    cache = ThumbnailCache()
+    cache.pregenerate(image_paths, sizes=(POPUP_SIZE, SIDEBAR_SIZE))
+    img_base64 = cache.base64(image_path, POPUP_SIZE)
+"""
+import base64
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from PIL import Image, ImageOps
+
+DEFAULT_CACHE_DIR = os.environ.get('DAAN_THUMBNAIL_DIR',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'daan', 'thumbnails'))
+DEFAULT_MAX_BYTES = int(float(os.environ.get('DAAN_THUMBNAIL_MAX_MB', 512)) * 1024 * 1024)
+
+# Longest edge in pixels; popups are 250 px wide, the sidebar image about 300-600 px
+POPUP_SIZE = int(os.environ.get('DAAN_POPUP_THUMBNAIL_PX', 400))
+SIDEBAR_SIZE = int(os.environ.get('DAAN_SIDEBAR_THUMBNAIL_PX', 640))
+QUALITY = 80
+
+
+class ThumbnailCache:
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, quality=QUALITY):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Key from the source path and its mtime and size, plus every parameter that changes the thumbnail
+    def make_key(self, source, size):
+        stat = os.stat(source)
+        digest = hashlib.sha256(os.path.abspath(source).encode())
+        digest.update(f"{stat.st_mtime_ns}:{stat.st_size}:{size}:{self.quality}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    # Path of the thumbnail of `source` fitting in size x size pixels, generated if missing.
+    # Returns None if the source does not exist or cannot be decoded.
+    def path(self, source, size):
+        try:
+            path = self._path(self.make_key(source, size))
+        except OSError:
+            return None
+        try:
+            os.utime(path)                      # mark as recently used for evict()
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            pass
+
+        self.misses += 1
+        try:
+            with Image.open(source) as image:
+                image.draft('RGB', (size, size))       # JPEG: decode at 1/2, 1/4 or 1/8 scale directly
+                image = ImageOps.exif_transpose(image).convert('RGB')
+                image.thumbnail((size, size), Image.LANCZOS)
+                fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        image.save(f, 'JPEG', quality=self.quality, optimize=True)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None
+        return path
+
+    # Thumbnail JPEG bytes, or None (see path)
+    def bytes(self, source, size):
+        path = self.path(source, size)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    # Thumbnail as a base64 string for data: URIs, or None (see path)
+    def base64(self, source, size):
+        data = self.bytes(source, size)
+        return base64.b64encode(data).decode() if data is not None else None
+
+    # Generates the thumbnails of every source at every size on a thread pool (Pillow releases the GIL
+    # while decoding, resizing and encoding), then enforces the size limit. Returns (ready, failed) counts.
+    def pregenerate(self, sources, sizes=(POPUP_SIZE, SIDEBAR_SIZE), workers=None):
+        jobs = [(source, size) for source in sources for size in sizes]
+        workers = workers or min(8, (os.cpu_count() or 1) + 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(lambda job: self.path(*job), jobs))
+        self.evict()
+        failed = sum(path is None for path in paths)
+        return len(paths) - failed, failed
+
+    # Removes least recently used (written or hit) entries until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.jpg'):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.cache_dir, name))
+                   for name in os.listdir(self.cache_dir) if name.endswith('.jpg'))
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.jpg'):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+# Shared cache in the default directory, created on first use
+@lru_cache(maxsize=None)
+def default_cache():
+    return ThumbnailCache()
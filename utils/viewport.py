@@ -0,0 +1,220 @@
+"""Viewport-driven map layers: only what is in view, aggregated when zoomed out.
+
+``st_folium`` reports the map bounds and zoom after every pan or zoom.
+``ViewportLayers`` keeps a ``PointIndex`` for the IRI track, the vehicles and
+the potholes. Each index is sorted by longitude, so finding the points in a
+bounding box takes two binary searches plus a latitude mask over that
+longitude band. For a given view it builds one ``folium.FeatureGroup`` that
+holds only:
+
+- the features inside the bounds, widened by ``MARGIN`` of the view on each
+  side so that small pans do not show empty edges, or
+- below ``AGGREGATE_BELOW_ZOOM``, or when a layer has more than
+  ``MAX_FEATURES`` points in view, one circle per grid cell of about
+  ``CELL_PIXELS`` screen pixels, with the count (and mean IRI) of the points
+  it covers.
+
+Either way the layer is bounded by the screen size, not the data size, so the
+map payload stays about the same for a 1,000-point or a 1,000,000-point
+dataset (``python benchmarks/bench_map_layers.py``). streamlit_app.py passes
+the group as ``st_folium(..., feature_group_to_add=...)``, which swaps the
+layer in the browser without reloading the base map.
+"""
+import math
+
+import folium
+import numpy as np
+
+from utils.map_layers import (IRI_BREAKS, IRI_COLORS, IRI_QUALITIES, _rounded, add_iri_line, add_pothole_markers,
+                              add_vehicle_markers)
+
+AGGREGATE_BELOW_ZOOM = 14
+MAX_FEATURES = 1500
+MARGIN = 0.25
+CELL_PIXELS = 48
+TILE_SIZE = 256
+
+
+# (south, west, north, east) from the bounds returned by st_folium, or None before the map reported any
+def view_bounds(map_data):
+    try:
+        south_west = map_data['bounds']['_southWest']
+        north_east = map_data['bounds']['_northEast']
+        bounds = (float(south_west['lat']), float(south_west['lng']), float(north_east['lat']), float(north_east['lng']))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return bounds if all(np.isfinite(bounds)) else None
+
+
+# Degrees of longitude per screen pixel at a Web Mercator zoom level
+def degrees_per_pixel(zoom):
+    return 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+# Bounds of a width x height pixel map centred on (lat, lon), for the first run before st_folium reports any
+def approximate_bounds(lat, lon, zoom, width=1600, height=1000):
+    half_lon = degrees_per_pixel(zoom) * width / 2
+    half_lat = degrees_per_pixel(zoom) * height / 2 * math.cos(math.radians(lat))
+    return lat - half_lat, lon - half_lon, lat + half_lat, lon + half_lon
+
+
+# Bounds widened by `margin` of their size on every side
+def expand(bounds, margin=MARGIN):
+    south, west, north, east = bounds
+    dlat = (north - south) * margin
+    dlon = (east - west) * margin
+    return south - dlat, west - dlon, north + dlat, east + dlon
+
+
+class PointIndex:
+
+    def __init__(self, lat, lon):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon))
+        order = valid[np.argsort(lon[valid], kind='stable')]
+        self.positions = order              # original row positions, by longitude
+        self.lon = lon[order]
+        self.lat = lat[order]
+        self.all_lat = lat
+        self.all_lon = lon
+
+    def __len__(self):
+        return len(self.positions)
+
+    # Original positions (ascending) of the points inside (south, west, north, east)
+    def query(self, bounds):
+        south, west, north, east = bounds
+        band = slice(np.searchsorted(self.lon, west, side='left'), np.searchsorted(self.lon, east, side='right'))
+        inside = (self.lat[band] >= south) & (self.lat[band] <= north)
+        return np.sort(self.positions[band][inside])
+
+    # (lat, lon) arrays of the points at original positions
+    def coordinates(self, positions):
+        return self.all_lat[positions], self.all_lon[positions]
+
+
+# Points binned into square cells of `cell` degrees: (lat, lon, count, mean of values) per cell
+def grid_aggregate(lat, lon, cell, values=None):
+    rows = np.floor(lat / cell).astype(np.int64)
+    cols = np.floor(lon / cell).astype(np.int64)
+    keys = (rows - rows.min()) * (cols.max() - cols.min() + 1) + (cols - cols.min()) if len(rows) else rows
+    _, cell_of, count = np.unique(keys, return_inverse=True, return_counts=True)
+    mean_lat = np.bincount(cell_of, weights=lat) / count
+    mean_lon = np.bincount(cell_of, weights=lon) / count
+    mean_value = np.bincount(cell_of, weights=values) / count if values is not None else None
+    return mean_lat, mean_lon, count, mean_value
+
+
+# One GeoJson layer of circles, one per cell; a CircleMarker each would cost ~0.7 KB per cell
+def add_cell_layer(group, lat, lon, labels, colors, radii):
+    features = [
+        {
+            'type': 'Feature',
+            'id': i,
+            'geometry': {'type': 'Point', 'coordinates': [lon_i, lat_i]},
+            'properties': {'label': label, 'color': color, 'radius': radius}
+        }
+        for i, (lat_i, lon_i, label, color, radius) in enumerate(zip(_rounded(lat), _rounded(lon), labels, colors, radii))
+    ]
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        marker=folium.CircleMarker(fill=True, fill_opacity=0.6, weight=1),
+        style_function=_cell_style,
+        tooltip=folium.GeoJsonTooltip(fields=['label'], labels=False)
+    ).add_to(group)
+
+
+def _cell_style(feature):
+    properties = feature['properties']
+    return {'color': properties['color'], 'fillColor': properties['color'], 'radius': properties['radius']}
+
+
+def _cell_radius(count):
+    return np.round(5 + 3 * np.log2(count)).astype(int).tolist()
+
+
+class ViewportLayers:
+
+    # iri_track: (lats, lons, iri) arrays of the IRI profile points; vehicles and potholes: DataFrames
+    def __init__(self, iri_track=None, vehicle_df=None, pothole_df=None, images_base_path=None):
+        self.iri_track = tuple(np.asarray(values, dtype=float) for values in iri_track) if iri_track else None
+        self.vehicle_df = vehicle_df
+        # Popups show totals over the whole dataset, not over the part in view
+        self.vehicle_counts = vehicle_df['vehicle_type'].value_counts() if vehicle_df is not None else None
+        self.pothole_df = pothole_df
+        self.images_base_path = images_base_path
+        self.indexes = {}
+        if self.iri_track is not None:
+            self.indexes['iri'] = PointIndex(self.iri_track[0], self.iri_track[1])
+        if vehicle_df is not None:
+            self.indexes['vehicles'] = PointIndex(vehicle_df['latitude'], vehicle_df['longitude'])
+        if pothole_df is not None:
+            self.indexes['potholes'] = PointIndex(pothole_df['latitude'], pothole_df['longitude'])
+
+    # FeatureGroup for the view, and per layer the number of points in view and whether they were aggregated
+    def feature_group(self, bounds, zoom, pothole_page=0, page_size=10, max_features=MAX_FEATURES):
+        group = folium.FeatureGroup(name='Visible data')
+        bounds = expand(bounds)
+        cell = degrees_per_pixel(zoom) * CELL_PIXELS
+        summary = {}
+        for layer, index in self.indexes.items():
+            positions = index.query(bounds)
+            aggregate = zoom < AGGREGATE_BELOW_ZOOM or len(positions) > max_features
+            summary[layer] = {'in_view': len(positions), 'aggregated': aggregate}
+            if len(positions) == 0:
+                continue
+            if layer == 'iri':
+                self._add_iri(group, index, positions, cell if aggregate else None)
+            elif layer == 'vehicles':
+                self._add_detections(group, index, self.vehicle_df, positions, cell if aggregate else None,
+                                     'blue', 'vehicles',
+                                     lambda group, subset: add_vehicle_markers(group, subset,
+                                                                               type_counts=self.vehicle_counts))
+            else:
+                self._add_potholes(group, index, positions, cell if aggregate else None, pothole_page, page_size)
+        return group, summary
+
+    def _add_iri(self, group, index, positions, cell):
+        if cell is None:
+            # Points just outside the view too, so the line runs to the edge of the map
+            neighbours = np.unique(np.concatenate([positions - 1, positions, positions + 1]))
+            neighbours = neighbours[(neighbours >= 0) & (neighbours < len(self.iri_track[2]))]
+            lats, lons, iri = (values[neighbours] for values in self.iri_track)
+            add_iri_line(group, lats, lons, iri, index=neighbours)
+            return
+
+        lats, lons, iri = (values[positions] for values in self.iri_track)
+        valid = np.isfinite(iri)
+        if not valid.any():
+            return
+        cell_lat, cell_lon, count, mean_iri = grid_aggregate(lats[valid], lons[valid], cell, iri[valid])
+        quality = np.digitize(mean_iri, IRI_BREAKS, right=True)
+        labels = [f"IRI {value:.2f} ({IRI_QUALITIES[q]}), mean of {n} points"
+                  for value, q, n in zip(mean_iri, quality, count)]
+        add_cell_layer(group, cell_lat, cell_lon, labels, [IRI_COLORS[q] for q in quality], [6] * len(count))
+
+    @staticmethod
+    def _add_cells(group, lat, lon, cell, color, label):
+        cell_lat, cell_lon, count, _ = grid_aggregate(lat, lon, cell)
+        add_cell_layer(group, cell_lat, cell_lon, [f"{n} {label}" for n in count], [color] * len(count),
+                       _cell_radius(count))
+
+    def _add_detections(self, group, index, df, positions, cell, color, label, add_markers):
+        if cell is None:
+            add_markers(group, df.iloc[positions])
+        else:
+            self._add_cells(group, *index.coordinates(positions), cell, color, label)
+
+    # The current sidebar page keeps its image markers wherever the map is
+    def _add_potholes(self, group, index, positions, cell, page, page_size):
+        in_page = (positions >= page * page_size) & (positions < (page + 1) * page_size)
+        page_rows = np.arange(page * page_size, min((page + 1) * page_size, len(self.pothole_df)))
+        if len(page_rows) > 0:
+            add_pothole_markers(group, self.pothole_df.iloc[page_rows], self.images_base_path,
+                                page=0, page_size=len(page_rows))
+        others = positions[~in_page]
+        if len(others) > 0:
+            self._add_detections(group, index, self.pothole_df, others, cell, 'red', 'potholes',
+                                 lambda group, subset: add_pothole_markers(group, subset, self.images_base_path,
+                                                                           page_images=False))